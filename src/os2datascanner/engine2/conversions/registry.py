@@ -1,13 +1,39 @@
+from time import perf_counter
+from prometheus_client import Histogram
+
+from ..utilities.metrics import SECONDS_BUCKETS, BYTES_BUCKETS
 from .utilities.results import SingleResult
+from .utilities.cache import conversion_cache
+
+
+conversion_seconds = Histogram(
+        "os2datascanner_conversion_seconds",
+        "Time spent converting a single object",
+        ["output_type", "mime_type", "converter"], buckets=SECONDS_BUCKETS)
+conversion_input_bytes = Histogram(
+        "os2datascanner_conversion_input_bytes",
+        "Size of the objects given to converters",
+        ["output_type", "mime_type", "converter"], buckets=BYTES_BUCKETS)
 
 
 __converters = {}
+__cache_versions = {}
 
 
-def conversion(input_type, *mime_types):
+def conversion(input_type, *mime_types, cache_version=None):
     """Decorator: registers the decorated function as the converter of each of
-    the specified MIME types to the specified OutputType."""
+    the specified MIME types to the specified OutputType.
+
+    If a cache version is specified, then the results of the decorated
+    function depend only on the content of the Resource being converted and
+    can be stored in the conversion cache. (The version should be changed
+    whenever the function is changed in a way that affects its results.) If
+    the results also depend on settings or on the version of an external
+    tool, the cache version can instead be a function that takes no
+    arguments and returns a string identifying all of them."""
     def _conversion(f):
+        if cache_version is not None:
+            __cache_versions[f] = cache_version
         def _register_converter(input_type, mime_type):
             k = (input_type, mime_type)
             if k in __converters:
@@ -39,7 +65,25 @@ def convert(resource, input_type, mime_override=None) -> SingleResult:
         except KeyError:
             # Raise the original, more specific, exception
             raise e
-    value = converter(resource)
+    labels = (input_type.value, mime_type or "unknown", converter.__qualname__)
+    if hasattr(resource, "get_size"):
+        try:
+            conversion_input_bytes.labels(*labels).observe(
+                    resource.get_size().value)
+        except Exception:
+            pass
+
+    start = perf_counter()
+    cache_version = __cache_versions.get(converter)
+    if (cache_version is not None and conversion_cache.enabled
+            and hasattr(resource, "make_path")):
+        if callable(cache_version):
+            cache_version = cache_version()
+        value = conversion_cache.convert(
+                resource, input_type, converter, cache_version)
+    else:
+        value = converter(resource)
+    conversion_seconds.labels(*labels).observe(perf_counter() - start)
     if value is not None and not isinstance(value, SingleResult):
         value = SingleResult(None, input_type, value)
     return value
@@ -14,7 +14,7 @@ def _unwrap_node(n, top=False):
             n.unwrap()
 
 
-@conversion(OutputType.Text, "text/html")
+@conversion(OutputType.Text, "text/html", cache_version=1)
 def html_processor(r, **kwargs):
     with r.make_stream() as fp:
         soup = BeautifulSoup(fp, "lxml")
@@ -1,39 +1,225 @@
+from os import getpid
+from time import perf_counter
 from tempfile import NamedTemporaryFile
-from subprocess import run, PIPE, DEVNULL
+from threading import Lock
+import signal
+import multiprocessing
+from PIL import Image
+from prometheus_client import Counter, Summary
 
 from ... import settings as engine2_settings
 from ..types import OutputType
 from ..registry import conversion
 
 
+ocr_seconds = Summary(
+        "os2datascanner_ocr_seconds",
+        "Time spent recognising the text in a single image (including time"
+        " spent waiting for a free Tesseract engine)")
+ocr_skipped = Counter(
+        "os2datascanner_ocr_skipped",
+        "Images not passed to text recognition",
+        ["reason"])
+ocr_engine_restarts = Counter(
+        "os2datascanner_ocr_engine_restarts",
+        "Times that the Tesseract engines of a pipeline process were stopped"
+        " and started again because one of them stopped responding")
+
+
+# The Tesseract API instance of an engine process (or the exception raised
+# when trying to create it)
+_api = None
+_api_error = None
+
+
+def _start_engine(language):
+    global _api, _api_error
+    # Engine processes are stopped with SIGTERM, which the pipeline process
+    # they were forked from might be handling differently
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        # Only engine processes ever need the Tesseract API
+        import tesserocr
+        _api = tesserocr.PyTessBaseAPI(lang=language)
+    except Exception as ex:
+        # Report this for every image instead of letting the pool start a
+        # new engine process (which would fail in the same way) forever
+        _api_error = ex
+
+
+def _run_engine(path):
+    if _api is None:
+        raise _api_error
+    try:
+        _api.SetImageFile(path)
+    except RuntimeError:
+        # Leptonica couldn't read the image
+        return None
+    return _api.GetUTF8Text().strip()
+
+
+def _engine_version():
+    if _api is None:
+        raise _api_error
+    return _api.Version()
+
+
+class TesseractPool:
+    """A TesseractPool keeps a bounded number of engine processes running,
+    each of which holds an initialised instance of the Tesseract API, so
+    that Tesseract's language model is loaded once per engine rather than
+    once per image. (Tesseract already uses several cores for each image, so
+    running more engines than that just makes them compete with each other
+    and with the rest of the pipeline.)
+
+    Each engine is replaced after a fixed number of images. An image that
+    crashes an engine, or keeps it busy for longer than the subprocess
+    timeout, makes the pool stop all of its engines and start new ones."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pid = None
+        self._pool = None
+        self._version = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pid != getpid():
+                # A forked process can't use its parent's engines
+                self._pid = getpid()
+                self._pool = None
+            if self._pool is None:
+                config = engine2_settings.conversions["ocr"]
+                self._pool = multiprocessing.Pool(
+                        max(1, config["processes"]),
+                        initializer=_start_engine,
+                        initargs=(config["language"],),
+                        maxtasksperchild=config["max_images"] or None)
+            return self._pool
+
+    def _restart(self, pool):
+        ocr_engine_restarts.inc()
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.terminate()
+
+    def version(self):
+        """Returns the version of Tesseract used by this pool's engines."""
+        if self._version is None:
+            pool = self._get_pool()
+            try:
+                self._version = pool.apply_async(_engine_version).get(
+                        engine2_settings.subprocess["timeout"])
+            except multiprocessing.TimeoutError:
+                self._restart(pool)
+                raise
+        return self._version
+
+    def recognise(self, path):
+        """Returns the text found in the image at @path by one of this pool's
+        engines, or None if the image couldn't be read or recognising its
+        text took too long."""
+        pool = self._get_pool()
+        try:
+            return pool.apply_async(_run_engine, (path,)).get(
+                    engine2_settings.subprocess["timeout"])
+        except multiprocessing.TimeoutError:
+            # The engine has crashed (and the image has been lost) or is
+            # stuck, so start again from scratch
+            self._restart(pool)
+            ocr_skipped.labels("timeout").inc()
+            return None
+
+    def close(self):
+        """Stops this process's engines."""
+        with self._lock:
+            pool = self._pool if self._pid == getpid() else None
+            self._pool = None
+        if pool:
+            pool.terminate()
+
+
+_pool = TesseractPool()
+
+
 def tesseract(path):
-    result = run(
-            ["tesseract", path, "stdout"],
-            universal_newlines=True,
-            stdout=PIPE,
-            stderr=DEVNULL,
-            timeout=engine2_settings.subprocess["timeout"])
-    if result.returncode == 0:
-        return result.stdout.strip()
-    else:
+    return _pool.recognise(path)
+
+
+def _cache_version():
+    """Returns the cache version of image_processor, which depends on the
+    settings that affect its results and on the version of Tesseract."""
+    config = engine2_settings.conversions["ocr"]
+    return "3:{0}:{1}:{2}:{3}".format(
+            config["min_dimension"], config["max_dimension"],
+            config["language"], _pool.version())
+
+
+def _normalise(im):
+    """Returns a version of a PIL image suitable for text recognition, or
+    None if it's too small to contain any legible text. (The image may be
+    returned unchanged.)"""
+    config = engine2_settings.conversions["ocr"]
+    if min(im.size) < config["min_dimension"]:
+        ocr_skipped.labels("small").inc()
         return None
+    if max(im.size) > config["max_dimension"]:
+        # Tesseract works best at around 300 DPI; very large images are
+        # usually high-resolution scans that take much longer to process
+        # without producing better results
+        im = im.copy()
+        im.thumbnail(
+                (config["max_dimension"], config["max_dimension"]),
+                Image.LANCZOS)
+    if im.mode not in ("1", "L", "RGB", "RGBA"):
+        # Palette images, and some of the more exotic BMP and GIF layouts,
+        # are handled badly by Tesseract
+        im = im.convert("RGBA"
+                if im.mode.endswith("A") or "transparency" in im.info
+                else "RGB")
+    return im
 
 
-@conversion(OutputType.Text, "image/png", "image/jpeg")
-def image_processor(r):
-    with r.make_path() as p:
-        return tesseract(p)
+def _recognise(path):
+    """Returns the text found in the image at @path, or None if it couldn't be
+    read."""
+    try:
+        with Image.open(path) as original:
+            im = _normalise(original)
+            if im is None:
+                return ""
+            elif (im is original
+                    and original.format not in ("PNG", "JPEG")):
+                # Read the image now, while we can still catch decoding
+                # errors (and before the original is closed)
+                im = original.copy()
+            else:
+                im.load()
+    except (OSError, SyntaxError):
+        # PIL raises SyntaxError for some malformed files
+        ocr_skipped.labels("unreadable").inc()
+        return None
+
+    if im.format in ("PNG", "JPEG"):
+        # Tesseract can read the original file as it is
+        start = perf_counter()
+        text = tesseract(path)
+        ocr_seconds.observe(perf_counter() - start)
+    else:
+        with NamedTemporaryFile("wb", suffix=".png") as ntf:
+            im.save(ntf, "PNG")
+            ntf.flush()
+            start = perf_counter()
+            text = tesseract(ntf.name)
+            ocr_seconds.observe(perf_counter() - start)
+    return text
 
 
-# Some ostensibly-supported image formats are handled badly by tesseract, so
-# turn them into PNGs with ImageMagick's convert(1) command to make them more
-# palatable
-@conversion(OutputType.Text, "image/gif", "image/x-ms-bmp")
-def intermediate_image_processor(r):
+@conversion(OutputType.Text,
+        "image/png", "image/jpeg", "image/gif", "image/x-ms-bmp",
+        cache_version=_cache_version)
+def image_processor(r):
     with r.make_path() as p:
-        with NamedTemporaryFile("rb", suffix=".png") as ntf:
-            result = run(["convert", p, "png:{0}".format(ntf.name)])
-            if result.returncode == 0:
-                return tesseract(ntf.name)
-            else:
-                return None
+        return _recognise(p)
@@ -0,0 +1,250 @@
+from os import listdir, makedirs, replace, scandir, unlink, utime
+from sys import stderr
+from time import monotonic
+from shutil import rmtree
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+import os.path
+import json
+import tarfile
+
+from prometheus_client import Counter
+
+from ... import settings as engine2_settings
+from .results import SingleResult
+
+
+cache_hits = Counter(
+        "os2datascanner_conversion_cache_hits",
+        "Conversions answered by the conversion cache",
+        ["output_type"])
+cache_misses = Counter(
+        "os2datascanner_conversion_cache_misses",
+        "Conversions not answered by the conversion cache",
+        ["output_type"])
+cache_bytes_saved = Counter(
+        "os2datascanner_conversion_cache_bytes_saved",
+        "Bytes of input that did not need to be converted thanks to the"
+        " conversion cache",
+        ["output_type"])
+
+
+class ConversionCache:
+    """A ConversionCache is an on-disk store of the results of conversion
+    functions, keyed by a digest of their input, the OutputType being
+    produced, and the identity and version of the conversion function. It can
+    also store the directories of files produced by the external tools that
+    derived sources use to take documents apart.
+
+    Results are stored as small JSON files (or, for directories, as tar
+    files) in a directory that can safely be shared between processes. When
+    the total size of the cache exceeds its limit, the least recently used
+    results are deleted."""
+
+    CHUNK_SIZE = 1024 * 1024
+    # The longest time for which a process should trust its own estimate of
+    # the size of the cache directory (in seconds). Other processes sharing
+    # the directory will have added to it in the meantime
+    RECOUNT_INTERVAL = 60
+
+    def __init__(self, path, max_size):
+        self._path = path
+        self._max_size = max_size
+        # An estimate of the size of the cache directory, computed (and
+        # corrected) by _evict and updated by _account, and the time at which
+        # it was last computed
+        self._size = None
+        self._counted = None
+
+    @property
+    def enabled(self):
+        return bool(self._path)
+
+    @staticmethod
+    def hash_file(path):
+        """Returns a (hexadecimal digest, size) pair for the content of the
+        file at @path."""
+        h = sha256()
+        size = 0
+        with open(path, "rb") as fp:
+            chunk = fp.read(ConversionCache.CHUNK_SIZE)
+            while chunk:
+                h.update(chunk)
+                size += len(chunk)
+                chunk = fp.read(ConversionCache.CHUNK_SIZE)
+        return h.hexdigest(), size
+
+    @staticmethod
+    def make_key(content_digest, output_type, converter, version):
+        return sha256("{0}\0{1}\0{2}.{3}\0{4}".format(
+                content_digest, output_type.value,
+                converter.__module__, converter.__qualname__,
+                version).encode()).hexdigest()
+
+    def digest(self, path):
+        """Returns the digest of the content of the file at @path, or None if
+        this cache is disabled."""
+        return self.hash_file(path)[0] if self.enabled else None
+
+    def _path_for(self, key, suffix=".json"):
+        return os.path.join(self._path, key[:2], key + suffix)
+
+    def _load(self, key):
+        path = self._path_for(key)
+        try:
+            with open(path, "rt") as fp:
+                obj = json.load(fp)
+            # Mark this entry as recently used
+            utime(path)
+            return obj
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, obj):
+        path = self._path_for(key)
+        makedirs(os.path.dirname(path), exist_ok=True)
+        # Write the result to a temporary file and then move it into place,
+        # so that other processes never see a partial entry
+        with NamedTemporaryFile("wt", dir=os.path.dirname(path),
+                suffix=".tmp", delete=False) as fp:
+            json.dump(obj, fp)
+        replace(fp.name, path)
+        self._account(path)
+
+    def _store_directory(self, key, directory):
+        path = self._path_for(key, ".tar")
+        makedirs(os.path.dirname(path), exist_ok=True)
+        with NamedTemporaryFile("wb", dir=os.path.dirname(path),
+                suffix=".tmp", delete=False) as fp:
+            with tarfile.open(fileobj=fp, mode="w") as tf:
+                for name in sorted(listdir(directory)):
+                    tf.add(os.path.join(directory, name), name)
+        replace(fp.name, path)
+        self._account(path)
+
+    def _account(self, path):
+        """Adds a newly stored entry to this cache's estimate of its size,
+        evicting old entries if necessary."""
+        if (self._size is None
+                or monotonic() - self._counted > self.RECOUNT_INTERVAL):
+            self._evict()
+        else:
+            self._size += os.path.getsize(path)
+            if self._size > self._max_size:
+                self._evict()
+
+    def _evict(self):
+        """Deletes the least recently used entries from the cache until its
+        size is less than 90% of the maximum."""
+        entries = []
+        with scandir(self._path) as directories:
+            for directory in directories:
+                if not directory.is_dir():
+                    continue
+                with scandir(directory.path) as files:
+                    for entry in files:
+                        try:
+                            st = entry.stat()
+                            entries.append(
+                                    (st.st_mtime, st.st_size, entry.path))
+                        except OSError:
+                            # Another process has just deleted this entry
+                            pass
+        total = sum(size for _, size, _ in entries)
+        if total > self._max_size:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self._max_size * 0.9:
+                    break
+                try:
+                    unlink(path)
+                except OSError:
+                    pass
+                total -= size
+        self._size = total
+        self._counted = monotonic()
+
+    def convert(self, resource, output_type, converter, version):
+        """Returns the cached result of calling @converter on @resource,
+        calling @converter and caching its result if necessary.
+
+        The content of @resource is hashed through its make_path method, and
+        that path is kept open while the converter runs, so a converter that
+        also asks for it (directly or through a spooled copy) doesn't fetch
+        the content again."""
+        with resource.make_path() as path:
+            digest, size = self.hash_file(path)
+            key = self.make_key(digest, output_type, converter, version)
+
+            obj = self._load(key)
+            if obj is not None and obj.get("value") is not None:
+                cache_hits.labels(output_type.value).inc()
+                cache_bytes_saved.labels(output_type.value).inc(size)
+                return output_type.decode_json_object(obj["value"])
+            cache_misses.labels(output_type.value).inc()
+
+            value = converter(resource)
+        # Conversion functions can return either raw values or SingleResults
+        raw_value = value.value if isinstance(value, SingleResult) else value
+        if raw_value is None:
+            # The conversion failed, perhaps only temporarily (if an external
+            # tool timed out, for example); don't remember that
+            return value
+        try:
+            self._store(key, {
+                "value": output_type.encode_json_object(raw_value)
+            })
+        except OSError as ex:
+            print("ConversionCache: couldn't store result: {0}".format(ex),
+                    file=stderr)
+        return value
+
+    def extract(self, digest, name, version, producer, outputdir):
+        """Fills the empty directory @outputdir with the files produced by the
+        external tool wrapper @producer, which is called with @outputdir as
+        its only argument. If this cache has already stored the output of
+        version @version of the producer called @name for content with the
+        digest @digest, then a copy of that output is used instead.
+
+        If @digest is None (or this cache is disabled), then the producer is
+        always called. Nothing is stored if the producer raises an
+        exception."""
+        if digest is None or not self.enabled:
+            producer(outputdir)
+            return
+        key = sha256("{0}\0{1}\0{2}".format(
+                digest, name, version).encode()).hexdigest()
+        path = self._path_for(key, ".tar")
+        try:
+            with tarfile.open(path, "r") as tf:
+                tf.extractall(outputdir)
+            utime(path)
+            cache_hits.labels(name).inc()
+            return
+        except FileNotFoundError:
+            pass
+        except (OSError, tarfile.TarError):
+            # Throw away whatever was extracted from this broken entry
+            for entry in listdir(outputdir):
+                entry = os.path.join(outputdir, entry)
+                if os.path.isdir(entry):
+                    rmtree(entry, ignore_errors=True)
+                else:
+                    unlink(entry)
+        cache_misses.labels(name).inc()
+
+        producer(outputdir)
+        try:
+            self._store_directory(key, outputdir)
+        except OSError as ex:
+            print("ConversionCache: couldn't store result: {0}".format(ex),
+                    file=stderr)
+
+    @classmethod
+    def from_settings(cls):
+        config = engine2_settings.conversions["cache"]
+        return cls(config["path"], config["max_size"])
+
+
+conversion_cache = ConversionCache.from_settings()
+"""The ConversionCache configured in the engine settings."""
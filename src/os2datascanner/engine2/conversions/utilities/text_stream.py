@@ -0,0 +1,115 @@
+import codecs
+
+from ... import settings as engine2_settings
+
+
+class TextStream:
+    """A TextStream is a text representation of a FileResource that is
+    decoded a bounded window at a time instead of being read into memory all
+    at once.
+
+    TextStreams can't be included in pipeline messages, so they must be
+    consumed by the stage that creates them."""
+
+    def __init__(self, resource, *,
+            window=None, overlap=None, encoding="utf-8"):
+        config = engine2_settings.conversions["text_stream"]
+        self._resource = resource
+        self._window = window or config["window"]
+        self._overlap = overlap or config["overlap"]
+        self._encoding = encoding
+        if self._window <= 2 * self._overlap:
+            raise ValueError(
+                    "TextStream window must be more than twice the overlap")
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def overlap(self):
+        return self._overlap
+
+    @classmethod
+    def from_resource(cls, resource):
+        """Returns a TextStream for the given FileResource if it's a plain
+        text file big enough to be worth streaming, or None otherwise."""
+        threshold = engine2_settings.conversions["text_stream"]["threshold"]
+        if not threshold or resource.compute_type() != "text/plain":
+            return None
+        size = resource.get_size()
+        if size is None or size.value <= threshold:
+            return None
+        return cls(resource)
+
+    def chunks(self):
+        """Yields a sequence of (offset, text) pairs, where each text is at
+        most the window size in length and (apart from the first) begins with
+        the last overlap characters of the one before it. The last pair
+        always contains the end of the text.
+
+        Raises UnicodeDecodeError if the resource's content is not valid
+        text."""
+        decoder = codecs.getincrementaldecoder(self._encoding)()
+        step = self._window - self._overlap
+        offset = 0
+        text = ""
+        with self._resource.make_stream() as fp:
+            while True:
+                raw = fp.read(self._window)
+                text += decoder.decode(raw, final=not raw)
+                while len(text) >= self._window:
+                    yield offset, text[:self._window]
+                    text = text[step:]
+                    offset += step
+                if not raw:
+                    break
+        yield offset, text
+
+    def finditer(self, expression):
+        """Yields a sequence of (offset, text, matches) tuples, where each
+        text is a chunk of this TextStream and each matches is a list of
+        re.Match objects found in it by the compiled regular expression
+        @expression.
+
+        Taken together, the matches are the same as those that
+        expression.finditer would have found in the whole text, provided that
+        no match (including the context that it examines) is longer than half
+        of the overlap. Each match is reported exactly once, and its
+        positions are relative to the start of its chunk."""
+        for offset, text, (matches,) in self.finditer_all([expression]):
+            yield offset, text, matches
+
+    def finditer_all(self, expressions):
+        """As finditer(), but searches for several compiled regular
+        expressions in a single pass over the text, yielding (offset, text,
+        matches) tuples where matches is a list with one list of re.Match
+        objects for each of the @expressions."""
+        half = self._overlap // 2
+        # A match belongs to a chunk if it starts in that chunk, but not in
+        # the last half of its overlap with the next one (which is where the
+        # next chunk's responsibility begins)
+        resume = [0] * len(expressions)
+        chunks = self.chunks()
+        current = next(chunks)
+        while current:
+            following = next(chunks, None)
+            offset, text = current
+
+            limit = len(text) - half if following else len(text) + 1
+            all_matches = []
+            for k, expression in enumerate(expressions):
+                start = max(resume[k] - offset,
+                        self._overlap - half if offset else 0)
+                matches = []
+                for m in expression.finditer(text, start):
+                    if m.start() >= limit:
+                        break
+                    matches.append(m)
+                    # Like re.finditer, continue searching from the end of
+                    # this match (or just after it, if it was empty)
+                    resume[k] = offset + max(m.end(), m.start() + 1)
+                all_matches.append(matches)
+            yield offset, text, all_matches
+
+            current = following
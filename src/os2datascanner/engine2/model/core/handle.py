@@ -3,12 +3,12 @@ from abc import abstractmethod
 from mimetypes import guess_type
 
 from ...utilities.json import JSONSerialisable
-from ...utilities.equality import TypePropertyEquality
+from ...utilities.equality import ImmutableTypePropertyEquality
 from .errors import UnknownSchemeError, DeserialisationError
 from .source import Source
 
 
-class Handle(TypePropertyEquality, JSONSerialisable):
+class Handle(ImmutableTypePropertyEquality, JSONSerialisable):
     """A Handle is a reference to a leaf node in a hierarchy maintained by a
     Source. Handles can be followed to give a Resource, a concrete object.
 
@@ -19,7 +19,12 @@ class Handle(TypePropertyEquality, JSONSerialisable):
     copy of an existing one).
 
     Handles are serialisable and persistent, and two different Handles with the
-    same type and properties compare equal."""
+    same type and properties compare equal. Handles are also immutable: the
+    properties used to compare them must not change after construction.
+
+    (Subclasses that define a __slots__ field, naming any properties they add,
+    will be smaller and faster to work with than those that don't.)"""
+    __slots__ = ("_source", "_relpath",)
 
     @property
     @abstractmethod
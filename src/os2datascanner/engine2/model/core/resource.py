@@ -1,11 +1,74 @@
 from abc import ABC, abstractmethod
 import magic
 from datetime import datetime
+from time import monotonic
+from threading import Lock
+from collections import OrderedDict
 
+from prometheus_client import Counter
+
+from ... import settings as engine2_settings
 from ...conversions.types import OutputType
 from ...conversions.utilities.results import SingleResult, MultipleResults
 
 
+type_cache_hits = Counter(
+        "os2datascanner_type_cache_hits",
+        "Type computations answered without examining an object's content",
+        ["type_label"])
+type_cache_misses = Counter(
+        "os2datascanner_type_cache_misses",
+        "Type computations that had to examine an object's content",
+        ["type_label"])
+
+
+class TypeCache:
+    """A TypeCache remembers the computed types of the most recently examined
+    objects for a short time, so that every Resource for an object in a given
+    process can share a single type computation.
+
+    Entries are keyed by Handle alone (asking a Resource for its last
+    modification date can be much more expensive than computing its type),
+    so they expire quickly enough that a later scan of a changed object won't
+    see an outdated type -- but an object that changes while it's passing
+    through the pipeline can still be given the type of its old content, so
+    TypeCaches are disabled unless they're given a size."""
+
+    def __init__(self, size=None, expiry=None):
+        config = engine2_settings.model["type_cache"]
+        self.size = size if size is not None else config["size"]
+        self.expiry = expiry if expiry is not None else config["expiry"]
+        self._lock = Lock()
+        # handle -> (expiry time, MIME type)
+        self._cache = OrderedDict()
+
+    def get(self, handle):
+        if self.size <= 0:
+            return None
+        with self._lock:
+            expires, mime = self._cache.get(handle, (None, None))
+            if mime is None:
+                return None
+            elif expires < monotonic():
+                del self._cache[handle]
+                return None
+            self._cache.move_to_end(handle)
+            return mime
+
+    def put(self, handle, mime):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._cache[handle] = (monotonic() + self.expiry, mime)
+            self._cache.move_to_end(handle)
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+
+
+type_cache = TypeCache()
+"""The TypeCache shared by every FileResource in this process."""
+
+
 class Resource(ABC):
     """A Resource is a concrete embodiment of an object: it's the thing a
     Handle points to. If you have a Resource, then you have some way of getting
@@ -79,6 +142,7 @@ class FileResource(TimestampedResource):
     def __init__(self, handle, sm):
         super().__init__(handle, sm)
         self._lm_timestamp = None
+        self._type = None
 
     @abstractmethod
     def get_size(self):
@@ -100,10 +164,35 @@ class FileResource(TimestampedResource):
         Python stream through which the content of this FileResource can be
         accessed until the context is exited."""
 
+    def set_computed_type(self, mime):
+        """Records that the type of this file is already known (because, for
+        example, an earlier pipeline stage computed it), so that compute_type
+        need not examine its content. (This has no effect on subclasses that
+        override compute_type.)"""
+        self._type = mime
+
     def compute_type(self):
         """Guesses the type of this file, possibly examining its content in the
         process. By default, this is computed by giving libmagic the first 512
-        bytes of the file."""
+        bytes of the file.
+
+        The result is remembered by this FileResource and by the process's
+        TypeCache, so later calls for the same object are cheap."""
+        type_label = self.handle.type_label
+        if self._type is not None:
+            type_cache_hits.labels(type_label).inc()
+            return self._type
+
+        self._type = type_cache.get(self.handle)
+        if self._type is not None:
+            type_cache_hits.labels(type_label).inc()
+        else:
+            type_cache_misses.labels(type_label).inc()
+            self._type = self._compute_type()
+            type_cache.put(self.handle, self._type)
+        return self._type
+
+    def _compute_type(self):
         guessed = self.handle.guess_type()
         with self.make_stream() as s:
             computed = magic.from_buffer(s.read(512), True)
@@ -1,11 +1,11 @@
 from abc import abstractmethod
 
 from ...utilities.json import JSONSerialisable
-from ...utilities.equality import TypePropertyEquality
+from ...utilities.equality import ImmutableTypePropertyEquality
 from .errors import UnknownSchemeError, DeserialisationError
 
 
-class Source(TypePropertyEquality, JSONSerialisable):
+class Source(ImmutableTypePropertyEquality, JSONSerialisable):
     """A Source represents the root of a hierarchy to be explored. It
     constructs Handles, which represent the position of an object in the
     hierarchy.
@@ -17,7 +17,9 @@ class Source(TypePropertyEquality, JSONSerialisable):
     Sources are serialisable and persistent, and two different Source objects
     with the same type and properties compare equal. (One useful consequence of
     this is that SourceManager will collapse several equal Sources together,
-    only opening one of them.)"""
+    only opening one of them.) Sources are also immutable: the properties used
+    to compare them must not change after construction."""
+    __slots__ = ()
 
     @property
     @abstractmethod
@@ -56,6 +58,26 @@ class Source(TypePropertyEquality, JSONSerialisable):
         It is not necessarily the case that the value of the source property on
         a Handle yielded by this method will be this Source."""
 
+    def changed_handles(self, sm, index):
+        """Yields a (Handle, deleted) pair for every leaf node in this
+        Source's hierarchy that has been created, changed or deleted since the
+        ExplorationIndex @index was last updated, and updates it.
+
+        The default implementation ignores the index and treats every Handle
+        yielded by the handles method as changed; Sources that represent
+        directory hierarchies should override it."""
+        for handle in self.handles(sm):
+            yield handle, False
+
+    def prefetch(self, sm, handles):
+        """Gives this Source the chance to retrieve the content of several of
+        its Handles at once (for example, with a single request to a remote
+        server), in anticipation of their Resources being used in the near
+        future.
+
+        The default implementation does nothing; Sources whose objects are
+        expensive to retrieve one at a time can override it."""
+
     __url_handlers = {}
     @staticmethod
     def url_handler(*schemes):
@@ -6,6 +6,7 @@ class DerivedSource(Source):
     It provides sensible default implementations of Source.handle,
     Source.censor, and Source.to_json_object, and automatically registers the
     constructor of every subclass as a JSON object decoder for Sources."""
+    __slots__ = ("_handle",)
 
     def __init__(self, handle):
         self._handle = handle
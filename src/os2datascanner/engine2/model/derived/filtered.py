@@ -15,6 +15,8 @@ from .derived import DerivedSource
 
 
 class FilteredSource(DerivedSource):
+    __slots__ = ()
+
     def __init__(self, handle):
         super().__init__(handle)
 
@@ -35,6 +37,7 @@ class FilteredSource(DerivedSource):
 @Source.mime_handler("application/gzip")
 class GzipSource(FilteredSource):
     type_label = "filtered-gzip"
+    __slots__ = ()
 
     @classmethod
     def _decompress(cls, stream):
@@ -44,6 +47,7 @@ class GzipSource(FilteredSource):
 @Source.mime_handler("application/x-bzip2")
 class BZ2Source(FilteredSource):
     type_label = "filtered-bz2"
+    __slots__ = ()
 
     @classmethod
     def _decompress(cls, stream):
@@ -53,6 +57,7 @@ class BZ2Source(FilteredSource):
 @Source.mime_handler("application/x-xz")
 class LZMASource(FilteredSource):
     type_label = "filtered-lzma"
+    __slots__ = ()
 
     @classmethod
     def _decompress(cls, stream):
@@ -111,6 +116,7 @@ class FilteredResource(FileResource):
 class FilteredHandle(Handle):
     type_label = "filtered"
     resource_type = FilteredResource
+    __slots__ = ()
 
     @property
     def presentation(self):
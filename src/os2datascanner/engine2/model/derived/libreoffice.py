@@ -1,26 +1,212 @@
-from os import unlink, listdir, scandir
+from os import getpid, killpg, listdir, scandir, unlink
+import json
 import magic
+import atexit
+import signal
+import select
+import os.path
+from time import monotonic, perf_counter
+from shutil import rmtree
 from tempfile import TemporaryDirectory
+from threading import Lock
 from contextlib import closing
-from subprocess import run, PIPE
+from subprocess import Popen, PIPE, DEVNULL
 
 from ... import settings as engine2_settings
+from ...conversions.utilities.cache import conversion_cache
+from ...utilities.tools import tool_seconds
 from ..core import Handle, Source, Resource, SourceManager
 from ..file import FilesystemResource
+from ..utilities.orphans import make_process_directory, remove_orphans
 from .derived import DerivedSource
 
 
-def libreoffice(*args):
-    """Invokes LibreOffice with a fresh settings directory (which will be
-    deleted as soon as the program finishes) and returns a CompletedProcess
-    with both stdout and stderr captured."""
-    with TemporaryDirectory() as settings:
-        return run(
-                ["libreoffice",
-                        "-env:UserInstallation=file://{0}".format(settings),
-                        *args], stdout=PIPE, stderr=PIPE,
-                        timeout=engine2_settings.subprocess["timeout"],
-                        check=True)
+class LibreOfficeError(Exception):
+    """Raised when a LibreOffice instance fails to convert a document, stops
+    responding, or can't be started."""
+
+
+class _Instance:
+    """A long-lived LibreOffice process, driven over UNO by a helper process
+    (see libreoffice_helper.py) that runs with its own settings directory."""
+
+    def __init__(self, command, prefix):
+        self.conversions = 0
+        self._profile = make_process_directory(prefix)
+        try:
+            # The helper gets its own session, so that it and LibreOffice can
+            # be killed together
+            self._process = Popen([*command, self._profile],
+                    stdin=PIPE, stdout=PIPE, stderr=DEVNULL,
+                    universal_newlines=True, start_new_session=True)
+        except OSError:
+            rmtree(self._profile, ignore_errors=True)
+            raise
+        # The helper sends an empty reply once LibreOffice has started
+        try:
+            self._receive()
+        except LibreOfficeError:
+            self.kill()
+            raise
+
+    def _receive(self):
+        timeout = engine2_settings.subprocess["timeout"]
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.kill()
+                raise LibreOfficeError("timed out", timeout)
+            readable, _, _ = select.select(
+                    [self._process.stdout], [], [], remaining)
+            if readable:
+                break
+        line = self._process.stdout.readline()
+        if not line:
+            self.kill()
+            raise LibreOfficeError(
+                    "helper stopped", self._process.wait())
+        reply = json.loads(line)
+        if reply["error"]:
+            raise LibreOfficeError(reply["error"])
+
+    def convert(self, **request):
+        self.conversions += 1
+        try:
+            self._process.stdin.write(json.dumps(request) + "\n")
+            self._process.stdin.flush()
+        except OSError as ex:
+            self.kill()
+            raise LibreOfficeError("helper stopped") from ex
+        self._receive()
+
+    def close(self):
+        """Asks LibreOffice to stop, and kills it if it doesn't."""
+        try:
+            self._process.stdin.close()
+            self._process.wait(10)
+        except Exception:
+            pass
+        self.kill()
+
+    def kill(self):
+        try:
+            killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process.wait()
+        self._process.stdout.close()
+        rmtree(self._profile, ignore_errors=True)
+
+
+class LibreOfficePool:
+    """A LibreOfficePool keeps headless LibreOffice instances running between
+    conversions, so that each document doesn't have to pay for starting
+    LibreOffice from scratch.
+
+    Each instance converts one document at a time. An instance is stopped
+    and replaced after a fixed number of conversions, or as soon as a
+    conversion that used it fails or times out (in case LibreOffice crashed
+    or was left in a bad state). The pool keeps at most a fixed number of
+    idle instances; any others are stopped when they finish their work."""
+
+    PREFIX = "os2ds-libreoffice-"
+
+    def __init__(self, command=None, *,
+            max_conversions=None, max_instances=None):
+        self._command = command
+        self._max_conversions = max_conversions
+        self._max_instances = max_instances
+        self._lock = Lock()
+        self._pid = None
+        self._idle = []
+
+    @property
+    def command(self):
+        if self._command:
+            return self._command
+        config = engine2_settings.model["libreoffice"]
+        return [config["python"],
+                os.path.join(os.path.dirname(__file__),
+                        "libreoffice_helper.py"),
+                config["soffice"]]
+
+    @property
+    def max_conversions(self):
+        return (self._max_conversions
+                or engine2_settings.model["libreoffice"]["max_conversions"])
+
+    @property
+    def max_instances(self):
+        return (self._max_instances
+                or engine2_settings.model["libreoffice"]["instances"])
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != getpid():
+                # This is a new process (or a fork of the process that last
+                # used this pool, in which case the parent still owns the
+                # existing instances)
+                self._pid = getpid()
+                self._idle = []
+                remove_orphans(self.PREFIX)
+                atexit.register(self.close)
+            if self._idle:
+                return self._idle.pop()
+        return _Instance(self.command, self.PREFIX)
+
+    def _release(self, instance):
+        if instance.conversions < self.max_conversions:
+            with self._lock:
+                if (self._pid == getpid()
+                        and len(self._idle) < self.max_instances):
+                    self._idle.append(instance)
+                    return
+        instance.close()
+
+    def convert(self, path, infilter, convert_to, outdir):
+        """Converts the document at @path, which should be readable by the
+        LibreOffice import filter @infilter, and puts the result in the
+        directory @outdir. @convert_to has the same form as the argument of
+        LibreOffice's --convert-to command-line option.
+
+        Raises a LibreOfficeError if the conversion fails."""
+        start = perf_counter()
+        instance = self._acquire()
+        try:
+            instance.convert(path=path, infilter=infilter,
+                    convert_to=convert_to, outdir=outdir)
+        except LibreOfficeError:
+            instance.kill()
+            raise
+        else:
+            self._release(instance)
+        finally:
+            tool_seconds.labels("libreoffice").observe(
+                    perf_counter() - start)
+
+    def close(self):
+        """Stops all of the idle instances owned by this process."""
+        with self._lock:
+            if self._pid == getpid():
+                idle, self._idle = self._idle, []
+            else:
+                idle = []
+        for instance in idle:
+            instance.close()
+
+
+_pool = LibreOfficePool()
+
+
+def libreoffice(path, infilter, convert_to, outdir):
+    """Converts a document with an instance from the shared LibreOfficePool.
+    (See LibreOfficePool.convert.)"""
+    _pool.convert(path, infilter, convert_to, outdir)
+
+
+# The version of the output of LibreOfficeSource, for the conversion cache
+_CACHE_VERSION = 2
 
 
 # CSV handling requres a really complicated filter name which includes some
@@ -58,10 +244,8 @@ def _replace_large_html(
         for entry in file_iterator:
             if entry.name.endswith(".html"):
                 if entry.stat().st_size >= size_threshold:
-                    libreoffice(
-                            "--infilter={0}".format(input_filter),
-                            "--convert-to", output_filter,
-                            "--outdir", output_directory, input_file)
+                    libreoffice(input_file, input_filter,
+                            output_filter, output_directory)
                     unlink(entry.path)
                 break
 
@@ -72,6 +256,7 @@ def _replace_large_html(
         *_actually_supported_types.keys())
 class LibreOfficeSource(DerivedSource):
     type_label = "lo"
+    __slots__ = ()
 
     def _generate_state(self, sm):
         with self.handle.follow(sm).make_path() as p:
@@ -91,18 +276,26 @@ class LibreOfficeSource(DerivedSource):
                 mime_guess = self.handle.guess_type()
                 if mime_guess.startswith(
                         "application/vnd.openxmlformats-officedocument."):
-                    filter_name = _actually_supported_types.get(mime_guess)
+                    filter_name, backup_filter = _actually_supported_types.get(
+                            mime_guess, (None, None))
             if filter_name is None:
                 return
 
-            with TemporaryDirectory() as outputdir:
-                libreoffice(
-                        "--infilter={0}".format(filter_name),
-                        "--convert-to", "html",
-                        "--outdir", outputdir, p)
+            def _convert(outputdir):
+                libreoffice(p, filter_name, "html", outputdir)
                 if backup_filter:
                     _replace_large_html(
                             filter_name, p, backup_filter, outputdir)
+
+            with TemporaryDirectory() as outputdir:
+                # The output depends on the filters and on the threshold at
+                # which HTML output is replaced, so they're part of the name
+                conversion_cache.extract(conversion_cache.digest(p),
+                        "libreoffice:{0}:{1}:{2}".format(
+                                filter_name, backup_filter,
+                                engine2_settings.model["libreoffice"][
+                                        "size_threshold"]),
+                        _CACHE_VERSION, _convert, outputdir)
                 yield outputdir
 
     def handles(self, sm):
@@ -114,6 +307,7 @@ class LibreOfficeSource(DerivedSource):
 class LibreOfficeObjectHandle(Handle):
     type_label = "lo-object"
     resource_type = FilesystemResource
+    __slots__ = ()
 
     # All LibreOfficeObjectHandles point at generated temporary files
     is_synthetic = True
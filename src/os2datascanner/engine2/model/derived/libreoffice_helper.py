@@ -0,0 +1,151 @@
+"""Converts documents with a long-lived, headless LibreOffice instance.
+
+LibreOfficePool runs this script with a Python interpreter that can import
+LibreOffice's UNO bindings (normally the system's python3, with the
+python3-uno package installed). The engine's own interpreter usually can't,
+so this script must not import anything from os2datascanner.
+
+Usage: libreoffice_helper.py SOFFICE PROFILE
+
+The helper starts LibreOffice (the SOFFICE executable) with the settings
+directory PROFILE, listening for UNO connections on a private pipe, and
+writes an empty reply once it has connected. It then reads conversion
+requests from its standard input and answers each of them on its standard
+output, one JSON object per line:
+
+    {"path": "/tmp/a.doc", "infilter": "MS Word 97",
+            "convert_to": "html", "outdir": "/tmp/out"}
+    {"error": null}
+
+"convert_to" has the same form as the argument of LibreOffice's --convert-to
+option, and the output file is named in the same way; as with that option, a
+document that can't be loaded produces no output. When its standard
+input is closed, the helper stops LibreOffice and exits."""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+import uno
+from com.sun.star.beans import PropertyValue
+from com.sun.star.connection import NoConnectException
+from com.sun.star.io import IOException
+from com.sun.star.lang import IllegalArgumentException
+
+
+# The export filters LibreOffice's --convert-to option picks for each output
+# format when it isn't given one, for each sort of document we convert
+_default_filters = {
+    ("html", "com.sun.star.text.TextDocument"): "HTML (StarWriter)",
+    ("html", "com.sun.star.sheet.SpreadsheetDocument"): "HTML (StarCalc)",
+    ("txt", "com.sun.star.text.TextDocument"): "Text",
+    ("csv", "com.sun.star.sheet.SpreadsheetDocument"):
+            "Text - txt - csv (StarCalc)",
+}
+
+
+def _properties(**kwargs):
+    result = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        result.append(prop)
+    return tuple(result)
+
+
+def _reply(**kwargs):
+    sys.stdout.write(json.dumps(kwargs) + "\n")
+    sys.stdout.flush()
+
+
+def _connect(pipe_name, process, timeout=60):
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            context = resolver.resolve(
+                    "uno:pipe,name={0};urp;StarOffice.ComponentContext".format(
+                            pipe_name))
+            return context.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.frame.Desktop", context)
+        except NoConnectException:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def _convert(desktop, path, infilter, convert_to, outdir):
+    extension, _, rest = convert_to.partition(":")
+    filter_name, _, options = rest.partition(":")
+
+    try:
+        document = desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(path)), "_blank", 0,
+                _properties(Hidden=True, ReadOnly=True, FilterName=infilter))
+    except (IllegalArgumentException, IOException):
+        document = None
+    if document is None:
+        # As with --convert-to, a document that can't be loaded just doesn't
+        # produce any output
+        return
+    try:
+        if not filter_name:
+            for (ext, service), name in _default_filters.items():
+                if ext == extension and document.supportsService(service):
+                    filter_name = name
+                    break
+            else:
+                raise ValueError("no export filter", extension)
+        kwargs = {"FilterName": filter_name, "Overwrite": True}
+        if options:
+            kwargs["FilterOptions"] = options
+        output = os.path.join(outdir, "{0}.{1}".format(
+                os.path.splitext(os.path.basename(path))[0], extension))
+        document.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(output)),
+                _properties(**kwargs))
+    finally:
+        document.close(True)
+
+
+def main():
+    soffice, profile = sys.argv[1:3]
+    pipe_name = "os2ds-libreoffice-{0}".format(os.getpid())
+    process = subprocess.Popen(
+            [soffice, "--headless", "--invisible", "--nologo",
+                    "--norestore", "--nodefault", "--nolockcheck",
+                    "--accept=pipe,name={0};urp;StarOffice.ComponentContext"
+                            .format(pipe_name),
+                    "-env:UserInstallation={0}".format(
+                            uno.systemPathToFileUrl(profile))],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+    try:
+        desktop = _connect(pipe_name, process)
+        _reply(error=None)
+        for line in sys.stdin:
+            try:
+                _convert(desktop, **json.loads(line))
+                _reply(error=None)
+            except Exception as ex:
+                _reply(error=repr(ex))
+        try:
+            desktop.terminate()
+        except Exception:
+            # LibreOffice closes the connection as it stops, which sometimes
+            # makes this call fail
+            pass
+    finally:
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ def _parts_are_text_body(parts):
 @Source.mime_handler("message/rfc822")
 class MailSource(DerivedSource):
     type_label = "mail"
+    __slots__ = ()
 
     def _generate_state(self, sm):
         with self.handle.follow(sm).make_stream() as fp:
@@ -91,6 +92,7 @@ class MailPartResource(FileResource):
 class MailPartHandle(Handle):
     type_label = "mail-part"
     resource_type = MailPartResource
+    __slots__ = ("_mime",)
 
     def __init__(self, source, path, mime):
         super().__init__(source, path)
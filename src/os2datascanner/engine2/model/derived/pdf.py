@@ -1,29 +1,150 @@
-from os import listdir
+from os import listdir, makedirs, rename, scandir
+from shutil import copy2
 import pdfrw
+import os.path
 from tempfile import TemporaryDirectory
-from subprocess import run
+from contextlib import closing
+from subprocess import CalledProcessError, TimeoutExpired
 
 from ... import settings as engine2_settings
+from ...conversions.utilities.cache import conversion_cache
+from ...utilities.tools import run_tool
 from ..core import Handle, Source, Resource, SourceManager
 from ..file import FilesystemResource
 from .derived import DerivedSource
 
 
 PAGE_TYPE = "application/x.os2datascanner.pdf-page"
+# The version of the output of PDFPageSource, for the conversion cache
+_CACHE_VERSION = 2
+
+
+def _extract_pages(path, first, last, outputdir):
+    """Extracts the text and images from pages @first to @last (inclusive) of
+    the PDF file at @path, putting the results for each page into a
+    subdirectory of @outputdir named after its page number. The results are
+    laid out exactly as if each page had been extracted separately.
+
+    The external tools are given the usual subprocess timeout for each page
+    in the range."""
+    timeout = engine2_settings.subprocess["timeout"] * (last - first + 1)
+    with TemporaryDirectory(dir=outputdir) as workdir:
+        run_tool(["pdftotext",
+                "-q",
+                "-eol", "unix",
+                "-f", str(first), "-l", str(last),
+                path, "{0}/text.txt".format(workdir)],
+                timeout=timeout,
+                check=True)
+        run_tool(["pdfimages",
+                "-q", "-all", "-p",
+                "-f", str(first), "-l", str(last),
+                path, "{0}/image".format(workdir)],
+                timeout=timeout,
+                check=True)
+        _distribute_pages(workdir, first, last, outputdir)
+
+
+def _distribute_pages(workdir, first, last, outputdir):
+    """Moves the output of a run of pdftotext and pdfimages over pages @first
+    to @last of a PDF file from @workdir into per-page subdirectories of
+    @outputdir."""
+    # pdftotext ends every page with a form feed
+    with open("{0}/text.txt".format(workdir), "rt") as fp:
+        texts = fp.read().split("\f")[:-1]
+    for page, text in enumerate(texts[:last - first + 1], start=first):
+        makedirs(os.path.join(outputdir, str(page)), exist_ok=True)
+        with open(os.path.join(
+                outputdir, str(page), "page.txt"), "wt") as fp:
+            fp.write(text)
+
+    # With the -p option, pdfimages names its output files
+    # "image-PAGE-NUMBER.ext", where NUMBER counts images in the whole run;
+    # rename them to match what a single-page run would have done. (Some
+    # images are written as several files with the same number -- a .ccitt
+    # file and its .params file, for example, or a .jb2e file and its .jb2g
+    # file -- so it's the numbers that are renumbered, not the files)
+    images = {}
+    with closing(scandir(workdir)) as file_iterator:
+        for entry in file_iterator:
+            if entry.name.startswith("image-"):
+                stem, ext = os.path.splitext(entry.name)
+                _, page, number = stem.split("-")
+                images.setdefault((int(page), int(number)), []).append(
+                        (ext, entry.path))
+    counts = {}
+    for (page, _), files in sorted(images.items()):
+        index = counts.get(page, 0)
+        counts[page] = index + 1
+        makedirs(os.path.join(outputdir, str(page)), exist_ok=True)
+        for ext, image_path in files:
+            rename(image_path, os.path.join(
+                    outputdir, str(page), "image-{0:03d}{1}".format(
+                            index, ext)))
+
+
+class _PDFDocument:
+    """A _PDFDocument is the state of an open PDFSource: a local copy of a PDF
+    file, the digest of its content (if the conversion cache is enabled) and,
+    if pages are being extracted in batches, a directory containing the
+    pages that have been extracted so far. (Extracted pages are kept until
+    the document is closed, so a page can be opened again without running
+    the external tools again.)"""
+
+    def __init__(self, path, outputdir=None, batch_size=0):
+        self.path = path
+        self.digest = conversion_cache.digest(path)
+        self._outputdir = outputdir
+        self._batch_size = batch_size
+        # The first pages of the batches that couldn't be extracted together
+        self._failed = set()
+
+    @property
+    def batched(self):
+        return self._outputdir is not None
+
+    def extract(self, page: int) -> str:
+        """Returns the path to a directory containing the text and images of
+        the given page, extracting the batch of pages that contains it if
+        necessary. If the batch can't be extracted (because one of its pages
+        is broken, for example), then its pages are extracted one at a
+        time instead."""
+        path = os.path.join(self._outputdir, str(page))
+        if not os.path.isdir(path):
+            first = ((page - 1) // self._batch_size) * self._batch_size + 1
+            if first not in self._failed:
+                try:
+                    _extract_pages(self.path,
+                            first, first + self._batch_size - 1,
+                            self._outputdir)
+                except (CalledProcessError, TimeoutExpired):
+                    self._failed.add(first)
+            if first in self._failed:
+                _extract_pages(self.path, page, page, self._outputdir)
+            # Even a blank page with no images gets a page.txt file, but be
+            # defensive anyway
+            makedirs(path, exist_ok=True)
+        return path
 
 
 @Source.mime_handler("application/pdf")
 class PDFSource(DerivedSource):
     type_label = "pdf"
+    __slots__ = ()
 
     def _generate_state(self, sm):
         with self.handle.follow(sm).make_path() as p:
             # Explicitly download the file here for the sake of PDFPageSource,
-            # which needs a local filesystem path to pass to pdftohtml
-            yield p
+            # which needs a local filesystem path to pass to pdftotext
+            batch_size = engine2_settings.model["pdf"]["batch_size"]
+            if batch_size > 1:
+                with TemporaryDirectory() as outputdir:
+                    yield _PDFDocument(p, outputdir, batch_size)
+            else:
+                yield _PDFDocument(p)
 
     def handles(self, sm):
-        reader = pdfrw.PdfReader(sm.open(self))
+        reader = pdfrw.PdfReader(sm.open(self).path)
         for i in range(1, len(reader.pages) + 1):
             yield PDFPageHandle(self, str(i))
 
@@ -43,6 +164,7 @@ class PDFPageResource(Resource):
 class PDFPageHandle(Handle):
     type_label = "pdf-page"
     resource_type = PDFPageResource
+    __slots__ = ()
 
     # A PDFPageHandle is an internal reference to a fragment of a document
     is_synthetic = True
@@ -61,31 +183,48 @@ class PDFPageHandle(Handle):
 @Source.mime_handler(PAGE_TYPE)
 class PDFPageSource(DerivedSource):
     type_label = "pdf-page"
+    __slots__ = ()
 
     def _generate_state(self, sm):
         # As we produce FilesystemResources, we need to produce a cookie of the
         # same format as FilesystemSource: a filesystem directory in which to
         # interpret relative paths
         page = self.handle.relative_path
-        path = sm.open(self.handle.source)
-        with TemporaryDirectory() as outputdir:
+        document = sm.open(self.handle.source)
+        if document.batched and document.digest is None:
+            yield document.extract(int(page))
+            return
+
+        def _extract(outputdir):
+            if document.batched:
+                pagedir = document.extract(int(page))
+                for name in listdir(pagedir):
+                    copy2(os.path.join(pagedir, name), outputdir)
+                return
+
+            path = document.path
             # Run pdftotext and pdfimages separately instead of running
             # pdftohtml. Not having to parse HTML is a big performance win by
             # itself, but what's even better is that pdfimages doesn't produce
             # uncountably many texture images for embedded vector graphics
-            run(["pdftotext",
+            run_tool(["pdftotext",
                     "-q", "-nopgbrk",
                     "-eol", "unix",
                     "-f", page, "-l", page,
                     path, "{0}/page.txt".format(outputdir)],
                     timeout=engine2_settings.subprocess["timeout"],
                     check=True)
-            run(["pdfimages",
+            run_tool(["pdfimages",
                     "-q", "-all",
                     "-f", page, "-l", page,
                     path, "{0}/image".format(outputdir)],
                     timeout=engine2_settings.subprocess["timeout"],
                     check=True)
+
+        with TemporaryDirectory() as outputdir:
+            conversion_cache.extract(document.digest,
+                    "pdf-page:{0}".format(page), _CACHE_VERSION,
+                    _extract, outputdir)
             yield outputdir
 
     def handles(self, sm):
@@ -97,6 +236,7 @@ class PDFPageSource(DerivedSource):
 class PDFObjectHandle(Handle):
     type_label = "pdf-object"
     resource_type = FilesystemResource
+    __slots__ = ()
 
     # All PDFObjectHandles point at generated temporary files
     # (XXX: we don't care about this metadata at the moment, so this isn't an
@@ -12,6 +12,7 @@ from .derived import DerivedSource
 @Source.mime_handler("application/x-tar")
 class TarSource(DerivedSource):
     type_label = "tar"
+    __slots__ = ()
 
     def handles(self, sm):
         tarfile = sm.open(self)
@@ -77,6 +78,7 @@ class TarResource(FileResource):
 class TarHandle(Handle):
     type_label = "tar"
     resource_type = TarResource
+    __slots__ = ()
 
     @property
     def presentation(self):
@@ -1,17 +1,21 @@
+from io import BytesIO, FileIO
 from zipfile import ZipFile
 from datetime import datetime
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 
+from ... import settings as engine2_settings
 from ...conversions.types import OutputType
 from ...conversions.utilities.results import MultipleResults
 from ..core import Source, Handle, FileResource, SourceManager
 from ..utilities import NamedTemporaryResource
+from ..utilities.ranged import is_ranged
 from .derived import DerivedSource
 
 
 @Source.mime_handler("application/zip")
 class ZipSource(DerivedSource):
     type_label = "zip"
+    __slots__ = ()
 
     def handles(self, sm):
         zipfile = sm.open(self)
@@ -28,11 +32,66 @@ class ZipSource(DerivedSource):
                 yield ZipHandle(self, name)
 
     def _generate_state(self, sm):
-        with self.handle.follow(sm).make_path() as r:
+        resource = self.handle.follow(sm)
+        with resource.make_stream() as fp:
+            if isinstance(fp, BytesIO) or isinstance(
+                    getattr(fp, "raw", fp), FileIO):
+                # The whole file is already in memory or on the local disk
+                # (perhaps because the resource had to download it to give us
+                # a stream at all), so another local copy would be a waste of
+                # time
+                with ZipFile(fp) as zp:
+                    yield zp
+                return
+            elif is_ranged(fp):
+                with _RangedZipFile(resource, fp) as zp:
+                    yield zp
+                return
+        with resource.make_path() as r:
             with ZipFile(str(r)) as zp:
                 yield zp
 
 
+class _RangedZipFile:
+    """A _RangedZipFile reads a remote zip file with range requests, so
+    that listing its members only needs the central directory to be
+    downloaded. Reading a member with range requests costs a couple of
+    requests, though, so after the configured number of members have been
+    read this way, it switches to a local copy of the whole file made by the
+    resource's make_path method (and so by the spool, if there is one)."""
+
+    def __init__(self, resource, fp):
+        self._resource = resource
+        self._stack = ExitStack()
+        self._zipfile = self._stack.enter_context(ZipFile(fp))
+        self._remaining = engine2_settings.model["zip"]["ranged_members"]
+
+    def infolist(self):
+        return self._zipfile.infolist()
+
+    def getinfo(self, name):
+        return self._zipfile.getinfo(name)
+
+    def open(self, name):
+        if self._remaining is not None:
+            if self._remaining > 0:
+                self._remaining -= 1
+            else:
+                path = self._stack.enter_context(self._resource.make_path())
+                self._zipfile = self._stack.enter_context(ZipFile(str(path)))
+                self._remaining = None
+        return self._zipfile.open(name)
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class ZipResource(FileResource):
     def __init__(self, handle, sm):
         super().__init__(handle, sm)
@@ -86,6 +145,7 @@ class ZipResource(FileResource):
 class ZipHandle(Handle):
     type_label = "zip"
     resource_type = ZipResource
+    __slots__ = ()
 
     @property
     def presentation(self):
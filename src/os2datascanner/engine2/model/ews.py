@@ -10,6 +10,7 @@ from exchangelib.errors import (ErrorServerBusy,
         ErrorItemNotFound, ErrorNonExistentMailbox)
 from exchangelib.protocol import BaseProtocol
 
+from .. import settings as engine2_settings
 from .utilities import NamedTemporaryResource
 from ..utilities.backoff import run_with_backoff
 from ..conversions.types import OutputType
@@ -17,8 +18,6 @@ from ..conversions.utilities.results import SingleResult, MultipleResults
 from .core import Source, Handle, FileResource
 
 
-BaseProtocol.SESSION_POOLSIZE = 1
-
 # An "entry ID" is the special identifier used to open something in the Outlook
 # rich client (after converting it to a hexadecimal string). This property can
 # be retrieved over the EWS protocol, but exchangelib doesn't do so by default;
@@ -31,6 +30,11 @@ class EntryID(ExtendedProperty):
 Message.register("entry_id", EntryID)
 
 
+# The fields of a Message used by EWSMailResource
+_PREFETCHED_FIELDS = ("mime_content", "size",
+        "datetime_created", "datetime_received", "datetime_sent",)
+
+
 OFFICE_365_ENDPOINT = "https://outlook.office365.com/EWS/Exchange.asmx"
 # XXX: actually use Microsoft Graph to do this properly (deeplink URLs are
 # available through an email's "webLink" property)
@@ -91,6 +95,12 @@ class EWSAccountSource(Source):
         return "{0}@{1}".format(self.user, self.domain)
 
     def _generate_state(self, sm):
+        # exchangelib shares a protocol object, and so a pool of connections,
+        # between every account on the same server with the same credentials;
+        # the size of that pool limits the number of requests we'll make to
+        # the server at once
+        BaseProtocol.SESSION_POOLSIZE = (
+                engine2_settings.model["ews"]["pool_size"])
         service_account = Credentials(
                 username=self._admin_user, password=self._admin_password)
         config = Configuration(
@@ -106,7 +116,9 @@ class EWSAccountSource(Source):
                 access_type=IMPERSONATION)
 
         try:
-            yield account
+            # The second element of the state is a dictionary of Messages
+            # retrieved in advance by the prefetch method, indexed by their ID
+            yield account, {}
         finally:
             # XXX: we should, in principle, close account.protocol here, but
             # exchangelib seems to keep a reference to it internally and so
@@ -118,7 +130,8 @@ class EWSAccountSource(Source):
                 self._domain, self._server, None, None, self._user)
 
     def handles(self, sm):
-        account = sm.open(self)
+        account, _ = sm.open(self)
+        page_size = engine2_settings.model["ews"]["page_size"]
 
         def relevant_folders():
             for container in account.msg_folder_root.walk():
@@ -129,8 +142,9 @@ class EWSAccountSource(Source):
 
         def relevant_mails(relevant_folders):
             for folder in relevant_folders:
-                for mail in (m
-                        for m in folder.all().only("id", "headers", "entry_id")
+                query = folder.all().only("id", "headers", "entry_id")
+                query.page_size = page_size
+                for mail in (m for m in query
                         if isinstance(m, Message) and hasattr(m, "entry_id")):
                     headers = _dictify_headers(mail.headers)
                     if headers:
@@ -142,6 +156,30 @@ class EWSAccountSource(Source):
 
         yield from relevant_mails(relevant_folders())
 
+    def prefetch(self, sm, handles):
+        """Retrieves the Messages behind the given EWSMailHandles with as few
+        bulk GetItem requests as possible. Messages prefetched by an earlier
+        call that have not yet been used are discarded."""
+        account, prefetched = sm.open(self)
+        prefetched.clear()
+        ids = [h.relative_path.split(".", maxsplit=1)[1] for h in handles
+                if isinstance(h, EWSMailHandle)]
+        if not ids:
+            return
+
+        def _fetch_messages():
+            return list(account.fetch(
+                    ids=[(mail_id, None) for mail_id in ids],
+                    only_fields=_PREFETCHED_FIELDS,
+                    chunk_size=engine2_settings.model["ews"]["fetch_size"]))
+        messages, _ = run_with_backoff(
+                _fetch_messages, ErrorServerBusy, fuzz=0.25)
+        for mail_id, message in zip(ids, messages):
+            # (Messages that couldn't be retrieved are returned as exception
+            # objects, and will be retrieved again individually later)
+            if isinstance(message, Message):
+                prefetched[mail_id] = message
+
     def to_json_object(self):
         return dict(**super().to_json_object(), **{
             "domain": self._domain,
@@ -181,7 +219,9 @@ class EWSMailResource(FileResource):
 
     def check(self) -> bool:
         folder_id, mail_id = self._ids
-        account = self._get_cookie()
+        account, prefetched = self._get_cookie()
+        if mail_id in prefetched:
+            return True
 
         def _retrieve_message():
             return account.root.get_folder(
@@ -193,12 +233,13 @@ class EWSMailResource(FileResource):
     def get_message_object(self):
         if not self._message:
             folder_id, mail_id = self._ids
-            account = self._get_cookie()
-
-            def _retrieve_message():
-                return account.root.get_folder(folder_id).get(id=mail_id)
-            self._message, _ = run_with_backoff(
-                    _retrieve_message, ErrorServerBusy, fuzz=0.25)
+            account, prefetched = self._get_cookie()
+            self._message = prefetched.pop(mail_id, None)
+            if not self._message:
+                def _retrieve_message():
+                    return account.root.get_folder(folder_id).get(id=mail_id)
+                self._message, _ = run_with_backoff(
+                        _retrieve_message, ErrorServerBusy, fuzz=0.25)
         return self._message
 
     @contextmanager
@@ -1,6 +1,6 @@
 from .core import Source, Handle, FileResource
 
-from os import stat
+from os import scandir, stat
 import os.path
 from urllib.parse import quote, unquote, urlsplit, urlunsplit
 from pathlib import Path
@@ -9,10 +9,12 @@ from contextlib import contextmanager
 
 from ..conversions.types import OutputType
 from ..conversions.utilities.results import MultipleResults
+from .utilities.index import explore
 
 
 class FilesystemSource(Source):
     type_label = "file"
+    __slots__ = ("_path",)
 
     def __init__(self, path):
         if not os.path.isabs(path):
@@ -31,6 +33,10 @@ class FilesystemSource(Source):
                     yield FilesystemHandle(self,
                             str(f.relative_to(pathlib_path)))
 
+    def changed_handles(self, sm, index):
+        for path, deleted in explore_directory(self.path, index):
+            yield FilesystemHandle(self, path), deleted
+
     def _generate_state(self, sm):
         """Yields a path to the directory against which relative paths should
         be resolved.
@@ -63,6 +69,27 @@ class FilesystemSource(Source):
         return FilesystemSource(path=obj["path"])
 
 
+def explore_directory(root, index):
+    """Explores the local directory @root using the ExplorationIndex @index,
+    yielding (path, deleted) pairs as described in the documentation of the
+    utilities.index.explore function."""
+    def list_directory(path):
+        try:
+            listing = []
+            with scandir(os.path.join(root, path)) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        listing.append((entry.name, True, None))
+                    elif entry.is_file():
+                        listing.append(
+                                (entry.name, False, entry.stat().st_mtime))
+            return listing
+        except OSError:
+            return None
+
+    return explore(index, list_directory)
+
+
 stat_attributes = ("st_mode", "st_ino", "st_dev", "st_nlink", "st_uid",
         "st_gid", "st_size", "st_atime", "st_mtime", "st_ctime",
         "st_blksize", "st_blocks", "st_rdev", "st_flags",)
@@ -107,6 +134,7 @@ class FilesystemResource(FileResource):
 class FilesystemHandle(Handle):
     type_label = "file"
     resource_type = FilesystemResource
+    __slots__ = ()
 
     @property
     def presentation(self):
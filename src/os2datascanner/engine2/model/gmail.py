@@ -6,13 +6,46 @@ from google.oauth2 import service_account
 from googleapiclient.errors import HttpError
 from googleapiclient.discovery import build
 
+from .. import settings as engine2_settings
 from .utilities import NamedTemporaryResource
+from ..utilities.backoff import run_with_backoff
 from ..conversions.utilities.results import SingleResult
 
 import json
 import base64
 
 
+# The number of times the Gmail API client library should retry a request that
+# failed because of usage limits
+_MAX_RETRIES = 5
+
+
+class _RateLimited(Exception):
+    pass
+
+
+# The reasons given in the error bodies of the 403 responses with which the
+# Gmail API refuses requests that exceed its usage limits
+_RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded",)
+
+
+def _is_rate_limited(ex):
+    """Indicates whether or not an HttpError was caused by one of Gmail's
+    usage limits (rather than by, for example, a missing message)."""
+    if ex.resp.status == 429:
+        return True
+    elif ex.resp.status != 403:
+        return False
+    try:
+        error = json.loads(ex.content)["error"]
+        return any(e.get("reason") in _RATE_LIMIT_REASONS
+                for e in error.get("errors", []))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        # A 403 response without a structured error body is a real
+        # permission problem
+        return False
+
+
 class GmailSource(Source):
     """Implements Gmail API using a service account.
        The organization must create a project, a service account, enable G Suite Domain-wide Delegation
@@ -42,28 +75,67 @@ class GmailSource(Source):
 
     def handles(self, sm):
         service = sm.open(self)
-        # Call the Gmail API to fetch INBOX
-        results = service.users().messages().list(userId=self._user_email_gmail,
-                                                      labelIds=['INBOX'], maxResults=500).execute()
-        messages = []
-        if 'messages' in results:
-            messages.extend(results['messages'])
-            while 'nextPageToken' in results:
-                page_token = results['nextPageToken']
-                results = service.users().messages().list(userId=self._user_email_gmail,
-                                                          labelIds=['INBOX'], maxResults=500,
-                                                          pageToken=page_token).execute()
-                messages.extend(results['messages'])
-
-            for message in messages:
-                # Fetch info on specific email
-                msgId = message.get("id")
-                email = service.users().messages().get(userId=self._user_email_gmail,
-                                                       id=msgId).execute()
-                headers = email["payload"]["headers"]
-                subject = [i['value'] for i in headers if i["name"] == "Subject"]
-                # Id of given email is set to be path.
-                yield GmailHandle(self, msgId, mail_subject=subject)
+        batch_size = engine2_settings.model["gmail"]["batch_size"]
+        # Call the Gmail API to fetch INBOX, a page at a time
+        for page in self._list_messages(service):
+            ids = [message["id"] for message in page]
+            for start in range(0, len(ids), batch_size):
+                chunk = ids[start:start + batch_size]
+                # Fetch info on these emails
+                subjects = self._get_subjects(service, chunk)
+                for msgId in chunk:
+                    # (Messages deleted since the list was made won't have a
+                    # subject)
+                    if msgId in subjects:
+                        # Id of given email is set to be path.
+                        yield GmailHandle(
+                                self, msgId, mail_subject=subjects[msgId])
+
+    def _list_messages(self, service):
+        """Yields each page of the list of messages in the inbox as soon as
+        it has been retrieved."""
+        messages = service.users().messages()
+        request = messages.list(userId=self._user_email_gmail,
+                                labelIds=['INBOX'], maxResults=500)
+        while request is not None:
+            results = request.execute(num_retries=_MAX_RETRIES)
+            yield results.get('messages', [])
+            request = messages.list_next(request, results)
+
+    def _get_subjects(self, service, ids):
+        """Retrieves the subjects of the given messages with a batch request,
+        and returns a dictionary mapping message IDs to lists of the values
+        of their Subject headers. Requests refused because of Gmail's usage
+        limits are retried with exponential backoff."""
+        subjects = {}
+        pending = list(ids)
+        retry = []
+
+        def _callback(request_id, response, exception):
+            if exception is None:
+                headers = response["payload"]["headers"]
+                subjects[request_id] = [
+                        i['value'] for i in headers if i["name"] == "Subject"]
+            elif _is_rate_limited(exception):
+                retry.append(request_id)
+            elif exception.resp.status not in (404, 410,):
+                raise exception
+
+        def _execute_batch():
+            batch = service.new_batch_http_request(callback=_callback)
+            for msgId in pending:
+                batch.add(service.users().messages().get(
+                        userId=self._user_email_gmail, id=msgId,
+                        format="metadata", metadataHeaders=["Subject"]),
+                        request_id=msgId)
+            batch.execute()
+            if retry:
+                pending[:] = retry
+                retry.clear()
+                raise _RateLimited()
+
+        run_with_backoff(_execute_batch, _RateLimited, fuzz=0.25)
+        return subjects
 
     # Censoring service account details
     def censor(self):
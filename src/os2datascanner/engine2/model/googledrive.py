@@ -8,6 +8,7 @@ from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 from .core import Source, Handle, FileResource
 from .utilities import NamedTemporaryResource
+from .utilities.ranged import open_ranged
 from ..conversions.utilities.results import SingleResult
 
 
@@ -110,17 +111,30 @@ class GoogleDriveResource(FileResource):
                     res.write(s.read())
             yield ntr.get_path()
 
+    def _get_range(self, start, end):
+        request = self._get_cookie().files().get_media(
+                fileId=self.handle.relative_path)
+        request.headers["Range"] = "bytes={0}-{1}".format(start, end)
+        return request.execute()
+
     @contextmanager
     def make_stream(self):
-        with self.open_file() as res:
-            yield res
+        size = self.metadata.get("size")
+        # Google-type files have no size, and must be exported in full
+        if size and 'vnd.google-apps' not in self.metadata.get('mimeType'):
+            with open_ranged(self._get_range, int(size),
+                    type_label=self.handle.type_label) as res:
+                yield res
+        else:
+            with self.open_file() as res:
+                yield res
 
     @property
     def metadata(self):
         if not self._metadata:
             self._metadata = self._get_cookie().files().get(
                     fileId=self.handle.relative_path,
-                    fields='name, size, quotaBytesUsed').execute()
+                    fields='name, mimeType, size, quotaBytesUsed').execute()
 
         return self._metadata
 
@@ -1,30 +1,109 @@
-from io import BytesIO
-from time import sleep
+from time import sleep, monotonic
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from lxml.html import document_fromstring
 from lxml.etree import ParserError
 from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
 import logging
+from requests.adapters import HTTPAdapter
 from requests.sessions import Session
 from requests.exceptions import ConnectionError
 from contextlib import contextmanager
 
+from .. import settings as engine2_settings
 from ..conversions.types import OutputType
 from ..conversions.utilities.results import SingleResult, MultipleResults
 from .core import Source, Handle, FileResource
 from .utilities import NamedTemporaryResource
+from .utilities.spool import spooled
+from .utilities.ranged import open_ranged, http_range_getter
 from .utilities.sitemap import SitemapError, process_sitemap_url
 from .utilities.datetime import parse_datetime
 
 
-MAX_REQUESTS_PER_SECOND = 10
-SLEEP_TIME = 1 / MAX_REQUESTS_PER_SECOND
-
-
 def simplify_mime_type(mime):
     r = mime.split(';', maxsplit=1)
     return r[0]
 
 
+class _Politeness:
+    """Keeps track of how quickly a crawler is allowed to make requests to a
+    web server. The delay between requests is never less than the larger of
+    @min_delay and the server's requested crawl delay; it grows whenever the
+    server says that it's overloaded, and shrinks back gradually as requests
+    succeed."""
+
+    def __init__(self, min_delay, max_delay, crawl_delay=None):
+        self._min_delay = max(min_delay, crawl_delay or 0)
+        self._max_delay = max(max_delay, self._min_delay)
+        self._delay = self._min_delay
+        self._next = 0
+
+    def wait_time(self):
+        """Returns the number of seconds until the next request may be
+        made."""
+        return max(0, self._next - monotonic())
+
+    def started(self):
+        self._next = monotonic() + self._delay
+
+    def succeeded(self):
+        self._delay = max(self._min_delay, self._delay * 0.9)
+
+    def throttled(self, retry_after=None):
+        self._delay = min(self._max_delay, max(self._delay * 2, 0.1))
+        try:
+            self._next = max(self._next, monotonic() + int(retry_after))
+        except (TypeError, ValueError):
+            pass
+
+
+def _get_crawl_delay(session, scheme, netloc):
+    """Returns the minimum delay between requests (in seconds) requested by
+    the robots.txt file of a web server, or None if it doesn't ask for
+    one."""
+    try:
+        response = session.get(
+                urlunsplit((scheme, netloc, "/robots.txt", None, None)))
+    except ConnectionError:
+        return None
+    if response.status_code != 200:
+        return None
+    parser = RobotFileParser()
+    parser.parse(response.text.splitlines())
+    delay = parser.crawl_delay("*")
+    rate = parser.request_rate("*")
+    if rate:
+        delay = max(delay or 0, rate.seconds / rate.requests)
+    return delay
+
+
+def _fetch(session, url, validators):
+    """Makes a GET request for a URL, without following redirects. If the
+    response is a HTML page, its content is also returned; otherwise, only
+    the headers are downloaded. (If @validators is a dictionary containing an
+    ETag or a Last-Modified timestamp, then the request is made conditional
+    on the resource having changed.)"""
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    response = session.get(url,
+            headers=headers, allow_redirects=False, stream=True)
+    try:
+        content = None
+        ct = response.headers.get("Content-Type", "")
+        if (response.status_code == 200
+                and simplify_mime_type(ct) == 'text/html'):
+            content = response.content
+        return response, content
+    finally:
+        response.close()
+
+
 class WebSource(Source):
     type_label = "web"
 
@@ -35,6 +114,12 @@ class WebSource(Source):
 
     def _generate_state(self, sm):
         with Session() as session:
+            # Make sure that every crawler thread can keep its connection
+            pool_size = engine2_settings.model["http"]["workers"]
+            adapter = HTTPAdapter(
+                    pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
             yield session
 
     def censor(self):
@@ -43,10 +128,30 @@ class WebSource(Source):
         return self
 
     def handles(self, sm):
+        for handle, _ in self._crawl(sm, None):
+            yield handle
+
+    def changed_handles(self, sm, index):
+        """Crawls this website, yielding a (WebHandle, deleted) pair for every
+        page or file that has been created, changed or deleted since the
+        ExplorationIndex @index was last updated.
+
+        The index records the validators (ETag and Last-Modified headers)
+        and links of every address that was reached, so that unchanged pages
+        can be skipped with conditional requests while still being crawled
+        using their recorded links. Addresses in the index that can no longer
+        be reached are reported as deleted."""
+        yield from self._crawl(sm, index)
+        index.commit()
+
+    def _crawl(self, sm, index):
         session = sm.open(self)
-        to_visit = [WebHandle(self, "")]
+        settings = engine2_settings.model["http"]
+        to_visit = deque([WebHandle(self, "")])
         known_addresses = set(to_visit)
         referrer_map = {}
+        attempts = {}
+        reached = set()
 
         scheme, netloc, path, query, fragment = urlsplit(self._url)
 
@@ -70,24 +175,90 @@ class WebSource(Source):
                     self._sitemap):
                 handle_url(None, address, last_modified)
 
-        while to_visit:
-            here, to_visit = to_visit[0], to_visit[1:]
-
-            response = session.head(here.presentation_url)
-            if response.status_code == 200:
-                ct = response.headers['Content-Type']
-                if simplify_mime_type(ct) == 'text/html':
-                    response = session.get(here.presentation_url)
-                    sleep(SLEEP_TIME)
-                    for li in make_outlinks(
-                            response.content, here.presentation_url):
-                        handle_url(here.presentation_url, li)
-            elif response.is_redirect and response.next:
-                handle_url(here.presentation_url, response.next.url)
-                # Don't yield WebHandles for redirects
-                continue
-
-            yield here
+        politeness = _Politeness(
+                1 / settings["max_requests_per_second"],
+                settings["max_delay"],
+                _get_crawl_delay(session, scheme, netloc))
+        workers = settings["workers"]
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while to_visit or in_flight:
+                    while (to_visit and len(in_flight) < workers
+                            and not politeness.wait_time()):
+                        here = to_visit.popleft()
+                        record = None
+                        if index is not None:
+                            record = index.get_item(here.relative_path)
+                        politeness.started()
+                        in_flight[executor.submit(_fetch, session,
+                                here.presentation_url,
+                                record[2] if record else None)] = here
+
+                    # Wait until a request finishes or until we're allowed to
+                    # start another one, whichever happens first
+                    timeout = None
+                    if to_visit and len(in_flight) < workers:
+                        timeout = politeness.wait_time()
+                    if not in_flight:
+                        sleep(timeout)
+                        continue
+                    done, _ = wait(in_flight,
+                            timeout=timeout, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        here = in_flight.pop(future)
+                        url = here.presentation_url
+                        response, content = future.result()
+
+                        if response.status_code in (429, 503,):
+                            politeness.throttled(
+                                    response.headers.get("Retry-After"))
+                            attempts[here] = attempts.get(here, 0) + 1
+                            if attempts[here] <= settings["retries"]:
+                                to_visit.appendleft(here)
+                                continue
+                        else:
+                            politeness.succeeded()
+
+                        if response.is_redirect and response.next:
+                            handle_url(url, response.next.url)
+                            # Don't yield WebHandles for redirects
+                            continue
+
+                        reached.add(here.relative_path)
+                        if response.status_code == 304 and index is not None:
+                            # This page hasn't changed, but we still need to
+                            # follow the links it had last time
+                            for li in index.get_item(
+                                    here.relative_path)[2]["links"]:
+                                handle_url(url, li)
+                            continue
+
+                        links = []
+                        if content is not None:
+                            links = list(make_outlinks(content, url))
+                            for li in links:
+                                handle_url(url, li)
+                        if index is not None:
+                            index.put_item(here.relative_path, url, False, {
+                                "etag": response.headers.get("ETag"),
+                                "last_modified": response.headers.get(
+                                        "Last-Modified"),
+                                "links": links
+                            })
+                        yield here, False
+            finally:
+                # If we're stopping early, don't bother making any more
+                # requests
+                for future in in_flight:
+                    future.cancel()
+
+        if index is not None:
+            for relative_path, _, _, _ in index.items_under(""):
+                if relative_path not in reached:
+                    yield WebHandle(self, relative_path), True
+                    index.remove_item(relative_path)
 
     def to_url(self):
         return self._url
@@ -114,6 +285,7 @@ class WebSource(Source):
 SecureWebSource = WebSource
 
 
+@spooled(streams=False)
 class WebResource(FileResource):
     def __init__(self, handle, sm):
         super().__init__(handle, sm)
@@ -173,16 +345,39 @@ class WebResource(FileResource):
     def make_path(self):
         with NamedTemporaryResource(self.handle.name) as ntr:
             with ntr.open("wb") as res:
-                with self.make_stream() as s:
-                    res.write(s.read())
+                with self._get_cookie().get(
+                        self._make_url(), stream=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(
+                            self.DOWNLOAD_CHUNK_SIZE):
+                        res.write(chunk)
             yield ntr.get_path()
 
+    def _supports_ranges(self):
+        header = self.unpack_header(check=True)
+        # Range requests are answered in terms of the encoded content, which
+        # requests would otherwise decode for us
+        return (header.get("accept-ranges", "none").value == "bytes"
+                and "content-length" in header
+                and "content-encoding" not in header)
+
     @contextmanager
     def make_stream(self):
-        response = self._get_cookie().get(self._make_url())
-        response.raise_for_status()
-        with BytesIO(response.content) as s:
-            yield s
+        if self._supports_ranges():
+            with open_ranged(
+                    http_range_getter(
+                            self._get_cookie().get, self._make_url()),
+                    self.get_size().value,
+                    type_label=self.handle.type_label) as fp:
+                yield fp
+        else:
+            # We'll have to download the whole thing anyway, so make sure
+            # that it ends up in the spool
+            with self.make_path() as p:
+                with open(p, "rb") as s:
+                    yield s
+
+    DOWNLOAD_CHUNK_SIZE = 1024 * 512
 
 
 class WebHandle(Handle):
@@ -1,11 +1,16 @@
-from io import BytesIO
 from contextlib import contextmanager
 
+from ...conversions.types import OutputType
 from ...conversions.utilities.results import SingleResult
 from ..core import Handle, Source, Resource, FileResource
 from ..derived.derived import DerivedSource
 from ..utilities import NamedTemporaryResource
-from .utilities import MSGraphSource, ignore_responses
+from ..utilities.datetime import parse_datetime
+from ..utilities.spool import spooled
+from ..utilities.ranged import open_ranged, http_range_getter
+from ..utilities.index import ExplorationIndex, join_path
+from .utilities import (MSGraphSource,
+        DeltaQuery, ignore_responses)
 
 
 class MSGraphFilesSource(MSGraphSource):
@@ -29,15 +34,14 @@ class MSGraphFilesSource(MSGraphSource):
     def handles(self, sm):
         if self._site_drives:
             with ignore_responses(404):
-                drives = sm.open(self).get("sites/root/drives")
-                for drive in drives["value"]:
+                for drive in sm.open(self).paginate("sites/root/drives"):
                     yield self._make_drive_handle(drive)
         if self._user_drives:
-            for user in self._list_users(sm)["value"]:
-                pn = user["userPrincipalName"]
-                with ignore_responses(404):
-                    drive = sm.open(self).get("users/{0}/drive".format(pn))
-                    yield self._make_drive_handle(drive)
+            for _, drive in sm.open(self).get_batch(
+                    ("users/{0}/drive".format(user["userPrincipalName"])
+                            for user in self._list_users(sm)),
+                    ignore=(404,)):
+                yield self._make_drive_handle(drive)
 
     def to_json_object(self):
         return dict(**super().to_json_object(), **{
@@ -116,26 +120,98 @@ class MSGraphDriveSource(DerivedSource):
         yield sm.open(self.handle.source)
 
     def handles(self, sm):
-
-        def _explore_folder(components, folder):
-            for obj in folder:
-                name = obj["name"]
-                if "file" in obj:
-                    yield MSGraphFileHandle(
-                            self, "/".join([] + components + [name]))
-                elif "folder" in obj:
-                    subfolder = sm.open(self).get(
-                            "/drives/{0}/items/{1}/children".format(
-                                    self.handle.relative_path,
-                                    obj["id"]))
-                    yield from _explore_folder(
-                            components + [name], subfolder["value"])
-        root = sm.open(self).get(
-                "drives/{0}/root/children".format(
-                        self.handle.relative_path))["value"]
-        yield from _explore_folder([], root)
+        # Graph's delta function is the quickest way to enumerate a drive even
+        # when we're not interested in changes, so just use a temporary (and
+        # therefore empty) index
+        with ExplorationIndex(":memory:") as index:
+            for handle, _ in self.changed_handles(sm, index):
+                yield handle
+
+    def changed_handles(self, sm, index):
+        """Yields (Handle, deleted) pairs for the files in this drive that
+        have changed since the ExplorationIndex @index was last updated.
+
+        The index records the path of every file and folder in the drive (so
+        that deleted objects, which Graph identifies only by their IDs, can
+        be reported) and the link that will return the next set of changes.
+        """
+        link = index.get_property("delta")
+        try:
+            yield from self._read_delta(sm, index, link)
+        except Exception as ex:
+            if not link or not DeltaQuery.is_expired(ex):
+                raise
+            # Graph has forgotten about our last query, so start again
+            yield from self._read_delta(sm, index, None)
+        index.commit()
+
+    def _read_delta(self, sm, index, link):
+        # If we're starting from scratch, then we'll see every object that
+        # still exists, and everything else in the index has been deleted
+        seen = set() if not link else None
+        query = DeltaQuery(sm.open(self), link or
+                "drives/{0}/root/delta".format(self.handle.relative_path))
+
+        for item in query:
+            item_id = item["id"]
+            if seen is not None:
+                seen.add(item_id)
+            old = index.get_item(item_id)
+
+            if "deleted" in item:
+                if old:
+                    yield from self._forget(index, item_id, old)
+                continue
+            elif "root" in item:
+                index.put_item(item_id, "", True)
+                continue
+
+            parent = index.get_item(
+                    item.get("parentReference", {}).get("id"))
+            if not parent or not ("file" in item or "folder" in item):
+                continue
+            path = join_path(parent[0], item["name"])
+
+            if old and old[0] != path:
+                # This object has been moved or renamed, so everything we
+                # knew about under its old path has moved too
+                if old[1]:
+                    for child_id, child_path, is_folder, _ in (
+                            index.items_under(old[0])):
+                        new_path = path + child_path[len(old[0]):]
+                        index.put_item(child_id, new_path, is_folder)
+                        if not is_folder:
+                            yield MSGraphFileHandle(self, child_path), True
+                            yield MSGraphFileHandle(self, new_path), False
+                else:
+                    yield MSGraphFileHandle(self, old[0]), True
+
+            index.put_item(item_id, path, "folder" in item)
+            if "file" in item:
+                yield MSGraphFileHandle(self, path), False
+
+        if seen is not None:
+            for item_id, path, is_folder, _ in index.items_under(""):
+                if item_id not in seen:
+                    if not is_folder:
+                        yield MSGraphFileHandle(self, path), True
+                    index.remove_item(item_id)
+        index.set_property("delta", query.delta_link)
+
+    def _forget(self, index, item_id, record):
+        path, is_folder, _ = record
+        if is_folder:
+            for child_id, child_path, child_is_folder, _ in (
+                    index.items_under(path)):
+                if not child_is_folder:
+                    yield MSGraphFileHandle(self, child_path), True
+                index.remove_item(child_id)
+        else:
+            yield MSGraphFileHandle(self, path), True
+        index.remove_item(item_id)
 
 
+@spooled(streams=False)
 class MSGraphFileResource(FileResource):
     def __init__(self, sm, handle):
         super().__init__(sm, handle)
@@ -158,26 +234,35 @@ class MSGraphFileResource(FileResource):
         return self._metadata
 
     def get_last_modified(self):
+        timestamp = self.get_file_metadata().get("lastModifiedDateTime")
+        if timestamp:
+            return SingleResult(None, OutputType.LastModified,
+                    parse_datetime(timestamp))
         return super().get_last_modified()
 
     def get_size(self):
-        return SingleResult(None, 'size', 1024)
+        return SingleResult(None, 'size', self.get_file_metadata()["size"])
 
     @contextmanager
     def make_path(self):
         with NamedTemporaryResource(self.handle.name) as ntr:
             with ntr.open("wb") as res:
-                with self.make_stream() as s:
-                    res.write(s.read())
+                self._get_cookie().download(
+                        self.make_object_path() + ":/content", res,
+                        chunk_size=self.DOWNLOAD_CHUNK_SIZE)
             yield ntr.get_path()
 
     @contextmanager
     def make_stream(self):
-        response = self._get_cookie().get(
-                self.make_object_path() + ":/content", json=False)
-        with BytesIO(response) as fp:
+        with open_ranged(
+                http_range_getter(self._get_cookie().get_raw,
+                        self.make_object_path() + ":/content"),
+                self.get_file_metadata()["size"],
+                type_label=self.handle.type_label) as fp:
             yield fp
 
+    DOWNLOAD_CHUNK_SIZE = 1024 * 512
+
 
 @Handle.stock_json_handler("msgraph-drive-file")
 class MSGraphFileHandle(Handle):
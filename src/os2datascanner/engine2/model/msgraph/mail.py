@@ -5,23 +5,31 @@ from ...conversions.utilities.results import SingleResult
 from ..core import Handle, Source, Resource, FileResource
 from ..derived.derived import DerivedSource
 from ..utilities import NamedTemporaryResource
-from .utilities import MSGraphSource, ignore_responses
+from ..utilities.index import ExplorationIndex
+from .utilities import MSGraphSource, DeltaQuery
 
 
 class MSGraphMailSource(MSGraphSource):
     type_label = "msgraph-mail"
 
     def handles(self, sm):
-        for user in self._list_users(sm)["value"]:
-            pn = user["userPrincipalName"]
-            with ignore_responses(404):
-                any_mails = sm.open(self).get(
-                        "users/{0}/messages?$select=id&$top=1".format(pn))
-                if not any_mails["value"]:
-                    # This user has a mail account that contains no mails
-                    continue
-                else:
-                    yield MSGraphMailAccountHandle(self, pn)
+        principal_names = {}
+
+        def _queries():
+            for user in self._list_users(sm):
+                pn = user["userPrincipalName"]
+                tail = "users/{0}/messages?$select=id&$top=1".format(pn)
+                principal_names[tail] = pn
+                yield tail
+
+        for tail, any_mails in sm.open(self).get_batch(
+                _queries(), ignore=(404,)):
+            pn = principal_names.pop(tail)
+            if not any_mails["value"]:
+                # This user has a mail account that contains no mails
+                continue
+            else:
+                yield MSGraphMailAccountHandle(self, pn)
 
     @staticmethod
     @Source.json_handler(type_label)
@@ -71,12 +79,103 @@ class MSGraphMailAccountSource(DerivedSource):
         yield sm.open(self.handle.source)
 
     def handles(self, sm):
+        # Graph's delta functions are also the quickest way to enumerate a
+        # mailbox, so just use a temporary (and therefore empty) index
+        with ExplorationIndex(":memory:") as index:
+            for handle, _ in self.changed_handles(sm, index):
+                yield handle
+
+    def changed_handles(self, sm, index):
+        """Yields (Handle, deleted) pairs for the messages in this account
+        that have changed since the ExplorationIndex @index was last updated.
+
+        Graph can only track changes to messages one folder at a time, so
+        the index records the folders of the account, the folder and
+        presentation details of every message (so that deleted messages,
+        which Graph identifies only by their IDs, can be reported), and the
+        link that will return the next set of changes to each folder.
+        Folders are recorded with their ID as their path, and messages with
+        the path "folder ID/message ID"."""
         pn = self.handle.relative_path
-        for message in sm.open(self).get(
-                "users/{0}/messages?$select=id,subject,webLink".format(
-                        pn))["value"]:
-            yield MSGraphMailMessageHandle(self,
-                    message["id"], message["subject"], message["webLink"])
+        yield from self._read_delta(sm, index, "folders",
+                "users/{0}/mailFolders/delta?$select=id".format(pn),
+                self._update_folder)
+        for folder_id, _, is_folder, _ in index.items_under(""):
+            if not is_folder:
+                continue
+            yield from self._read_delta(sm, index, folder_id,
+                    "users/{0}/mailFolders/{1}/messages/delta"
+                    "?$select=id,subject,webLink".format(pn, folder_id),
+                    self._update_message)
+        index.commit()
+
+    def _read_delta(self, sm, index, key, start, update):
+        link = index.get_property(key)
+        try:
+            yield from self._read_delta_from(sm, index, key, link, start,
+                    update)
+        except Exception as ex:
+            if not link or not DeltaQuery.is_expired(ex):
+                raise
+            # Graph has forgotten about our last query, so start again
+            yield from self._read_delta_from(sm, index, key, None, start,
+                    update)
+
+    def _read_delta_from(self, sm, index, key, link, start, update):
+        # If we're starting from scratch, then we'll see every object that
+        # still exists, and everything else in the index has been deleted
+        seen = set() if not link else None
+        query = DeltaQuery(sm.open(self), link or start)
+        for item in query:
+            if seen is not None:
+                seen.add(item["id"])
+            yield from update(index, key, item)
+
+        if seen is not None:
+            prefix = "" if key == "folders" else key
+            for item_id, path, is_folder, extra in index.items_under(prefix):
+                if key == "folders" and not is_folder:
+                    continue
+                if item_id not in seen:
+                    yield from self._forget(index, item_id,
+                            (path, is_folder, extra))
+        index.set_property(key, query.delta_link)
+
+    def _update_folder(self, index, key, item):
+        if "@removed" in item:
+            record = index.get_item(item["id"])
+            if record:
+                yield from self._forget(index, item["id"], record)
+        else:
+            index.put_item(item["id"], item["id"], True)
+
+    def _update_message(self, index, folder_id, item):
+        record = index.get_item(item["id"])
+        if "@removed" in item:
+            # (Messages that are moved to another folder are removed from
+            # the old one, but we might already have seen them in the new one)
+            if record and record[0] == folder_id + "/" + item["id"]:
+                yield from self._forget(index, item["id"], record)
+        else:
+            extra = {"subject": item["subject"], "weblink": item["webLink"]}
+            index.put_item(
+                    item["id"], folder_id + "/" + item["id"], False, extra)
+            yield self._make_handle(item["id"], extra), False
+
+    def _make_handle(self, message_id, extra):
+        return MSGraphMailMessageHandle(
+                self, message_id, extra["subject"], extra["weblink"])
+
+    def _forget(self, index, item_id, record):
+        path, is_folder, extra = record
+        if is_folder:
+            for child_id, _, _, child_extra in index.items_under(path):
+                yield self._make_handle(child_id, child_extra), True
+                index.remove_item(child_id)
+            index.set_property(item_id, None)
+        else:
+            yield self._make_handle(item_id, extra), True
+        index.remove_item(item_id)
 
 
 class MSGraphMailMessageResource(FileResource):
@@ -104,8 +203,8 @@ class MSGraphMailMessageResource(FileResource):
     def make_path(self):
         with NamedTemporaryResource(self.handle.name) as ntr:
             with ntr.open("wb") as res:
-                with self.make_stream() as s:
-                    res.write(s.read())
+                self._get_cookie().download(
+                        self.make_object_path() + "/$value", res)
             yield ntr.get_path()
 
     @contextmanager
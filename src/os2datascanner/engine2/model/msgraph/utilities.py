@@ -1,9 +1,19 @@
+import json
+from time import sleep
+from itertools import islice
 import requests
+from requests.adapters import HTTPAdapter
+from requests.sessions import Session
 from contextlib import contextmanager
 
+from ... import settings as engine2_settings
+from ...utilities.backoff import run_with_backoff
 from ..core import Source
 
 
+GRAPH_URL = "https://graph.microsoft.com/v1.0/"
+
+
 def _make_token_endpoint(tenant_id):
     return "https://login.microsoftonline.com/{0}/oauth2/v2.0/token".format(
             tenant_id)
@@ -31,19 +41,45 @@ class MSGraphSource(Source):
         response.raise_for_status()
         token = response.json()["access_token"]
 
-        yield MSGraphSource.GraphCaller(token)
+        with MSGraphSource.make_session() as session:
+            yield MSGraphSource.GraphCaller(token, session)
 
     def _list_users(self, sm):
-        return sm.open(self).get("users")
+        yield from sm.open(self).paginate("users")
+
+    @staticmethod
+    def make_session():
+        """Returns a requests Session whose connection pool is big enough for
+        the Microsoft Graph calls of a single pipeline process."""
+        pool_size = engine2_settings.model["msgraph"]["pool_size"]
+        session = Session()
+        adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     class GraphCaller:
-        def __init__(self, token):
+        def __init__(self, token, session=None, *, base_url=GRAPH_URL):
             self._token = token
+            self._session = session or requests
+            self._base_url = base_url
+
+        def _make_url(self, tail):
+            # Graph returns absolute URLs for things like the next page of
+            # results
+            if tail.startswith(("https://", "http://")):
+                return tail
+            return self._base_url + tail
 
-        def get_raw(self, tail):
-            return requests.get(
-                    "https://graph.microsoft.com/v1.0/{0}".format(tail),
-                    headers={"authorization": "Bearer {0}".format(self._token)})
+        def _make_headers(self, headers=None):
+            return dict(headers or {},
+                    authorization="Bearer {0}".format(self._token))
+
+        def get_raw(self, tail, *, headers=None, stream=False):
+            return self._session.get(
+                    self._make_url(tail),
+                    headers=self._make_headers(headers), stream=stream)
 
         def get(self, tail, *, json=True):
             response = self.get_raw(tail)
@@ -54,15 +90,97 @@ class MSGraphSource(Source):
                 return response.content
 
         def head_raw(self, tail):
-            return requests.head(
-                    "https://graph.microsoft.com/v1.0/{0}".format(tail),
-                    headers={"authorization": "Bearer {0}".format(self._token)})
+            return self._session.head(
+                    self._make_url(tail), headers=self._make_headers())
 
         def head(self, tail):
             response = self.head_raw(tail)
             response.raise_for_status()
             return response
 
+        def download(self, tail, fp, *, chunk_size=1024 * 512):
+            """Copies the content of the resource at @tail into the writable
+            file-like object @fp a chunk at a time, without ever holding all
+            of it in memory."""
+            with self.get_raw(tail, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size):
+                    fp.write(chunk)
+
+        def paginate(self, tail):
+            """Yields every object in the collection at @tail, following
+            links to subsequent pages of results."""
+            while tail:
+                page = self.get(tail)
+                yield from page["value"]
+                tail = page.get("@odata.nextLink")
+
+        def get_batch(self, tails, *, ignore=()):
+            """Yields a (tail, object) pair for each of the resources at
+            @tails, retrieving them with as few JSON batch requests as
+            possible.
+
+            Responses with a status code in @ignore are skipped; other failed
+            responses cause a requests.exceptions.HTTPError to be raised.
+            Requests that Graph refuses because of throttling are sent again
+            in a new batch request, waiting as long as Graph asks us to (and
+            backing off exponentially) between attempts."""
+            batch_size = engine2_settings.model["msgraph"]["batch_size"]
+            tails = iter(tails)
+            while True:
+                chunk = list(islice(tails, batch_size))
+                if not chunk:
+                    break
+                results = {}
+                pending = dict(enumerate(chunk))
+                delay = 0
+
+                def _execute_batch():
+                    nonlocal delay
+                    if delay:
+                        sleep(delay)
+                    response = self._session.post(
+                            self._make_url("$batch"),
+                            headers=self._make_headers(),
+                            json={"requests": [
+                                {"id": str(idx), "method": "GET",
+                                        "url": "/" + t}
+                                for idx, t in pending.items()]})
+                    if response.status_code == 429:
+                        delay = _get_retry_after(response.headers)
+                        for idx in pending:
+                            results[idx] = {"status": 429}
+                        raise _Throttled()
+                    response.raise_for_status()
+
+                    delay = 0
+                    for r in response.json()["responses"]:
+                        idx = int(r["id"])
+                        results[idx] = r
+                        if r["status"] == 429:
+                            delay = max(delay,
+                                    _get_retry_after(r.get("headers") or {}))
+                        else:
+                            del pending[idx]
+                    if pending:
+                        raise _Throttled()
+
+                try:
+                    run_with_backoff(_execute_batch, _Throttled, fuzz=0.25)
+                except _Throttled:
+                    # Graph is still refusing some of these requests; let them
+                    # be reported below like any other failure
+                    pass
+
+                for idx, tail in enumerate(chunk):
+                    result = results[idx]
+                    response = _make_response(self._make_url(tail),
+                            result["status"], result.get("body"))
+                    if response.status_code in ignore:
+                        continue
+                    response.raise_for_status()
+                    yield tail, response.json()
+
     def to_json_object(self):
         return dict(**super().to_json_object(), **{
             "client_id": self._client_id,
@@ -71,6 +189,33 @@ class MSGraphSource(Source):
         })
 
 
+class _Throttled(Exception):
+    """Raised when Microsoft Graph has refused to carry out some requests
+    because too many have been made recently."""
+
+
+def _get_retry_after(headers):
+    """Returns the number of seconds that a throttled response says should
+    pass before the request is tried again, or 0 if it doesn't say."""
+    for k, v in headers.items():
+        if k.lower() == "retry-after":
+            try:
+                return max(0, int(v))
+            except ValueError:
+                break
+    return 0
+
+
+def _make_response(url, status, body):
+    """Builds a requests Response object for an individual response to a
+    JSON batch request."""
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    return response
+
+
 @contextmanager
 def ignore_responses(*status_codes):
     try:
@@ -80,3 +225,33 @@ def ignore_responses(*status_codes):
             pass
         else:
             raise
+
+
+class DeltaQuery:
+    """A DeltaQuery iterates over the items returned by a Microsoft Graph
+    delta function, following links to subsequent pages of results.
+
+    Once every item has been returned, the delta_link property contains the
+    link that will return only the items that have changed since."""
+
+    def __init__(self, caller, link):
+        self._caller = caller
+        self._link = link
+        self.delta_link = None
+
+    def __iter__(self):
+        link = self._link
+        while link:
+            page = self._caller.get(link)
+            yield from page["value"]
+            link = page.get("@odata.nextLink")
+            if not link:
+                self.delta_link = page.get("@odata.deltaLink")
+
+    @staticmethod
+    def is_expired(ex):
+        """Indicates whether or not an exception raised while iterating over
+        a DeltaQuery means that its link has expired, and so that the query
+        must be started again from scratch."""
+        return (isinstance(ex, requests.exceptions.HTTPError)
+                and ex.response.status_code == 410)
@@ -1,5 +1,5 @@
 from .core import Source, Handle
-from .file import FilesystemResource
+from .file import FilesystemResource, explore_directory
 
 from os import rmdir
 from regex import compile
@@ -101,6 +101,10 @@ class SMBSource(Source):
                 if f.is_file():
                     yield SMBHandle(self, str(f.relative_to(pathlib_mntdir)))
 
+    def changed_handles(self, sm, index):
+        for path, deleted in explore_directory(sm.open(self), index):
+            yield SMBHandle(self, path), deleted
+
     def to_url(self):
         return make_smb_url(
                 "smb", self._unc, self._user, self._domain, self._password)
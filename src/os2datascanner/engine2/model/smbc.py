@@ -4,7 +4,9 @@ import smbc
 from urllib.parse import quote, unquote, urlsplit
 from datetime import datetime
 from contextlib import contextmanager
+from queue import Queue
 
+from .. import settings as engine2_settings
 from ..utilities.backoff import run_with_backoff
 from ..conversions.types import OutputType
 from ..conversions.utilities.results import MultipleResults
@@ -12,6 +14,9 @@ from .smb import SMBSource, make_smb_url, compute_domain
 from .core import Source, Handle, FileResource
 from .file import stat_attributes
 from .utilities import NamedTemporaryResource
+from .utilities.spool import spooled
+from .utilities.walk import walk, walk_directories
+from .utilities.index import explore_listings
 
 
 class SMBCSource(Source):
@@ -52,6 +57,11 @@ class SMBCSource(Source):
 
     def handles(self, sm):
         url, context = sm.open(self)
+        config = engine2_settings.model["smbc"]
+        if config["workers"] > 1:
+            yield from self._handles_concurrently(url, config)
+            return
+
         def handle_dirent(parents, entity):
             here = parents + [entity]
             path = '/'.join([h.name for h in here])
@@ -70,6 +80,86 @@ class SMBCSource(Source):
         for dent in obj.getdents():
             yield from handle_dirent([], dent)
 
+    @contextmanager
+    def _make_lister(self, url, workers, *, timestamps=False):
+        """Returns a function suitable for use with the walk module that lists
+        the directories of this share, using one connection for each of
+        @workers threads.
+
+        If @timestamps is True, then each file is given its modification
+        timestamp as a third element, and directories that can't be listed
+        give None instead of an empty list (see index.explore_listings)."""
+        # Each thread needs its own smbc.Context, so keep a pool of them
+        contexts = Queue()
+        for _ in range(workers):
+            contexts.put(smbc.Context(auth_fn=self.__auth_handler))
+
+        def list_directory(path):
+            context = contexts.get()
+            try:
+                here = url + "/" + path if path else url
+                listing = []
+                for dent in context.opendir(here).getdents():
+                    if dent.smbc_type == smbc.DIR and dent.name not in (
+                            ".", ".."):
+                        listing.append((dent.name, True, None)
+                                if timestamps else (dent.name, True))
+                    elif dent.smbc_type != smbc.FILE:
+                        continue
+                    elif not timestamps:
+                        listing.append((dent.name, False))
+                    else:
+                        # getdents doesn't give us timestamps, so each file
+                        # must be examined separately. (The stat tuple
+                        # follows the layout of os.stat_result)
+                        try:
+                            listing.append((dent.name, False, context.stat(
+                                    here + "/" + dent.name)[8]))
+                        except smbc.NoEntryError:
+                            # The file was deleted after we listed it
+                            pass
+                return listing
+            except ValueError:
+                # As in the serial walker, subdirectories that can't be
+                # listed are skipped
+                if not path:
+                    raise
+                return None if timestamps else []
+            finally:
+                contexts.put(context)
+
+        try:
+            yield list_directory
+        finally:
+            # See _generate_state for why these references must be removed
+            while not contexts.empty():
+                contexts.get()
+
+    def _handles_concurrently(self, url, config):
+        with self._make_lister(url, config["workers"]) as list_directory:
+            for path in walk(list_directory,
+                    workers=config["workers"], order=config["order"],
+                    max_pending=config["max_pending"]):
+                yield SMBCHandle(self, path)
+
+    def changed_handles(self, sm, index):
+        """Yields (SMBCHandle, deleted) pairs for the files in this share that
+        have changed since the ExplorationIndex @index was last updated.
+
+        As libsmbclient can only give us the timestamps of files one at a
+        time, every directory is listed, and the files in it examined, by
+        the concurrent walker, using as many connections as the [model.smbc]
+        settings allow."""
+        url, _ = sm.open(self)
+        config = engine2_settings.model["smbc"]
+        with self._make_lister(url, config["workers"],
+                timestamps=True) as list_directory:
+            for path, deleted in explore_listings(index,
+                    walk_directories(list_directory,
+                            workers=config["workers"], order=config["order"],
+                            max_pending=config["max_pending"])):
+                yield SMBCHandle(self, path), deleted
+
     def to_url(self):
         return make_smb_url(
                 "smbc", self._unc, self._user, self._domain, self._password)
@@ -164,6 +254,7 @@ class _SMBCFile(io.RawIOBase):
         return True
 
 
+@spooled(streams=False)
 class SMBCResource(FileResource):
     def __init__(self, handle, sm):
         super().__init__(handle, sm)
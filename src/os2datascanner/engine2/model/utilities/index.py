@@ -0,0 +1,254 @@
+import json
+import zlib
+import sqlite3
+import os.path
+from hashlib import sha256
+
+from ... import settings as engine2_settings
+
+
+class ExplorationIndex:
+    """An ExplorationIndex is an on-disk record of the directories of a
+    hierarchy that were seen the last time it was explored: the names, types
+    and modification timestamps of their children.
+
+    Sources whose objects are identified by stable IDs rather than by their
+    position in a hierarchy can instead use an index to store the IDs and
+    paths of those objects, along with named properties (like the tokens used
+    to resume a change-tracking query).
+
+    Indices are SQLite databases with one row per directory or object, whose
+    list of children is stored as compressed JSON. Changes made to an index
+    are only saved when its commit method is called. (An index whose path is
+    ":memory:" is never saved.)"""
+
+    def __init__(self, path):
+        self._path = path
+        self._db = None
+
+    def _get_db(self):
+        if not self._db:
+            self._db = sqlite3.connect(self._path, timeout=60)
+            self._db.execute("""
+                    create table if not exists directories (
+                        path text primary key,
+                        mtime real,
+                        entries blob)""")
+            self._db.execute("""
+                    create table if not exists properties (
+                        key text primary key,
+                        value text)""")
+            self._db.execute("""
+                    create table if not exists items (
+                        id text primary key,
+                        path text,
+                        folder integer,
+                        extra text)""")
+            self._db.execute("""
+                    create index if not exists items_path on items (path)""")
+        return self._db
+
+    def get_property(self, key, default=None):
+        row = self._get_db().execute(
+                "select value from properties where key = ?",
+                (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_property(self, key, value):
+        """Records a JSON-serialisable value under the given key, or forgets
+        the key if the value is None."""
+        if value is None:
+            self._get_db().execute(
+                    "delete from properties where key = ?", (key,))
+        else:
+            self._get_db().execute(
+                    "insert or replace into properties values (?, ?)",
+                    (key, json.dumps(value)))
+
+    def get_item(self, item_id):
+        """Returns a (path, is_folder, extra) tuple for the object with the
+        given ID, or None if it isn't in this index."""
+        row = self._get_db().execute(
+                "select path, folder, extra from items where id = ?",
+                (item_id,)).fetchone()
+        if not row:
+            return None
+        path, folder, extra = row
+        return (path, bool(folder), json.loads(extra))
+
+    def put_item(self, item_id, path, is_folder, extra=None):
+        """Records the path of the object with the given ID, whether or not it
+        is a folder, and an optional JSON-serialisable extra value."""
+        self._get_db().execute(
+                "insert or replace into items values (?, ?, ?, ?)",
+                (item_id, path, int(is_folder), json.dumps(extra)))
+
+    def remove_item(self, item_id):
+        self._get_db().execute("delete from items where id = ?", (item_id,))
+
+    def items_under(self, path):
+        """Returns a list of (ID, path, is_folder, extra) tuples for every
+        object recorded in this index whose path is below @path."""
+        prefix = path + "/" if path else ""
+        return [(item_id, item_path, bool(folder), json.loads(extra))
+                for item_id, item_path, folder, extra
+                in self._get_db().execute(
+                        "select id, path, folder, extra from items"
+                        " where substr(path, 1, ?) = ? and path != ?",
+                        (len(prefix), prefix, path))]
+
+    def get(self, path):
+        """Returns a (timestamp, entries) pair for the directory at @path, or
+        None if it isn't in this index. The entries value is a dictionary
+        mapping each child's name to an (is_directory, timestamp) pair."""
+        row = self._get_db().execute(
+                "select mtime, entries from directories where path = ?",
+                (path,)).fetchone()
+        if not row:
+            return None
+        mtime, entries = row
+        return (mtime, {name: (is_directory, entry_mtime)
+                for name, is_directory, entry_mtime
+                in json.loads(zlib.decompress(entries).decode())})
+
+    def put(self, path, mtime, entries):
+        """Records the timestamp and entries of the directory at @path. (See
+        the get method for the format of the entries.)"""
+        blob = zlib.compress(json.dumps(
+                [[name, is_directory, entry_mtime]
+                        for name, (is_directory, entry_mtime)
+                        in entries.items()],
+                separators=(",", ":")).encode())
+        self._get_db().execute(
+                "insert or replace into directories values (?, ?, ?)",
+                (path, mtime, blob))
+
+    def files_under(self, path):
+        """Yields the path of every file recorded in this index below the
+        directory at @path."""
+        record = self.get(path)
+        if record:
+            for name, (is_directory, _) in record[1].items():
+                here = join_path(path, name)
+                if is_directory:
+                    yield from self.files_under(here)
+                else:
+                    yield here
+
+    def remove(self, path):
+        """Removes the directory at @path, and all of its descendants, from
+        this index."""
+        prefix = path + "/" if path else ""
+        self._get_db().execute(
+                "delete from directories where path = ?"
+                " or substr(path, 1, ?) = ?",
+                (path, len(prefix), prefix))
+
+    def commit(self):
+        if self._db:
+            self._db.commit()
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def for_scan_spec(cls, scan_spec):
+        """Returns the ExplorationIndex for the scanner and Source of the given
+        scan specification, or None if exploration indices are disabled."""
+        directory = engine2_settings.pipeline["explorer"]["index_path"]
+        if not directory:
+            return None
+        scanner = scan_spec.scan_tag.get("scanner") or {}
+        key = sha256(json.dumps([
+            scanner.get("pk"),
+            scan_spec.source.to_json_object()
+        ], sort_keys=True).encode()).hexdigest()
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, key + ".sqlite"))
+
+
+def join_path(path, name):
+    return path + "/" + name if path else name
+
+
+def _deletions(index, path, old_entries, entries):
+    """Yields a (path, True) pair for every file that was recorded in the
+    entries of the directory at @path, or below one of its subdirectories,
+    but that is no longer present, and removes those subdirectories from
+    @index."""
+    for name, (is_directory, _) in old_entries.items():
+        if entries.get(name, (None,))[0] == is_directory:
+            continue
+        here = join_path(path, name)
+        if is_directory:
+            for deleted in index.files_under(here):
+                yield deleted, True
+            index.remove(here)
+        else:
+            yield here, True
+
+
+def explore(index, list_directory):
+    """Explores a directory hierarchy, using and updating the
+    ExplorationIndex @index, and yields a (path, deleted) pair for every file
+    that has been created, changed or deleted since the index was last
+    updated.
+
+    @list_directory will be called with the path of a directory, relative to
+    the root of the hierarchy (whose path is the empty string), and should
+    return a list of (name, is_directory, timestamp) tuples for its contents,
+    or None if the directory couldn't be read. (The timestamps of files must
+    be present; those of directories are ignored.)
+
+    Every directory is listed again, as changing a file doesn't always
+    change the timestamp of its directory, and listing a directory is the
+    cheapest way to get the timestamps of all of its files. The index is
+    committed only after the whole hierarchy has been explored."""
+    def _walk(path):
+        listing = list_directory(path)
+        yield path, listing
+        for name, is_directory, _ in listing or ():
+            if is_directory:
+                yield from _walk(join_path(path, name))
+
+    return explore_listings(index, _walk(""))
+
+
+def explore_listings(index, listings):
+    """As explore, but takes an iterable of (path, entries) pairs giving the
+    contents of every directory in a hierarchy instead of listing them on
+    demand. (This lets the listings, and the timestamps of the files in
+    them, be fetched several directories at a time: see the
+    walk.walk_directories function.)
+
+    Each entries value should be a list of (name, is_directory, timestamp)
+    tuples, in which the timestamps of files must be present, or None if the
+    directory couldn't be read. A directory must appear after its parent."""
+    for path, listing in listings:
+        if listing is None:
+            # Leave whatever we knew about this directory in place
+            continue
+        old = index.get(path)
+        old_entries = old[1] if old else {}
+
+        entries = {}
+        for name, is_directory, entry_mtime in listing:
+            if is_directory:
+                entries[name] = (True, None)
+            else:
+                entries[name] = (False, entry_mtime)
+                if old_entries.get(name) != (False, entry_mtime):
+                    yield join_path(path, name), False
+
+        yield from _deletions(index, path, old_entries, entries)
+
+        index.put(path, None, entries)
+    index.commit()
@@ -0,0 +1,30 @@
+from os import getpid, kill, scandir
+from shutil import rmtree
+from tempfile import gettempdir, mkdtemp
+from contextlib import closing
+
+
+def make_process_directory(prefix):
+    """Creates and returns the path to a new temporary directory whose name
+    starts with @prefix and records the ID of the current process, so that
+    remove_orphans can later tell whether or not it's still in use."""
+    return mkdtemp(prefix="{0}{1}-".format(prefix, getpid()))
+
+
+def remove_orphans(prefix):
+    """Deletes the directories made by make_process_directory(@prefix) for
+    processes that have since died without cleaning up after themselves."""
+    with closing(scandir(gettempdir())) as file_iterator:
+        for entry in file_iterator:
+            if not entry.name.startswith(prefix):
+                continue
+            try:
+                pid = int(entry.name[len(prefix):].split("-")[0])
+                kill(pid, 0)
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                rmtree(entry.path, ignore_errors=True)
+            except PermissionError:
+                # Someone else's process is still running
+                pass
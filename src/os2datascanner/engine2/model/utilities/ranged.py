@@ -0,0 +1,129 @@
+import io
+
+from prometheus_client import Counter
+
+from ... import settings as engine2_settings
+
+
+ranged_requests = Counter(
+        "os2datascanner_ranged_requests",
+        "Range requests made to read part of the content of a remote"
+        " resource",
+        ["type_label"])
+ranged_bytes_fetched = Counter(
+        "os2datascanner_ranged_bytes_fetched",
+        "Bytes of content fetched by range requests",
+        ["type_label"])
+
+
+class RangedFile(io.RawIOBase):
+    """A RangedFile is a read-only, seekable stream over the content of a
+    remote resource of a known size. Each read is satisfied by calling the
+    @get_range function, which should return the bytes from offset @start to
+    offset @end (inclusive), so only those parts of the content that are
+    actually read are ever downloaded.
+
+    The bytes_fetched and requests properties record how much of the
+    resource has been downloaded, and how many times get_range was called to
+    download it."""
+
+    def __init__(self, get_range, size, *, type_label="unknown"):
+        self._get_range = get_range
+        self._size = size
+        self._type_label = type_label
+        self._pos = 0
+        self.bytes_fetched = 0
+        self.requests = 0
+
+    def _fetch(self, start, end):
+        data = self._get_range(start, end)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        ranged_requests.labels(self._type_label).inc()
+        ranged_bytes_fetched.labels(self._type_label).inc(len(data))
+        return data
+
+    def readinto(self, b):
+        count = min(len(b), self._size - self._pos)
+        if count <= 0:
+            return 0
+        data = self._fetch(self._pos, self._pos + count - 1)
+        count = len(data)
+        b[0:count] = data
+        self._pos += count
+        return count
+
+    def readall(self):
+        # Fetch everything that's left in one go rather than a buffer at a
+        # time
+        if self._pos >= self._size:
+            return b""
+        data = self._fetch(self._pos, self._size - 1)
+        self._pos += len(data)
+        return data
+
+    def write(self, bytes):
+        raise TypeError("RangedFile is read-only")
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._size
+        if pos < 0:
+            raise ValueError("negative seek position", pos)
+        self._pos = pos
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def truncate(self, n=None):
+        raise TypeError("RangedFile is read-only")
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def seekable(self):
+        return True
+
+
+def open_ranged(get_range, size, *, type_label="unknown", buffer_size=None):
+    """Returns a buffered, seekable stream over a new RangedFile.
+
+    Wrapping the RangedFile in a buffer means that small reads (like the one
+    FileResource.compute_type makes) fetch only a buffer's worth of the
+    content, while bigger ones are passed straight through as bigger range
+    requests."""
+    return io.BufferedReader(
+            RangedFile(get_range, size, type_label=type_label),
+            buffer_size or engine2_settings.model["ranged"]["buffer_size"])
+
+
+def is_ranged(fp):
+    """Indicates whether or not the stream @fp reads its content with range
+    requests, and so whether or not random access to it is cheap even though
+    it refers to a remote resource."""
+    return isinstance(getattr(fp, "raw", fp), RangedFile)
+
+
+def http_range_getter(get, url, **kwargs):
+    """Returns a function, suitable for use with RangedFile, that retrieves
+    part of the resource at @url with a HTTP range request made by the
+    requests-style @get function (which will also be given @kwargs).
+
+    Servers that ignore the Range header and return the whole resource are
+    tolerated, although reading from them is of course no cheaper."""
+    def _get_range(start, end):
+        response = get(url, headers={
+            "Range": "bytes={0}-{1}".format(start, end)
+        }, **kwargs)
+        response.raise_for_status()
+        data = response.content
+        if response.status_code != 206:
+            data = data[start:end + 1]
+        return data
+    return _get_range
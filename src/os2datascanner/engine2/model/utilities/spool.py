@@ -0,0 +1,273 @@
+from os import getpid, link
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from functools import wraps
+from threading import Lock
+from contextlib import contextmanager
+from collections import OrderedDict
+import atexit
+import os.path
+
+from prometheus_client import Counter
+
+from ... import settings as engine2_settings
+from .orphans import make_process_directory, remove_orphans
+
+
+spool_bytes_downloaded = Counter(
+        "os2datascanner_spool_bytes_downloaded",
+        "Bytes of content downloaded from a remote source and put into the"
+        " local content spool",
+        ["type_label"])
+spool_bytes_served = Counter(
+        "os2datascanner_spool_bytes_served",
+        "Bytes of content served from the local content spool instead of"
+        " being downloaded again",
+        ["type_label"])
+
+
+class _Entry:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.users = 0
+
+
+class Spool:
+    """A Spool is a per-process store of local copies of the content of
+    remote resources, so that the content of an object needs to be
+    downloaded only once even when several stages of the pipeline running in
+    the same process want to look at it.
+
+    Copies are keyed by a Handle and the last modification date of the
+    resource it refers to. (The date is only asked for when a copy might be
+    made or used, so reading a stream for an object that isn't in the spool
+    costs nothing extra.) When the total size of the spool exceeds its
+    limit, the least recently used copies that aren't in use are deleted;
+    objects bigger than the limit are never kept. A spool whose limit is
+    zero is disabled."""
+
+    PREFIX = "os2ds-spool-"
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._lock = Lock()
+        self._pid = None
+        self._path = None
+        self._entries = OrderedDict()
+        # Handle -> number of entries for it
+        self._handles = {}
+        self._size = 0
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return engine2_settings.model["spool"]["max_size"]
+
+    def _check_process(self):
+        # Should be called with self._lock held
+        if self._pid != getpid():
+            # This is a new process (or a fork of the process that last used
+            # this spool, in which case the parent still owns the existing
+            # directory)
+            self._pid = getpid()
+            self._path = None
+            self._entries = OrderedDict()
+            self._handles = {}
+            self._size = 0
+            remove_orphans(self.PREFIX)
+            atexit.register(self.close)
+        if self._path is None:
+            self._path = make_process_directory(self.PREFIX)
+
+    def _acquire(self, key):
+        """Returns the entry for @key, marked as in use, or None if there
+        isn't one."""
+        with self._lock:
+            self._check_process()
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                entry.users += 1
+            return entry
+
+    def _release(self, key, entry):
+        with self._lock:
+            entry.users -= 1
+            if self._entries.get(key) is not entry and not entry.users:
+                # This entry was never kept, or has been replaced
+                rmtree(os.path.dirname(entry.path), ignore_errors=True)
+            else:
+                self._evict()
+
+    def _store(self, key, path, name):
+        """Copies the file at @path into the spool and returns a new entry,
+        marked as in use, for it."""
+        with self._lock:
+            self._check_process()
+            directory = mkdtemp(dir=self._path)
+        spool_path = os.path.join(directory, name)
+        try:
+            # Both files are normally in the temporary directory, in which
+            # case a hard link saves us from copying the content again
+            link(path, spool_path)
+        except OSError:
+            copyfile(path, spool_path)
+        entry = _Entry(spool_path, os.path.getsize(spool_path))
+        entry.users += 1
+
+        with self._lock:
+            if entry.size <= self.max_size and key not in self._entries:
+                self._entries[key] = entry
+                self._handles[key[0]] = self._handles.get(key[0], 0) + 1
+                self._size += entry.size
+        return entry
+
+    def _evict(self):
+        # Should be called with self._lock held
+        for key, entry in list(self._entries.items()):
+            if self._size <= self.max_size:
+                break
+            elif entry.users:
+                continue
+            del self._entries[key]
+            self._handles[key[0]] -= 1
+            if not self._handles[key[0]]:
+                del self._handles[key[0]]
+            self._size -= entry.size
+            rmtree(os.path.dirname(entry.path), ignore_errors=True)
+
+    def _contains(self, handle):
+        """Indicates whether or not this spool might have a copy of the
+        object referred to by @handle."""
+        with self._lock:
+            return self._pid == getpid() and handle in self._handles
+
+    @staticmethod
+    def _make_key(resource):
+        last_modified = resource.get_last_modified()
+        if last_modified is None or last_modified.value is None:
+            return None
+        return (resource.handle, last_modified.value)
+
+    @contextmanager
+    def make_path(self, resource, make_path):
+        """Returns a context manager that yields the path to a spooled copy
+        of the content of @resource, calling the @make_path function to
+        produce one if necessary."""
+        key = self._make_key(resource) if self.max_size > 0 else None
+        if key is None:
+            with make_path() as p:
+                yield p
+            return
+
+        type_label = resource.handle.type_label
+        entry = self._acquire(key)
+        if entry:
+            spool_bytes_served.labels(type_label).inc(entry.size)
+        else:
+            with make_path() as p:
+                entry = self._store(key, p, resource.handle.name)
+            spool_bytes_downloaded.labels(type_label).inc(entry.size)
+        try:
+            yield entry.path
+        finally:
+            self._release(key, entry)
+
+    @contextmanager
+    def make_stream(self, resource, make_path, make_stream, *, fill=True):
+        """Returns a context manager that yields a readable file-like object
+        for the content of @resource. Spooled copies are always used if
+        they're available; otherwise, if @fill is true, a copy is made with
+        the @make_path function, and if not, the @make_stream function is
+        used to read the content directly."""
+        key = None
+        if self.max_size > 0 and (fill or self._contains(resource.handle)):
+            key = self._make_key(resource)
+        if key is not None:
+            entry = self._acquire(key)
+            if entry:
+                spool_bytes_served.labels(
+                        resource.handle.type_label).inc(entry.size)
+                try:
+                    with open(entry.path, "rb") as fp:
+                        yield fp
+                finally:
+                    self._release(key, entry)
+                return
+        if key is None or not fill:
+            with make_stream() as fp:
+                yield fp
+            return
+
+        with self.make_path(resource, make_path) as p:
+            with open(p, "rb") as fp:
+                yield fp
+
+    def close(self):
+        """Deletes this process's spool directory and everything in it."""
+        with self._lock:
+            if self._pid == getpid() and self._path:
+                rmtree(self._path, ignore_errors=True)
+                self._path = None
+                self._entries = OrderedDict()
+                self._handles = {}
+                self._size = 0
+
+
+_spool = Spool()
+
+
+def spooled(*, streams=True, spool=None):
+    """Returns a class decorator for FileResource subclasses that keeps the
+    files made by their make_path methods in a Spool (by default, the one
+    shared by this process) and reuses them for later calls to make_path or
+    make_stream on any Resource for the same object.
+
+    If @streams is false, make_stream will use a spooled copy if one exists,
+    but will never download the whole object just to fill the spool; this is
+    useful for resources whose streams can cheaply read only part of an
+    object."""
+    def _decorator(cls):
+        original_make_path = cls.make_path
+        original_make_stream = cls.make_stream
+
+        @contextmanager
+        @wraps(original_make_path)
+        def make_path(self):
+            if getattr(self, "_spooling", False):
+                # The original make_path is calling into our make_stream (or
+                # vice versa): don't try to fill the spool twice
+                with original_make_path(self) as p:
+                    yield p
+                return
+
+            @contextmanager
+            def _make_path():
+                self._spooling = True
+                try:
+                    with original_make_path(self) as p:
+                        yield p
+                finally:
+                    self._spooling = False
+            with (spool or _spool).make_path(self, _make_path) as p:
+                yield p
+
+        @contextmanager
+        @wraps(original_make_stream)
+        def make_stream(self):
+            if getattr(self, "_spooling", False):
+                with original_make_stream(self) as fp:
+                    yield fp
+                return
+            with (spool or _spool).make_stream(self,
+                    lambda: make_path(self),
+                    lambda: original_make_stream(self),
+                    fill=streams) as fp:
+                yield fp
+
+        cls.make_path = make_path
+        cls.make_stream = make_stream
+        return cls
+    return _decorator
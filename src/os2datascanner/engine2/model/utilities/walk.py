@@ -0,0 +1,184 @@
+import json
+from threading import Lock
+from tempfile import TemporaryFile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SpillQueue:
+    """A SpillQueue is a first-in, first-out queue of JSON-serialisable
+    objects that keeps at most a fixed number of them in memory, writing the
+    rest to a temporary file."""
+
+    def __init__(self, limit):
+        self._limit = max(limit, 1)
+        self._memory = deque()
+        self._file = None
+        self._read_pos = self._write_pos = 0
+        self._spilled = 0
+
+    def __len__(self):
+        return len(self._memory) + self._spilled
+
+    def append(self, item):
+        if not self._spilled and len(self._memory) < self._limit:
+            self._memory.append(item)
+        else:
+            # Once something has been spilled, everything after it must be
+            # spilled as well to preserve the order of the queue
+            if not self._file:
+                self._file = TemporaryFile("w+t", encoding="utf-8")
+            self._file.seek(self._write_pos)
+            self._file.write(json.dumps(item) + "\n")
+            self._write_pos = self._file.tell()
+            self._spilled += 1
+
+    def popleft(self):
+        if not self._memory and self._spilled:
+            self._file.seek(self._read_pos)
+            while self._spilled and len(self._memory) < self._limit:
+                self._memory.append(json.loads(self._file.readline()))
+                self._spilled -= 1
+            self._read_pos = self._file.tell()
+            if not self._spilled:
+                self._file.seek(0)
+                self._file.truncate()
+                self._read_pos = self._write_pos = 0
+        return self._memory.popleft()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def _join(path, name):
+    return path + "/" + name if path else name
+
+
+def walk(list_directory, *,
+        workers=1, order="depth-first", max_pending=10000):
+    """Yields the path of every file in a directory hierarchy, listing up to
+    @workers directories at the same time.
+
+    @list_directory will be called (possibly from several threads at once)
+    with the path of a directory, relative to the root of the hierarchy, and
+    should return a list of (name, is_directory) pairs for its contents. The
+    root's path is the empty string.
+
+    If @order is "depth-first", the paths are yielded in the same order as a
+    recursive depth-first walk of the hierarchy would give; if it's
+    "breadth-first", then every file in a directory is yielded before any of
+    the files in its subdirectories. In both cases, at most @max_pending
+    directories will be waiting in memory to be walked at any one time (in
+    breadth-first mode, the rest are written to a temporary file)."""
+    for path, is_directory, _ in _walk(
+            list_directory, workers, order, max_pending):
+        if not is_directory:
+            yield path
+
+
+def walk_directories(list_directory, *,
+        workers=1, order="depth-first", max_pending=10000):
+    """As walk, but yields a (path, entries) pair for every directory in the
+    hierarchy, where entries is the value returned by @list_directory for
+    that directory. A directory is always yielded before its subdirectories.
+
+    The entries returned by @list_directory can be tuples of any length, as
+    long as they begin with the name and type of the entry; they can also be
+    None, in which case the directory is treated as empty."""
+    for path, is_directory, entries in _walk(
+            list_directory, workers, order, max_pending):
+        if is_directory:
+            yield path, entries
+
+
+def _walk(list_directory, workers, order, max_pending):
+    if order == "depth-first":
+        return _walk_depth_first(list_directory, workers, max_pending)
+    elif order == "breadth-first":
+        return _walk_breadth_first(list_directory, workers, max_pending)
+    else:
+        raise ValueError("unknown exploration order", order)
+
+
+def _walk_depth_first(list_directory, workers, max_pending):
+    lock = Lock()
+    futures = {}
+    closed = False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def fetch(path):
+            """Lists the directory at @path, and also starts to list its
+            subdirectories (so that they're ready by the time the walk
+            reaches them) if there's room to do so."""
+            entries = list_directory(path)
+            with lock:
+                for name, is_directory, *_ in entries or []:
+                    if closed or len(futures) >= max_pending:
+                        break
+                    elif is_directory:
+                        sub = _join(path, name)
+                        futures[sub] = executor.submit(fetch, sub)
+            return entries
+
+        def get(path):
+            with lock:
+                future = futures.pop(path, None)
+            return future.result() if future else fetch(path)
+
+        def visit(path):
+            entries = get(path)
+            stack.append((path, iter(entries or [])))
+            return path, True, entries
+
+        try:
+            stack = []
+            yield visit("")
+            while stack:
+                path, entries = stack[-1]
+                for name, is_directory, *_ in entries:
+                    sub = _join(path, name)
+                    if is_directory:
+                        yield visit(sub)
+                        break
+                    else:
+                        yield sub, False, None
+                else:
+                    stack.pop()
+        finally:
+            # If we're stopping early, don't bother listing any more
+            # directories
+            with lock:
+                closed = True
+                for future in futures.values():
+                    future.cancel()
+                futures.clear()
+
+
+def _walk_breadth_first(list_directory, workers, max_pending):
+    pending = SpillQueue(max_pending)
+    pending.append("")
+    in_flight = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < workers * 2:
+                    path = pending.popleft()
+                    in_flight.append(
+                            (path, executor.submit(list_directory, path)))
+
+                path, future = in_flight.popleft()
+                entries = future.result()
+                yield path, True, entries
+                for name, is_directory, *_ in entries or []:
+                    sub = _join(path, name)
+                    if is_directory:
+                        pending.append(sub)
+                    else:
+                        yield sub, False, None
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            pending.close()
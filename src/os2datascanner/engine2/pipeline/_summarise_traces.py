@@ -0,0 +1,76 @@
+import os.path
+import argparse
+from glob import glob
+from json import loads
+
+from .. import settings as engine2_settings
+from .utilities.tracing import read_spans, summarise
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.description = (
+            "Summarise the trace spans recorded by the pipeline, listing the"
+            " objects and stages that took the longest.")
+
+    parser.add_argument(
+            "path",
+            nargs="*",
+            metavar="PATH",
+            help="the span files, or directories of span files, to read",
+            default=[engine2_settings.pipeline["tracing"]["path"]])
+    parser.add_argument(
+            "--scan-tag",
+            metavar="TAG",
+            help="only include objects from the scan with this tag (either"
+                    " a JSON value or, for scan tags produced by the"
+                    " administration system, the time of the scan)",
+            default=None)
+    parser.add_argument(
+            "--limit",
+            type=int,
+            metavar="COUNT",
+            help="list at most %(metavar)s objects",
+            default=10)
+
+    args = parser.parse_args()
+
+    scan_tag = args.scan_tag
+    if scan_tag is not None:
+        try:
+            scan_tag = loads(scan_tag)
+        except ValueError:
+            pass
+
+    paths = []
+    for path in args.path:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob(os.path.join(path, "*.jsonl"))))
+        elif path:
+            paths.append(path)
+    if not paths:
+        parser.error("no span files found")
+
+    spans = (s for path in paths for s in read_spans(path))
+    objects, stages = summarise(spans, scan_tag)
+
+    print("Slowest objects ({0} traced):".format(len(objects)))
+    print("{0:>10} {1:>10}  {2}".format("total (s)", "own (s)", "object"))
+    for obj in objects[:args.limit]:
+        print("{0:>10.3f} {1:>10.3f}  {2} [{3}]".format(
+                obj["total"], obj["own"],
+                obj["object"] or "(exploration of a source)", obj["trace_id"]))
+
+    print()
+    print("Slowest stages:")
+    print("{0:>10} {1:>8} {2:>10} {3:>10}  {4}".format(
+            "total (s)", "count", "mean (s)", "max (s)", "stage"))
+    for stage in stages:
+        print("{0:>10.3f} {1:>8} {2:>10.3f} {3:>10.3f}  {4}/{5}".format(
+                stage["total"], stage["count"], stage["mean"], stage["max"],
+                stage["stage"], stage["name"]))
+
+
+if __name__ == "__main__":
+    main()
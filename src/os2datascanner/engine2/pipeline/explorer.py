@@ -1,19 +1,33 @@
 from os import getpid
+from time import time, perf_counter
 
-from prometheus_client import start_http_server
+from prometheus_client import Counter, Histogram, start_http_server
 
 from ..model.core import (Source, SourceManager, UnknownSchemeError,
         DeserialisationError)
+from ..model.utilities.index import ExplorationIndex
 from . import messages
-from .utilities.args import (make_common_argument_parser,
-        make_sourcemanager_configuration_block)
+from .utilities.args import (AppendReplaceAction, make_common_argument_parser,
+        make_pipeline_runner_arguments, make_sourcemanager_configuration_block)
 from .utilities.pika import PikaPipelineRunner
 from .utilities.systemd import notify_ready, notify_stopping
 from .utilities.prometheus import prometheus_summary
+from .utilities import tracing
+from ..utilities.metrics import SECONDS_BUCKETS
+
+
+explorer_handles = Counter(
+        "os2datascanner_explorer_handles",
+        "Objects found by exploring Sources",
+        ["type_label"])
+exploration_seconds = Histogram(
+        "os2datascanner_exploration_seconds",
+        "Time spent exploring a single Source",
+        ["type_label"], buckets=SECONDS_BUCKETS)
 
 
 def message_received_raw(
-        body, channel, source_manager, conversions_q, problems_q, status_q):
+        body, channel, source_manager, conversions_q, problems_qs, status_q):
     try:
         scan_tag = body["scan_tag"]
     except KeyError:
@@ -30,21 +44,44 @@ def message_received_raw(
         else:
             progress = messages.ProgressFragment(
                     rule=scan_spec.rule, matches=[])
+
+        # A scan spec for a derived source carries the trace of the object it
+        # was derived from; exploring it is part of handling that object
+        trace_id = scan_spec.trace_id or tracing.new_trace_id()
+        scan_spec = scan_spec._replace(trace_id=None)
     except UnknownSchemeError as ex:
-        yield (problems_q, messages.ProblemMessage(
-                scan_tag=scan_tag, source=None, handle=None,
-                message=("Unknown scheme '{0}'".format(
-                        ex.args[0]))).to_json_object())
+        for problems_q in problems_qs:
+            yield (problems_q, messages.ProblemMessage(
+                    scan_tag=scan_tag, source=None, handle=None,
+                    message=("Unknown scheme '{0}'".format(
+                            ex.args[0]))).to_json_object())
         return
     except (KeyError, DeserialisationError) as ex:
-        yield (problems_q, messages.ProblemMessage(
-                scan_tag=scan_tag, source=None, handle=None,
-                message="Malformed input").to_json_object())
+        for problems_q in problems_qs:
+            yield (problems_q, messages.ProblemMessage(
+                    scan_tag=scan_tag, source=None, handle=None,
+                    message="Malformed input").to_json_object())
         return
 
+    # Scans of directory hierarchies can ask to be told only about the objects
+    # that have changed since the last "incremental" exploration. (A "full"
+    # exploration finds everything anyway, so it doesn't need the index, and
+    # it leaves the index alone for the next incremental exploration)
+    exploration = scan_spec.configuration.get("exploration")
+    index = None
+    if exploration == "incremental":
+        index = ExplorationIndex.for_scan_spec(scan_spec)
+
     count = 0
+    type_label = scan_spec.source.type_label
+    started, start = time(), perf_counter()
     try:
-        for handle in scan_spec.source.handles(source_manager):
+        if index:
+            changes = scan_spec.source.changed_handles(source_manager, index)
+        else:
+            changes = ((handle, False)
+                    for handle in scan_spec.source.handles(source_manager))
+        for handle, deleted in changes:
             try:
                 print(handle.censor())
             except NotImplementedError:
@@ -52,17 +89,41 @@ def message_received_raw(
                 # that it doesn't know enough about its internal state to
                 # censor itself -- just print its type
                 print("(unprintable {0})".format(type(handle).__name__))
+            if deleted:
+                # Tell the rest of the system that this object has gone away
+                for problems_q in problems_qs:
+                    yield (problems_q, messages.ProblemMessage(
+                            scan_tag=scan_tag, source=None, handle=handle,
+                            missing=True,
+                            message="Resource deleted").to_json_object())
+                continue
             count += 1
+            explorer_handles.labels(type_label).inc()
+            child_id = trace_id and tracing.new_trace_id()
+            if child_id:
+                tracing.record(child_id, "explorer", "found", time(), 0,
+                        scan_tag=scan_tag, parent=trace_id,
+                        object=str(handle.presentation),
+                        type_label=type_label)
             yield (conversions_q,
                     messages.ConversionMessage(
-                            scan_spec, handle, progress).to_json_object())
+                            scan_spec, handle, progress,
+                            trace_id=child_id).to_json_object())
     except Exception as e:
         exception_message = ", ".join([str(a) for a in e.args])
-        yield (problems_q, messages.ProblemMessage(
-                scan_tag=scan_tag, source=scan_spec.source, handle=None,
-                message="Exploration error: {0}".format(
-                        exception_message)).to_json_object())
+        for problems_q in problems_qs:
+            yield (problems_q, messages.ProblemMessage(
+                    scan_tag=scan_tag, source=scan_spec.source, handle=None,
+                    message="Exploration error: {0}".format(
+                            exception_message)).to_json_object())
     finally:
+        exploration_seconds.labels(type_label).observe(
+                perf_counter() - start)
+        tracing.record(trace_id, "explorer", "explore", started,
+                perf_counter() - start, scan_tag=scan_tag,
+                type_label=type_label, objects=count)
+        if index:
+            index.close()
         if status_q:
             yield (status_q, messages.StatusMessage(
                     scan_tag=scan_tag, total_objects=count).to_json_object())
@@ -91,10 +152,11 @@ def main():
             default="os2ds_conversions")
     outputs.add_argument(
             "--problems",
+            action=AppendReplaceAction,
             metavar="NAME",
-            help="the name of the AMQP queue to which problems should be"
+            help="the names of the AMQP queues to which problems should be"
                     + " written",
-            default="os2ds_problems")
+            default=["os2ds_problems", "os2ds_checkups"])
     outputs.add_argument(
             "--status",
             metavar="NAME",
@@ -109,6 +171,8 @@ def main():
 
 
     class ExplorerRunner(PikaPipelineRunner):
+        trace_stage = "explorer"
+
         @prometheus_summary(
                 "os2datascanner_pipeline_explorer", "Sources explored")
         def handle_message(self, body, *, channel=None):
@@ -121,10 +185,11 @@ def main():
     with SourceManager(width=args.width) as source_manager:
         with ExplorerRunner(
                 read=[args.sources],
-                write=[args.conversions, args.problems,
+                write=[args.conversions, *args.problems,
                         *([args.status] if args.status else [])],
                 source_manager=source_manager,
-                heartbeat=6000) as runner:
+                heartbeat=6000,
+                **make_pipeline_runner_arguments(args)) as runner:
             try:
                 print("Start")
                 notify_ready()
@@ -7,35 +7,40 @@ from prometheus_client import start_http_server
 from ..model.core import (Handle,
         Source, UnknownSchemeError, DeserialisationError)
 from . import messages
-from .utilities.args import make_common_argument_parser
+from .utilities.args import (make_common_argument_parser,
+        make_pipeline_runner_arguments)
 from .utilities.pika import PikaPipelineRunner
 from .utilities.systemd import notify_ready, notify_stopping
 from .utilities.prometheus import prometheus_summary
+from .utilities import tracing
 
 
 def message_received_raw(body, channel, dump, results_q):
     body["origin"] = channel
 
-    message = None
-    if "metadata" in body:
-        message = messages.MetadataMessage.from_json_object(body)
-        # MetadataMessages carry a scan tag rather than a complete scan spec,
-        # so all we need to censor is the handle
-        message = message._replace(handle=message.handle.censor())
-    elif "matched" in body:
-        message = messages.MatchesMessage.from_json_object(body)
-        # Censor both the scan spec and the object handle
-        censored_scan_spec = message.scan_spec._replace(
-                source=message.scan_spec.source.censor())
-        message = message._replace(
-                handle=message.handle.censor(),
-                scan_spec=censored_scan_spec)
-    elif "message" in body:
-        message = messages.ProblemMessage.from_json_object(body)
-        message = message._replace(
-                handle=message.handle.censor() if message.handle else None,
-                source=message.source.censor() if message.source else None)
-    # Old-style problem messages are now ignored
+    with tracing.span(body.get("trace_id"), "exporter", "export"):
+        message = None
+        if "metadata" in body:
+            message = messages.MetadataMessage.from_json_object(body)
+            # MetadataMessages carry a scan tag rather than a complete scan
+            # spec, so all we need to censor is the handle
+            message = message._replace(handle=message.handle.censor())
+        elif "matched" in body:
+            message = messages.MatchesMessage.from_json_object(body)
+            # Censor both the scan spec and the object handle
+            censored_scan_spec = message.scan_spec._replace(
+                    source=message.scan_spec.source.censor())
+            message = message._replace(
+                    handle=message.handle.censor(),
+                    scan_spec=censored_scan_spec)
+        elif "message" in body:
+            message = messages.ProblemMessage.from_json_object(body)
+            message = message._replace(
+                    handle=(message.handle.censor()
+                            if message.handle else None),
+                    source=(message.source.censor()
+                            if message.source else None))
+        # Old-style problem messages are now ignored
 
     if message:
         result_body = message.to_json_object()
@@ -97,6 +102,8 @@ def main():
 
 
     class ExporterRunner(PikaPipelineRunner):
+        trace_stage = "exporter"
+
         @prometheus_summary(
                 "os2datascanner_pipeline_exporter", "Messages exported")
         def handle_message(self, body, *, channel=None):
@@ -107,7 +114,11 @@ def main():
     with ExporterRunner(
             read=[args.matches, args.metadata, args.problems],
             write=[args.results],
-            heartbeat=6000) as runner:
+            heartbeat=6000,
+            # Results are consumed outside of the pipeline, so they should
+            # always carry complete scan specifications
+            **make_pipeline_runner_arguments(
+                    args, intern_scan_specs=False)) as runner:
         try:
             print("Start")
             notify_ready()
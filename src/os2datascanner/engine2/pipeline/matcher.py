@@ -1,23 +1,60 @@
 from os import getpid
+from time import perf_counter
 
-from prometheus_client import start_http_server
+from prometheus_client import Histogram, start_http_server
 
 from ..rules.rule import Rule
+from ..rules.regex import RegexRule, match_stream_all
 from ..conversions.types import decode_dict
+from ..conversions.utilities.text_stream import TextStream
 from . import messages
-from .utilities.args import AppendReplaceAction, make_common_argument_parser
+from .utilities.args import (AppendReplaceAction, make_common_argument_parser,
+        make_pipeline_runner_arguments)
 from .utilities.pika import PikaPipelineRunner
 from .utilities.systemd import notify_ready, notify_stopping
 from .utilities.prometheus import prometheus_summary
-
-
-def message_received_raw(body, channel, matches_qs, handles_q, conversions_q):
-    message = messages.RepresentationMessage.from_json_object(body)
-    representations = decode_dict(message.representations)
-    rule = message.progress.rule
-
+from .utilities import tracing
+from ..utilities.metrics import SECONDS_BUCKETS
+
+
+rule_seconds = Histogram(
+        "os2datascanner_rule_seconds",
+        "Time spent evaluating a single simple rule",
+        ["type_label"], buckets=SECONDS_BUCKETS)
+
+
+def _reachable_regex_rules(rule, operates_on):
+    """Returns all of the RegexRules that might be evaluated against the
+    representation @operates_on while executing @rule."""
+    found = []
+    pending, seen = [rule], set()
+    while pending:
+        r = pending.pop()
+        if isinstance(r, bool) or r in seen:
+            continue
+        seen.add(r)
+        head, pve, nve = r.split()
+        if isinstance(head, RegexRule) and head.operates_on == operates_on:
+            found.append(head)
+        pending.extend((pve, nve,))
+    return found
+
+
+def execute_rule(rule, representations):
+    """Evaluates as much of a Rule as possible using the representations in
+    the given dictionary. Returns a pair of the remaining Rule (or True or
+    False, if evaluation reached a conclusion) and a list of MatchFragments
+    for the evaluated components."""
     new_matches = []
 
+    # Several of the rules might share a regular expression (most obviously,
+    # CPRRules with different settings), so make sure that each expression
+    # searches the text only once
+    candidates = {}
+    # Reading a TextStream means reading its resource again, so evaluate
+    # every RegexRule that might need it in a single pass instead
+    stream_matches = {}
+
     # Keep executing rules for as long as we can with the representations we
     # have
     while not isinstance(rule, bool):
@@ -30,7 +67,23 @@ def message_received_raw(body, channel, matches_qs, handles_q, conversions_q):
             break
         representation = representations[type_value]
 
-        matches = list(head.match(representation))
+        start = perf_counter()
+        if isinstance(head, RegexRule) and isinstance(representation, str):
+            key = (type_value, head.expression)
+            if key not in candidates:
+                candidates[key] = head.find_candidates(representation)
+            matches = list(head.match_candidates(
+                    representation, candidates[key]))
+        elif (isinstance(head, RegexRule)
+                and isinstance(representation, TextStream)):
+            if head not in stream_matches.get(type_value, {}):
+                stream_matches[type_value] = match_stream_all(
+                        _reachable_regex_rules(rule, target_type)
+                                + [head], representation)
+            matches = list(stream_matches[type_value][head])
+        else:
+            matches = list(head.match(representation))
+        rule_seconds.labels(head.type_label).observe(perf_counter() - start)
         new_matches.append(
                 messages.MatchFragment(head, matches or None))
         if matches:
@@ -38,6 +91,16 @@ def message_received_raw(body, channel, matches_qs, handles_q, conversions_q):
         else:
             rule = nve
 
+    return rule, new_matches
+
+
+def message_received_raw(body, channel, matches_qs, handles_q, conversions_q):
+    message = messages.RepresentationMessage.from_json_object(body)
+    representations = decode_dict(message.representations)
+
+    with tracing.span(message.trace_id, "matcher", "match"):
+        rule, new_matches = execute_rule(
+                message.progress.rule, representations)
     final_matches = message.progress.matches + new_matches
 
     if isinstance(rule, bool):
@@ -46,13 +109,14 @@ def message_received_raw(body, channel, matches_qs, handles_q, conversions_q):
             yield (matches_q,
                     messages.MatchesMessage(
                             message.scan_spec, message.handle,
-                            rule, final_matches).to_json_object())
+                            rule, final_matches,
+                            message.trace_id).to_json_object())
         # Only trigger metadata scanning if the match succeeded
         if rule:
             yield (handles_q,
                     messages.HandleMessage(
                             message.scan_spec.scan_tag,
-                            message.handle).to_json_object())
+                            message.handle, message.trace_id).to_json_object())
     else:
         # We need a new representation to continue
         yield (conversions_q,
@@ -60,7 +124,8 @@ def message_received_raw(body, channel, matches_qs, handles_q, conversions_q):
                         message.scan_spec, message.handle,
                         message.progress._replace(
                                 rule=rule,
-                                matches=final_matches)).to_json_object())
+                                matches=final_matches),
+                        message.mime_type, message.trace_id).to_json_object())
 
 
 def main():
@@ -104,6 +169,8 @@ def main():
 
 
     class MatcherRunner(PikaPipelineRunner):
+        trace_stage = "matcher"
+
         @prometheus_summary(
                 "os2datascanner_pipeline_matcher", "Representations examined")
         def handle_message(self, body, *, channel=None):
@@ -115,7 +182,8 @@ def main():
     with MatcherRunner(
             read=[args.representations],
             write=[args.handles, *args.matches, args.conversions],
-            heartbeat=6000) as runner:
+            heartbeat=6000,
+            **make_pipeline_runner_arguments(args)) as runner:
         try:
             print("Start")
             notify_ready()
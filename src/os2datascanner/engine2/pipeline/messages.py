@@ -48,14 +48,18 @@ class ProgressFragment(NamedTuple):
 
     def to_json_object(self):
         return {
-            "rule": self.rule.to_json_object(),
+            # The rule might already have been reduced to a conclusion (if, for
+            # example, a TextStream was matched by the processor stage)
+            "rule": (self.rule if isinstance(self.rule, bool)
+                    else self.rule.to_json_object()),
             "matches": list([m.to_json_object() for m in self.matches])
         }
 
     @classmethod
     def from_json_object(cls, obj):
         return ProgressFragment(
-                rule=Rule.from_json_object(obj["rule"]),
+                rule=(obj["rule"] if isinstance(obj["rule"], bool)
+                        else Rule.from_json_object(obj["rule"])),
                 matches=[MatchFragment.from_json_object(mf)
                         for mf in obj["matches"]])
 
@@ -68,6 +72,9 @@ class ScanSpecMessage(NamedTuple):
     rule: Rule
     configuration: dict
     progress: ProgressFragment
+    # The trace of the object from which the source was derived, if this scan
+    # specification was produced by the processor stage
+    trace_id: Optional[str] = None
 
     def to_json_object(self):
         return {
@@ -76,11 +83,16 @@ class ScanSpecMessage(NamedTuple):
             "rule": self.rule.to_json_object(),
             "configuration": self.configuration or {},
             "progress": (
-                    self.progress.to_json_object() if self.progress else None)
+                    self.progress.to_json_object() if self.progress else None),
+            "trace_id": self.trace_id
         }
 
     @classmethod
     def from_json_object(cls, obj):
+        if isinstance(obj, ScanSpecMessage):
+            # Interned scan specs are deserialised only once (see
+            # utilities.registry.ScanSpecRegistry.resolve_message)
+            return obj
         # The progress fragment is only present when a scan spec is based on a
         # derived source and so already contains scan progress information
         progress_fragment = obj.get("progress")
@@ -93,7 +105,8 @@ class ScanSpecMessage(NamedTuple):
                 # necessary
                 configuration=obj.get("configuration", {}),
                 progress=ProgressFragment.from_json_object(progress_fragment)
-                        if progress_fragment else None)
+                        if progress_fragment else None,
+                trace_id=obj.get("trace_id"))
 
     _deep_replace = _deep_replace
 
@@ -102,12 +115,25 @@ class ConversionMessage(NamedTuple):
     scan_spec: ScanSpecMessage
     handle: Handle
     progress: ProgressFragment
+    # The type of the object behind the handle, if an earlier stage has
+    # already computed it
+    mime_type: Optional[str] = None
+    # The identifier under which the handling of this object is traced (see
+    # utilities.tracing), if the explorer that found it enabled tracing
+    trace_id: Optional[str] = None
+    # Whether or not a worker found this object inside another one and sent
+    # it back to the conversions queue rather than handling it itself (in
+    # which case it was already counted as part of that other object)
+    spilled: bool = False
 
     def to_json_object(self):
         return {
             "scan_spec": self.scan_spec.to_json_object(),
             "handle": self.handle.to_json_object(),
-            "progress": self.progress.to_json_object()
+            "progress": self.progress.to_json_object(),
+            "mime_type": self.mime_type,
+            "trace_id": self.trace_id,
+            "spilled": self.spilled
         }
 
     @classmethod
@@ -115,7 +141,10 @@ class ConversionMessage(NamedTuple):
         return ConversionMessage(
                 scan_spec=ScanSpecMessage.from_json_object(obj["scan_spec"]),
                 handle=Handle.from_json_object(obj["handle"]),
-                progress=ProgressFragment.from_json_object(obj["progress"]))
+                progress=ProgressFragment.from_json_object(obj["progress"]),
+                mime_type=obj.get("mime_type"),
+                trace_id=obj.get("trace_id"),
+                spilled=obj.get("spilled", False))
 
     _deep_replace = _deep_replace
 
@@ -125,13 +154,17 @@ class RepresentationMessage(NamedTuple):
     handle: Handle
     progress: ProgressFragment
     representations: dict
+    mime_type: Optional[str] = None
+    trace_id: Optional[str] = None
 
     def to_json_object(self):
         return {
             "scan_spec": self.scan_spec.to_json_object(),
             "handle": self.handle.to_json_object(),
             "progress": self.progress.to_json_object(),
-            "representations": self.representations
+            "representations": self.representations,
+            "mime_type": self.mime_type,
+            "trace_id": self.trace_id
         }
 
     @classmethod
@@ -140,7 +173,9 @@ class RepresentationMessage(NamedTuple):
                 scan_spec=ScanSpecMessage.from_json_object(obj["scan_spec"]),
                 handle=Handle.from_json_object(obj["handle"]),
                 progress=ProgressFragment.from_json_object(obj["progress"]),
-                representations=obj["representations"])
+                representations=obj["representations"],
+                mime_type=obj.get("mime_type"),
+                trace_id=obj.get("trace_id"))
 
     _deep_replace = _deep_replace
 
@@ -148,18 +183,21 @@ class RepresentationMessage(NamedTuple):
 class HandleMessage(NamedTuple):
     scan_tag: object
     handle: Handle
+    trace_id: Optional[str] = None
 
     def to_json_object(self):
         return {
             "scan_tag": self.scan_tag,
-            "handle": self.handle.to_json_object()
+            "handle": self.handle.to_json_object(),
+            "trace_id": self.trace_id
         }
 
     @classmethod
     def from_json_object(cls, obj):
         return HandleMessage(
                 scan_tag=obj["scan_tag"],
-                handle=Handle.from_json_object(obj["handle"]))
+                handle=Handle.from_json_object(obj["handle"]),
+                trace_id=obj.get("trace_id"))
 
     _deep_replace = _deep_replace
 
@@ -168,12 +206,14 @@ class MetadataMessage(NamedTuple):
     scan_tag: object
     handle: Handle
     metadata: dict
+    trace_id: Optional[str] = None
 
     def to_json_object(self):
         return {
             "scan_tag": self.scan_tag,
             "handle": self.handle.to_json_object(),
-            "metadata": self.metadata
+            "metadata": self.metadata,
+            "trace_id": self.trace_id
         }
 
     @classmethod
@@ -181,7 +221,8 @@ class MetadataMessage(NamedTuple):
         return MetadataMessage(
                 scan_tag=obj["scan_tag"],
                 handle=Handle.from_json_object(obj["handle"]),
-                metadata=obj["metadata"])
+                metadata=obj["metadata"],
+                trace_id=obj.get("trace_id"))
 
     _deep_replace = _deep_replace
 
@@ -191,6 +232,7 @@ class MatchesMessage(NamedTuple):
     handle: Handle
     matched: bool
     matches: Sequence[MatchFragment]
+    trace_id: Optional[str] = None
 
     @property
     def sensitivity(self):
@@ -231,7 +273,8 @@ class MatchesMessage(NamedTuple):
             "scan_spec": self.scan_spec.to_json_object(),
             "handle": self.handle.to_json_object(),
             "matched": self.matched,
-            "matches": list([mf.to_json_object() for mf in self.matches])
+            "matches": list([mf.to_json_object() for mf in self.matches]),
+            "trace_id": self.trace_id
         }
 
     @property
@@ -267,7 +310,8 @@ class MatchesMessage(NamedTuple):
                 handle=Handle.from_json_object(obj["handle"]),
                 matched=obj["matched"],
                 matches=[MatchFragment.from_json_object(mf)
-                        for mf in obj["matches"]])
+                        for mf in obj["matches"]],
+                trace_id=obj.get("trace_id"))
 
     _deep_replace = _deep_replace
 
@@ -278,6 +322,7 @@ class ProblemMessage(NamedTuple):
     handle: Optional[Handle]
     message: str
     missing: bool = False
+    trace_id: Optional[str] = None
 
     def to_json_object(self):
         return {
@@ -285,7 +330,8 @@ class ProblemMessage(NamedTuple):
             "source": self.source.to_json_object() if self.source else None,
             "handle": self.handle.to_json_object() if self.handle else None,
             "message": self.message,
-            "missing": self.missing
+            "missing": self.missing,
+            "trace_id": self.trace_id
         }
 
     @staticmethod
@@ -297,7 +343,8 @@ class ProblemMessage(NamedTuple):
                 source=Source.from_json_object(source) if source else None,
                 handle=Handle.from_json_object(handle) if handle else None,
                 message=obj["message"],
-                missing=obj.get("missing", False))
+                missing=obj.get("missing", False),
+                trace_id=obj.get("trace_id"))
 
     _deep_replace = _deep_replace
 
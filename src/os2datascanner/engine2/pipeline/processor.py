@@ -1,17 +1,21 @@
 from os import getpid
+from sys import stderr
 
 from prometheus_client import start_http_server
 
 from ..rules.rule import Rule
-from ..model.core import Source, Handle, SourceManager
+from ..model.core import Source, Handle, FileResource, SourceManager
 from ..conversions import convert
 from ..conversions.types import OutputType, encode_dict
+from ..conversions.utilities.text_stream import TextStream
 from . import messages
+from .matcher import execute_rule
 from .utilities.args import (AppendReplaceAction, make_common_argument_parser,
-        make_sourcemanager_configuration_block)
+        make_pipeline_runner_arguments, make_sourcemanager_configuration_block)
 from .utilities.pika import PikaPipelineRunner
 from .utilities.systemd import notify_ready, notify_stopping
 from .utilities.prometheus import prometheus_summary
+from .utilities import tracing
 
 
 def check(source_manager, handle):
@@ -22,38 +26,95 @@ def check(source_manager, handle):
     return handle.follow(source_manager).check()
 
 
+def is_skipped(configuration, resource):
+    """Indicates whether or not the configuration of a scan says that the text
+    of the given Resource should not be examined."""
+    if "skip_mime_types" not in configuration:
+        return False
+    mime_type = resource.compute_type()
+    for mt in configuration["skip_mime_types"]:
+        if mt.endswith("*") and mime_type.startswith(mt[:-1]):
+            return True
+        elif mime_type == mt:
+            return True
+    return False
+
+
+def prefetch(source_manager, bodies):
+    """Gives the Sources behind the Handles in a batch of conversion messages
+    the chance to retrieve their content in bulk. (Failures are ignored; any
+    Handle whose content couldn't be prefetched will just be retrieved on its
+    own later.)"""
+    by_source = {}
+    for body in bodies:
+        handle = messages.ConversionMessage.from_json_object(body).handle
+        by_source.setdefault(handle.source, []).append(handle)
+    for source, handles in by_source.items():
+        try:
+            source.prefetch(source_manager, handles)
+        except Exception as ex:
+            print("prefetch: {0} failed: {1}".format(
+                    type(source).__name__, ex), file=stderr)
+
+
 def message_received_raw(body,
         channel, source_manager, representations_q, sources_q, problems_qs):
     conversion = messages.ConversionMessage.from_json_object(body)
     configuration = conversion.scan_spec.configuration
     head, _, _ = conversion.progress.rule.split()
     required = head.operates_on
+    trace_id = conversion.trace_id
 
     try:
-        if not check(source_manager, conversion.handle):
+        with tracing.span(trace_id, "processor", "check"):
+            present = check(source_manager, conversion.handle)
+        if not present:
             # The resource is missing. Generate a special problem message and
             # stop the generator immediately
             for problems_q in problems_qs:
                 yield (problems_q, messages.ProblemMessage(
                         scan_tag=conversion.scan_spec.scan_tag,
                         source=None, handle=conversion.handle, missing=True,
-                        message="Resource check failed").to_json_object())
+                        message="Resource check failed",
+                        trace_id=trace_id).to_json_object())
             return
 
-        resource = conversion.handle.follow(source_manager)
+        with tracing.span(trace_id, "processor", "follow"):
+            resource = conversion.handle.follow(source_manager)
+            if conversion.mime_type and isinstance(resource, FileResource):
+                resource.set_computed_type(conversion.mime_type)
         representation = None
-        if (required == OutputType.Text
-                and "skip_mime_types" in configuration):
-            mime_type = resource.compute_type()
-            for mt in configuration["skip_mime_types"]:
-                if mt.endswith("*") and mime_type.startswith(mt[:-1]):
-                    break
-                elif mime_type == mt:
-                    break
+        stream = None
+        with tracing.span(trace_id, "processor", "convert",
+                output_type=required.value):
+            if required == OutputType.Text:
+                if not is_skipped(configuration, resource):
+                    stream = TextStream.from_resource(resource)
+                    if not stream:
+                        representation = convert(resource, OutputType.Text)
             else:
-                representation = convert(resource, OutputType.Text)
-        else:
-            representation = convert(resource, required)
+                representation = convert(resource, required)
+
+            # Every path above has computed (and so remembered) the type of
+            # this resource; pass it on so that later stages don't have to
+            mime_type = resource.compute_type()
+
+        if stream:
+            # This text is too big to put in a message, so evaluate the parts
+            # of the rule that need it here and now, and send the matcher our
+            # progress instead
+            with tracing.span(trace_id, "processor", "match"):
+                rule, new_matches = execute_rule(
+                        conversion.progress.rule, {required.value: stream})
+            yield (representations_q,
+                    messages.RepresentationMessage(
+                            conversion.scan_spec, conversion.handle,
+                            conversion.progress._replace(
+                                    rule=rule,
+                                    matches=(conversion.progress.matches
+                                            + new_matches)),
+                            {}, mime_type, trace_id).to_json_object())
+            return
 
         if representation and representation.parent:
             # If the conversion also produced other values at the same
@@ -69,7 +130,8 @@ def message_received_raw(body,
         yield (representations_q,
                 messages.RepresentationMessage(
                         conversion.scan_spec, conversion.handle,
-                        conversion.progress, encode_dict(dv)).to_json_object())
+                        conversion.progress, encode_dict(dv),
+                        mime_type, trace_id).to_json_object())
     except KeyError:
         # If we have a conversion we don't support, then check if the current
         # handle can be reinterpreted as a Source; if it can, then try again
@@ -79,7 +141,8 @@ def message_received_raw(body,
             # Copy almost all of the existing scan spec, but note the progress
             # of rule execution and replace the source
             new_scan_spec = conversion.scan_spec._replace(
-                    source=derived_source, progress=conversion.progress)
+                    source=derived_source, progress=conversion.progress,
+                    trace_id=trace_id)
             yield (sources_q, new_scan_spec.to_json_object())
         else:
             # If we can't recurse any deeper, then produce an empty conversion
@@ -90,7 +153,7 @@ def message_received_raw(body,
                             conversion.scan_spec, conversion.handle,
                             conversion.progress, {
                                 required.value: None
-                            }).to_json_object())
+                            }, trace_id=trace_id).to_json_object())
     except Exception as e:
         exception_message = ", ".join([str(a) for a in e.args])
         for problems_q in problems_qs:
@@ -98,7 +161,8 @@ def message_received_raw(body,
                     scan_tag=conversion.scan_spec.scan_tag,
                     source=None, handle=conversion.handle,
                     message="Processing error: {0}".format(
-                            exception_message)).to_json_object())
+                            exception_message),
+                    trace_id=trace_id).to_json_object())
 
 
 def main():
@@ -144,6 +208,8 @@ def main():
 
 
     class ProcessorRunner(PikaPipelineRunner):
+        trace_stage = "processor"
+
         @prometheus_summary("os2datascanner_pipeline_processor",
                 "Representations generated")
         def handle_message(self, body, *, channel=None):
@@ -152,11 +218,15 @@ def main():
             return message_received_raw(body, channel, source_manager,
                     args.representations, args.sources, args.problems)
 
+        def prepare_batch(self, message_bodies):
+            prefetch(source_manager, message_bodies)
+
     with SourceManager(width=args.width) as source_manager:
         with ProcessorRunner(
                 read=[args.conversions],
                 write=[args.sources, args.representations, *args.problems],
-                heartbeat=6000) as runner:
+                heartbeat=6000,
+                **make_pipeline_runner_arguments(args)) as runner:
             try:
                 print("Start")
                 notify_ready()
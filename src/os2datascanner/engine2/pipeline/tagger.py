@@ -6,10 +6,11 @@ from ...utils.metadata import guess_responsible_party
 from ..model.core import Handle, SourceManager
 from . import messages
 from .utilities.args import (make_common_argument_parser,
-        make_sourcemanager_configuration_block)
+        make_pipeline_runner_arguments, make_sourcemanager_configuration_block)
 from .utilities.pika import PikaPipelineRunner
 from .utilities.systemd import notify_ready, notify_stopping
 from .utilities.prometheus import prometheus_summary
+from .utilities import tracing
 
 
 def message_received_raw(body,
@@ -17,19 +18,20 @@ def message_received_raw(body,
     message = messages.HandleMessage.from_json_object(body)
 
     try:
+        with tracing.span(message.trace_id, "tagger", "metadata"):
+            metadata = guess_responsible_party(message.handle, source_manager)
         yield (metadata_q,
                 messages.MetadataMessage(
-                        message.scan_tag, message.handle,
-                        guess_responsible_party(
-                                message.handle,
-                                source_manager)).to_json_object())
+                        message.scan_tag, message.handle, metadata,
+                        message.trace_id).to_json_object())
     except Exception as e:
         exception_message = ", ".join([str(a) for a in e.args])
         yield (problems_q, messages.ProblemMessage(
                 scan_tag=message.scan_tag,
                 source=None, handle=message.handle,
                 message="Metadata extraction error: {0}".format(
-                        exception_message)).to_json_object())
+                        exception_message),
+                trace_id=message.trace_id).to_json_object())
 
 
 def main():
@@ -67,6 +69,8 @@ def main():
 
 
     class TaggerRunner(PikaPipelineRunner):
+        trace_stage = "tagger"
+
         @prometheus_summary(
                 "os2datascanner_pipeline_tagger", "Metadata extractions")
         def handle_message(self, body, *, channel=None):
@@ -79,7 +83,8 @@ def main():
         with TaggerRunner(
                 read=[args.handles],
                 write=[args.metadata, args.problems],
-                heartbeat=6000) as runner:
+                heartbeat=6000,
+                **make_pipeline_runner_arguments(args)) as runner:
             try:
                 print("Start")
                 notify_ready()
@@ -20,9 +20,53 @@ def make_common_argument_parser():
             help="the port to serve OpenMetrics data.",
             default=9091)
 
+    performance = parser.add_argument_group("performance")
+    performance.add_argument(
+            "--prefetch-count",
+            type=int,
+            metavar="COUNT",
+            help="allow the AMQP server to send at most %(metavar)s"
+                    " unacknowledged messages to this stage (raised to the"
+                    " batch size if necessary)",
+            default=1)
+    performance.add_argument(
+            "--batch-size",
+            type=int,
+            metavar="COUNT",
+            help="collect the results of up to %(metavar)s messages and send"
+                    " them, and acknowledge those messages, in a single"
+                    " AMQP transaction",
+            default=1)
+    performance.add_argument(
+            "--batch-timeout",
+            type=float,
+            metavar="SECONDS",
+            help="send an incomplete batch if it has not been filled after"
+                    " %(metavar)s seconds",
+            default=1.0)
+    performance.add_argument(
+            "--intern-scan-specs",
+            action="store_true",
+            help="replace the rules, configurations and root sources of"
+                    " the scan specifications in outgoing messages with"
+                    " references to copies stored in the shared scan"
+                    " specification directory")
+
     return parser
 
 
+def make_pipeline_runner_arguments(args, **overrides):
+    """Returns a dictionary of the keyword arguments for PikaPipelineRunner
+    given by the arguments added by make_common_argument_parser. (Keyword
+    arguments given to this function replace the computed values.)"""
+    return dict({
+        "prefetch_count": args.prefetch_count,
+        "batch_size": args.batch_size,
+        "batch_timeout": args.batch_timeout,
+        "intern_scan_specs": args.intern_scan_specs
+    }, **overrides)
+
+
 def make_sourcemanager_configuration_block(parser):
     configuration = parser.add_argument_group("configuration")
     configuration.add_argument(
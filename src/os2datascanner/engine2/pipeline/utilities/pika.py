@@ -1,13 +1,29 @@
 from abc import ABC, abstractmethod
 from sys import stderr
+from traceback import print_exc
 import json
 import pika
+from prometheus_client import Gauge, Histogram
 
 from ...utilities.backoff import run_with_backoff
+from ...utilities.metrics import BYTES_BUCKETS
+from .registry import ScanSpecRegistry, ScanSpecUnavailable
+from . import tracing
 from ....utils.system_utilities import json_utf8_decode
 from os2datascanner.utils import pika_settings
 
 
+message_bytes = Histogram(
+        "os2datascanner_pipeline_message_bytes",
+        "Size of the AMQP messages received and sent by pipeline stages",
+        ["queue", "direction"], buckets=BYTES_BUCKETS)
+pending_messages = Gauge(
+        "os2datascanner_pipeline_pending_messages",
+        "Messages held by a pipeline stage that have not yet been sent or"
+        " acknowledged",
+        ["kind"])
+
+
 class PikaConnectionHolder(ABC):
     """A PikaConnectionHolder manages a blocking connection to a RabbitMQ
     server. (Like Pika itself, it is not thread safe.)"""
@@ -82,20 +98,77 @@ silently consume."""
 
 
 class PikaPipelineRunner(PikaConnectionHolder):
+    """A PikaPipelineRunner consumes messages from a set of AMQP queues, passes
+    them to its handle_message method, and publishes the results.
+
+    By default, each incoming message is acknowledged before it is handled,
+    and each outgoing message is published as soon as it has been produced.
+    If the batch size is greater than one, the runner instead works in batched
+    mode: up to that many incoming messages are collected, passed together to
+    the prepare_batch method and then handled, and the outgoing messages they
+    produce are published together with the acknowledgement of the incoming
+    messages in the same AMQP transaction. (A partial batch is also handled
+    and sent when the batch timeout expires.)
+
+    References to interned scan specifications in incoming messages are always
+    resolved before handle_message is called. If scan specification interning
+    is enabled, then the parts of outgoing scan specifications that are the
+    same for a whole scan, and the Sources (with their credentials) at the
+    roots of their sources, will also be replaced by references; see
+    ScanSpecRegistry for more details."""
+
+    # The name of the pipeline stage under which the publication of traced
+    # messages should be recorded (see tracing.span)
+    trace_stage = "pipeline"
+
     def __init__(self, *,
-            read=set(), write=set(), source_manager=None, **kwargs):
+            read=set(), write=set(), source_manager=None,
+            prefetch_count=1, batch_size=1, batch_timeout=1.0,
+            intern_scan_specs=False, **kwargs):
         super().__init__(**kwargs)
         self._read = set(read)
         self._write = set(write)
         self._pending = []
 
+        self._batch_size = max(1, batch_size)
+        # The server must be willing to give us at least a full batch of
+        # messages, or we'll never fill one
+        self._prefetch_count = max(prefetch_count, self._batch_size)
+        self._batch_timeout = batch_timeout
+        self._unacknowledged = []
+        self._received = []
+        self._batch_timer = None
+
+        self._intern_scan_specs = intern_scan_specs
+        self.scan_spec_registry = ScanSpecRegistry()
+        if intern_scan_specs and not self.scan_spec_registry.directory:
+            raise ValueError("interning scan specifications needs a"
+                    " [pipeline.scan_spec_registry] directory")
+
+        self._stop_requested = False
+
         self.source_manager = source_manager
 
+        pending_messages.labels("pending").set_function(
+                lambda: len(self._pending))
+        pending_messages.labels("received").set_function(
+                lambda: len(self._received))
+        pending_messages.labels("unacknowledged").set_function(
+                lambda: len(self._unacknowledged))
+
+    @property
+    def batched(self):
+        """Indicates whether or not this runner is working in batched mode."""
+        return self._batch_size > 1
+
     def make_channel(self):
         """As PikaConnectionHolder.make_channel, but automatically declares all
-        of the read and write queues used by this pipeline stage."""
+        of the read and write queues used by this pipeline stage. (In batched
+        mode, the channel is also put into transactional mode.)"""
         channel = super().make_channel()
-        channel.basic_qos(prefetch_count=1)
+        channel.basic_qos(prefetch_count=self._prefetch_count)
+        if self.batched:
+            channel.tx_select()
         for q in self._read.union(self._write):
             channel.queue_declare(q, passive=False,
                     durable=True, exclusive=False, auto_delete=False)
@@ -106,6 +179,11 @@ class PikaPipelineRunner(PikaConnectionHolder):
         """Responds to the given message by yielding zero or more (queue name,
         JSON-serialisable object) pairs to be sent as new messages."""
 
+    def prepare_batch(self, message_bodies):
+        """In batched mode, called with the decoded bodies of every message in
+        a batch before any of them is passed to handle_message. The default
+        implementation does nothing."""
+
     def dispatch_pending(self, *, expected: int):
         """Sends all pending messages.
 
@@ -123,11 +201,131 @@ class PikaPipelineRunner(PikaConnectionHolder):
             # remove the message from the head of the pending queue
             self._pending = self._pending[1:]
 
+    def decode_message(self, body):
+        """Decodes the body of an AMQP message and resolves the interned scan
+        specification it refers to, if there is one. Returns None if the
+        message could not be decoded, and raises ScanSpecUnavailable if the
+        scan specification could not be found."""
+        decoded_body = json_utf8_decode(body)
+        if decoded_body:
+            return self.scan_spec_registry.resolve_message(decoded_body)
+        return decoded_body
+
+    def reject_message(self, channel, method, key):
+        """Returns an AMQP message whose scan specification could not be found
+        to the server without handling it. The message is requeued the first
+        time this happens, as the scan specification may only have been
+        briefly unavailable; after that, it is rejected, and the server will
+        dead-letter it if the queue has a dead-letter policy."""
+        requeue = not method.redelivered
+        print(("PikaPipelineRunner.reject_message:"
+                " scan specification {0} is not available,"
+                " {1} message").format(
+                        key, "requeueing" if requeue else "rejecting"),
+                file=stderr)
+        channel.basic_nack(method.delivery_tag, requeue=requeue)
+
     def publish_message(self, routing_key, message):
-        self.channel.basic_publish(
-                exchange='',
-                routing_key=routing_key,
-                body=json.dumps(message).encode())
+        with tracing.span(message.get("trace_id"),
+                self.trace_stage, "publish", queue=routing_key):
+            if self._intern_scan_specs:
+                message = self.scan_spec_registry.intern_message(message)
+            body = json.dumps(message).encode()
+            message_bytes.labels(routing_key, "out").observe(len(body))
+            self.channel.basic_publish(
+                    exchange='',
+                    routing_key=routing_key,
+                    body=body)
+
+    def dispatch_batch(self):
+        """Handles all of the messages in the current batch, and then publishes
+        all pending messages and acknowledges all of the incoming messages
+        that produced them in a single AMQP transaction. The server has
+        confirmed the transaction by the time this method returns.
+
+        A message whose handling raises an exception produces no results: it
+        is rejected without being requeued (so the server will dead-letter
+        it, if the queue has a dead-letter policy), and the rest of the batch
+        is sent as usual. If prepare_batch raises an exception, the messages
+        are handled without it.
+
+        If a Pika exception is raised by this method, then the server will
+        discard the transaction: none of the pending messages will have been
+        sent, and all of the unacknowledged messages will be redelivered (and
+        so will produce their results again). The batch is therefore always
+        emptied."""
+        self._cancel_batch_timer()
+        try:
+            received, self._received = self._received, []
+            if received:
+                try:
+                    self.prepare_batch([body for body, _, _ in received])
+                except RECOVERABLE_PIKA_ERRORS:
+                    raise
+                except Exception:
+                    print("PikaPipelineRunner.dispatch_batch:"
+                            " prepare_batch failed, continuing without it",
+                            file=stderr)
+                    print_exc(file=stderr)
+
+            failed = []
+            for body, routing_key, delivery_tag in received:
+                try:
+                    # Collect all of the results first, so that a message
+                    # that fails part of the way through sends nothing
+                    self._pending.extend(list(
+                            self.handle_message(body, channel=routing_key)))
+                except RECOVERABLE_PIKA_ERRORS:
+                    raise
+                except Exception:
+                    print(("PikaPipelineRunner.dispatch_batch:"
+                            " failed to handle message {0}, rejecting"
+                            " it").format(delivery_tag), file=stderr)
+                    print_exc(file=stderr)
+                    failed.append(delivery_tag)
+
+            for routing_key, message in self._pending:
+                self.publish_message(routing_key, message)
+            if failed:
+                for delivery_tag in self._unacknowledged:
+                    if delivery_tag in failed:
+                        self.channel.basic_nack(delivery_tag, requeue=False)
+                    else:
+                        self.channel.basic_ack(delivery_tag)
+            elif self._unacknowledged:
+                # Delivery tags are allocated in order on a channel, so
+                # acknowledging the last one acknowledges the whole batch
+                self.channel.basic_ack(
+                        self._unacknowledged[-1], multiple=True)
+            self.channel.tx_commit()
+        finally:
+            self._pending.clear()
+            self._unacknowledged.clear()
+
+    def _cancel_batch_timer(self):
+        if self._batch_timer is not None:
+            if self._connection:
+                self._connection.remove_timeout(self._batch_timer)
+            self._batch_timer = None
+
+    def _batch_timer_expired(self):
+        self._batch_timer = None
+        if self._unacknowledged:
+            self.dispatch_batch()
+
+    def request_stop(self):
+        """Asks the consumer loop to return once it has finished handling the
+        current message (and, in batched mode, has sent the current batch).
+        This method is safe to call from a signal handler."""
+        self._stop_requested = True
+        if self._connection:
+            self._connection.add_callback_threadsafe(self._stop_consuming)
+
+    def _stop_consuming(self):
+        if self.batched and self._unacknowledged:
+            self.dispatch_batch()
+        if self._channel:
+            self._channel.stop_consuming()
 
     def run_consumer(self):
         """Runs the Pika channel consumer loop in another loop. Transient
@@ -143,9 +341,17 @@ class PikaPipelineRunner(PikaConnectionHolder):
             connection is closed), then this function will continue to collect
             yielded messages and will schedule them to be sent when the
             connection is reopened."""
+            message_bytes.labels(method.routing_key, "in").observe(len(body))
+            if self.batched:
+                return _queue_callback_batched(
+                        channel, method, properties, body)
+            try:
+                decoded_body = self.decode_message(body)
+            except ScanSpecUnavailable as ex:
+                self.reject_message(channel, method, ex.args[0])
+                return
             channel.basic_ack(method.delivery_tag)
             self.dispatch_pending(expected=0)
-            decoded_body = json_utf8_decode(body)
             if decoded_body:
                 failed = False
                 for routing_key, message in self.handle_message(
@@ -159,7 +365,31 @@ class PikaPipelineRunner(PikaConnectionHolder):
                         except RECOVERABLE_PIKA_ERRORS:
                             failed = True
 
-        while True:
+        def _queue_callback_batched(channel, method, properties, body):
+            """Adds an AMQP message to the current batch in batched mode. The
+            batch is handled and sent when it is full or when the batch timer
+            expires."""
+            try:
+                decoded_body = self.decode_message(body)
+            except ScanSpecUnavailable as ex:
+                self.reject_message(channel, method, ex.args[0])
+                if not self._unacknowledged:
+                    # There's no batch whose transaction would include this
+                    # rejection, so commit it now
+                    channel.tx_commit()
+                return
+            if decoded_body:
+                self._received.append((decoded_body,
+                        method.routing_key, method.delivery_tag))
+            self._unacknowledged.append(method.delivery_tag)
+
+            if len(self._unacknowledged) >= self._batch_size:
+                self.dispatch_batch()
+            elif self._batch_timer is None:
+                self._batch_timer = self.connection.call_later(
+                        self._batch_timeout, self._batch_timer_expired)
+
+        while not self._stop_requested:
             consumer_tags = []
             try:
                 for queue in self._read:
@@ -169,6 +399,13 @@ class PikaPipelineRunner(PikaConnectionHolder):
                 self.channel.start_consuming()
             except RECOVERABLE_PIKA_ERRORS:
                 # Flush the channel and connection and continue the loop
+                if self.batched:
+                    # The server will redeliver everything in the current
+                    # batch, so there's no point in keeping it
+                    self._batch_timer = None
+                    self._pending.clear()
+                    self._unacknowledged.clear()
+                    self._received.clear()
                 self._channel = None
                 self._connection = None
                 pass
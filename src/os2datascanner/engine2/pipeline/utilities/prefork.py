@@ -0,0 +1,199 @@
+import os
+import signal
+from sys import stderr
+from time import monotonic, sleep
+from traceback import print_exc
+
+from .systemd import (notify_ready, notify_status, notify_stopping,
+        notify_watchdog)
+
+
+def get_resident_size(pid):
+    """Returns the resident set size, in bytes, of the process with the given
+    PID, or None if this could not be determined. (This function only works on
+    systems with a Linux-style /proc filesystem.)"""
+    try:
+        with open("/proc/{0}/statm".format(pid), "rt") as fp:
+            _, resident, *_ = fp.read().split()
+        return int(resident) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class _Child:
+    def __init__(self, slot):
+        self.slot = slot
+        self.pid = None
+        self.started = None
+        self.stopping = False
+        self.stopped_at = None
+        self.restart_at = 0
+        self.delay = 0
+
+
+class PreforkSupervisor:
+    """A PreforkSupervisor runs a function in several forked child processes,
+    restarting those processes when they crash or use too much memory.
+
+    The function is called with the slot number of its child process (from 0
+    to the number of processes minus one) as its only argument. It should
+    install its own handler for SIGTERM, which the supervisor sends to a child
+    when it wants it to finish its current work and stop; if a child has not
+    stopped after the shutdown timeout, it will be killed.
+
+    When the supervisor itself receives SIGTERM or SIGINT, it asks all of its
+    children to stop and returns when they have done so. The supervisor
+    reports its state through the systemd notification functions."""
+
+    QUICK_EXIT = 10
+    """Children that exit less than this many seconds after starting are
+    restarted with an exponentially increasing delay."""
+
+    MAX_DELAY = 60
+    """The longest time that a child will wait to be restarted (in
+    seconds)."""
+
+    def __init__(self, target, processes, *,
+            max_memory=None, shutdown_timeout=60, poll_interval=1):
+        self._target = target
+        self._children = [_Child(slot) for slot in range(processes)]
+        self._max_memory = max_memory
+        self._shutdown_timeout = shutdown_timeout
+        self._poll_interval = poll_interval
+
+        self._stopping = False
+        self._restarts = 0
+        self._status = None
+
+    def _spawn(self, child):
+        pid = os.fork()
+        if pid == 0:
+            # We're the child. Restore the default signal handlers (the target
+            # is responsible for installing its own), ignore keyboard
+            # interrupts (the supervisor will tell us when to stop), and make
+            # sure that we never return into the supervisor's code
+            status = 1
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                self._target(child.slot)
+                status = 0
+            except BaseException:
+                print_exc(file=stderr)
+            finally:
+                stderr.flush()
+                os._exit(status)
+        child.pid = pid
+        child.started = monotonic()
+        child.stopping = False
+
+    def _stop_child(self, child):
+        if child.pid and not child.stopping:
+            child.stopping = True
+            child.stopped_at = monotonic()
+            try:
+                os.kill(child.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        """Collects the exit statuses of all of the children that have
+        stopped, scheduling them for a restart if appropriate."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            for child in self._children:
+                if child.pid != pid:
+                    continue
+                lifetime = monotonic() - child.started
+                child.pid = None
+                if not child.stopping:
+                    if os.WIFSIGNALED(status):
+                        reason = "was killed by signal {0}".format(
+                                os.WTERMSIG(status))
+                    else:
+                        reason = "exited with status {0}".format(
+                                os.WEXITSTATUS(status))
+                    print("PreforkSupervisor: child {0} (PID {1})"
+                            " unexpectedly {2}".format(
+                                    child.slot, pid, reason), file=stderr)
+                if lifetime < self.QUICK_EXIT and not child.stopping:
+                    child.delay = min(
+                            max(child.delay * 2, 1), self.MAX_DELAY)
+                else:
+                    child.delay = 0
+                child.restart_at = monotonic() + child.delay
+
+    def _check_memory(self):
+        if not self._max_memory:
+            return
+        for child in self._children:
+            if child.pid and not child.stopping:
+                size = get_resident_size(child.pid)
+                if size and size > self._max_memory:
+                    print("PreforkSupervisor: child {0} (PID {1}) is using"
+                            " {2} bytes of memory, restarting".format(
+                                    child.slot, child.pid, size), file=stderr)
+                    self._stop_child(child)
+
+    def _kill_stragglers(self):
+        now = monotonic()
+        for child in self._children:
+            if (child.pid and child.stopping
+                    and now - child.stopped_at > self._shutdown_timeout):
+                print("PreforkSupervisor: child {0} (PID {1}) did not stop"
+                        " in time, killing it".format(child.slot, child.pid),
+                        file=stderr)
+                try:
+                    os.kill(child.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _report(self):
+        running = len([c for c in self._children if c.pid])
+        status = "{0}/{1} processes running, {2} restarts".format(
+                running, len(self._children), self._restarts)
+        if status != self._status:
+            notify_status(status)
+            self._status = status
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        """Starts all of the child processes and supervises them until this
+        process is asked to stop."""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for child in self._children:
+            self._spawn(child)
+        notify_ready()
+        self._report()
+
+        try:
+            while not self._stopping:
+                self._reap()
+                self._check_memory()
+                self._kill_stragglers()
+                for child in self._children:
+                    if not child.pid and monotonic() >= child.restart_at:
+                        self._spawn(child)
+                        self._restarts += 1
+                self._report()
+                notify_watchdog()
+                sleep(self._poll_interval)
+        finally:
+            notify_stopping()
+            for child in self._children:
+                self._stop_child(child)
+            while any(c.pid for c in self._children):
+                self._reap()
+                self._kill_stragglers()
+                self._report()
+                if any(c.pid for c in self._children):
+                    sleep(self._poll_interval)
@@ -1,11 +1,30 @@
+from time import perf_counter
+from inspect import isgenerator
+from functools import wraps
+
 from prometheus_client import Summary
 
+from ...utilities.metrics import observe_iteration
+
 
 def prometheus_summary(*args):
     """Decorator. Records a Prometheus summary observation for every call to
-    the decorated function."""
+    the decorated function.
+
+    If the decorated function returns a generator, the observation covers the
+    whole iteration of that generator rather than just its creation."""
     s = Summary(*args)
 
     def _prometheus_summary(func):
-        return s.time()(func)
+        @wraps(func)
+        def _timed(*fargs, **fkwargs):
+            start = perf_counter()
+            rv = None
+            try:
+                rv = func(*fargs, **fkwargs)
+            finally:
+                if not isgenerator(rv):
+                    s.observe(perf_counter() - start)
+            return observe_iteration(rv, s.observe) if isgenerator(rv) else rv
+        return _timed
     return _prometheus_summary
@@ -0,0 +1,282 @@
+from os import chmod, makedirs, replace, scandir, unlink, utime
+from sys import stderr
+from time import monotonic, time
+from hashlib import sha256
+from tempfile import mkstemp
+from contextlib import closing, suppress
+from collections import OrderedDict
+import json
+import os.path
+
+from ... import settings as engine2_settings
+from ...model.core import Source
+from ...rules.rule import Rule
+from .. import messages
+
+
+class ScanSpecUnavailable(LookupError):
+    """When a ScanSpecRegistry cannot find an object associated with a key,
+    either locally or in its directory, a ScanSpecUnavailable exception will
+    be raised. Its only associated value is the key."""
+
+
+def _digest(obj):
+    return sha256(json.dumps(obj,
+            sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _root_of(source):
+    """Returns the JSON representation of the Source at the root of the JSON
+    representation of a (possibly derived) Source."""
+    while isinstance(source.get("handle"), dict) and isinstance(
+            source["handle"].get("source"), dict):
+        source = source["handle"]["source"]
+    return source
+
+
+def _substitute(obj, match, replacement):
+    """Returns a copy of the JSON-serialisable object @obj in which every
+    dictionary for which @match returns true has been replaced with the
+    result of passing it to @replacement."""
+    if isinstance(obj, dict):
+        if match(obj):
+            return replacement(obj)
+        return {k: _substitute(v, match, replacement)
+                for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_substitute(v, match, replacement) for v in obj]
+    else:
+        return obj
+
+
+class ScanSpecRegistry:
+    """A ScanSpecRegistry allows pipeline messages to refer to the parts of
+    their scan specifications that many messages have in common by short
+    keys instead of carrying complete copies of them:
+
+    - the scan tag, rule and configuration of a scan, which are the same for
+      the whole scan, are keyed by a digest of the scan tag; and
+    - the Source at the root of a scan specification's source, which carries
+      the credentials of the scan, is keyed by a digest of the JSON
+      representation of its censored form. Every copy of it in a message --
+      at the bottom of the chain of handles that makes up a derived source,
+      and in the message's handle -- is replaced by a reference.
+
+    (The rest of the source and the progress information, which differ from
+    one scan specification to the next, stay in the message.)
+
+    Interned objects are stored as files, named after their keys, in a
+    directory that must be shared by every process that sends or receives
+    interned messages, so looking up a key is just opening a file. Files
+    are replaced atomically, so a reader never sees a partial object. Each
+    registry keeps a bounded cache of recently-used objects, and refreshes
+    the modification time of the files of the objects it interns; files
+    that have not been refreshed for the expiry period are deleted."""
+
+    # The properties of a scan specification that are stored in the registry
+    # rather than in each message
+    INTERNED = ("scan_tag", "rule", "configuration",)
+
+    def __init__(self, *, directory=None, cache_size=None, expiry=None):
+        config = engine2_settings.pipeline["scan_spec_registry"]
+        self.directory = (
+                directory if directory is not None
+                else config["directory"])
+        self._cache_size = (
+                cache_size if cache_size is not None
+                else config["cache_size"])
+        self._expiry = expiry if expiry is not None else config["expiry"]
+        self._pruned = False
+
+        # file name -> (interned object, ScanSpecMessage with no source built
+        # from it or None, time at which its file was last refreshed)
+        self._cache = OrderedDict()
+        # JSON representation of a root Source -> key
+        self._source_keys = OrderedDict()
+
+    @staticmethod
+    def make_key(scan_tag) -> str:
+        """Computes the key of the scan with the given scan tag."""
+        return _digest(scan_tag)
+
+    @staticmethod
+    def make_source_key(source) -> str:
+        """Computes the key of the JSON representation of a root Source."""
+        return _digest(Source.from_json_object(source).censor(
+                ).to_json_object())
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".json")
+
+    def _prune(self):
+        """Deletes the files of objects that have not been interned for the
+        expiry period (once per registry)."""
+        if self._pruned:
+            return
+        self._pruned = True
+        cutoff = time() - self._expiry
+        with suppress(FileNotFoundError), closing(
+                scandir(self.directory)) as file_iterator:
+            for entry in file_iterator:
+                with suppress(FileNotFoundError):
+                    if (entry.name.endswith(".json")
+                            and entry.stat().st_mtime < cutoff):
+                        unlink(entry.path)
+
+    def _write(self, name, obj):
+        """Atomically replaces the file for the object @name."""
+        makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._prune()
+        fd, tmp = mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        try:
+            with open(fd, "w") as fp:
+                json.dump(obj, fp)
+            # Interned sources carry credentials
+            chmod(tmp, 0o600)
+            replace(tmp, self._path(name))
+        except BaseException:
+            with suppress(FileNotFoundError):
+                unlink(tmp)
+            raise
+
+    def _remember(self, name, obj, template):
+        self._cache[name] = (obj, template, monotonic())
+        self._cache.move_to_end(name)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, name, obj, template=None):
+        """Makes sure that the file for the object @name contains @obj,
+        writing it if this registry hasn't recently done so (or refreshing it
+        if this registry wrote it a while ago)."""
+        if name in self._cache:
+            known, _, refreshed = self._cache[name]
+            if known == obj:
+                self._cache.move_to_end(name)
+                if monotonic() - refreshed < self._expiry / 2:
+                    return
+                with suppress(FileNotFoundError):
+                    utime(self._path(name))
+                    self._remember(name, obj, self._cache[name][1])
+                    return
+        self._write(name, obj)
+        self._remember(name, obj, template)
+
+    def _load(self, name, key, check):
+        """Returns the object @name, reading it from its file if necessary.
+        Raises ScanSpecUnavailable with @key if it couldn't be found, or if
+        its key (computed by @check) was wrong."""
+        if name in self._cache:
+            self._cache.move_to_end(name)
+            return self._cache[name][0]
+        try:
+            with open(self._path(name)) as fp:
+                obj = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            raise ScanSpecUnavailable(key)
+        if check(obj) != key:
+            print("ScanSpecRegistry: file for {0} contains the wrong"
+                    " object".format(name), file=stderr)
+            raise ScanSpecUnavailable(key)
+        self._remember(name, obj, None)
+        return obj
+
+    @staticmethod
+    def _make_template(obj):
+        return messages.ScanSpecMessage(
+                scan_tag=obj["scan_tag"], source=None,
+                rule=Rule.from_json_object(obj["rule"]),
+                configuration=obj.get("configuration") or {},
+                progress=None)
+
+    def intern(self, obj):
+        """Returns the key for the interned parts of the JSON representation
+        of a scan specification, storing them first if necessary. Returns None
+        if this registry has already seen different interned parts for the
+        same scan tag (in which case the scan specification should not be
+        interned)."""
+        obj = {k: obj.get(k) for k in self.INTERNED}
+        key = self.make_key(obj["scan_tag"])
+        name = "scan-" + key
+        if name in self._cache and self._cache[name][0] != obj:
+            print("ScanSpecRegistry.intern: scan {0} has changed its"
+                    " rule or configuration".format(key), file=stderr)
+            return None
+        self._store(name, obj, self._make_template(obj)
+                if name not in self._cache else self._cache[name][1])
+        return key
+
+    def intern_source(self, source):
+        """Returns the key for the JSON representation of a root Source,
+        storing it first if necessary. (If the credentials of a Source
+        change, the new version replaces the old one.)"""
+        cache_key = json.dumps(source, sort_keys=True)
+        key = self._source_keys.get(cache_key)
+        if key is not None:
+            self._source_keys.move_to_end(cache_key)
+        else:
+            key = self.make_source_key(source)
+            self._source_keys[cache_key] = key
+            while len(self._source_keys) > self._cache_size:
+                self._source_keys.popitem(last=False)
+        self._store("source-" + key, source)
+        return key
+
+    def resolve(self, key) -> messages.ScanSpecMessage:
+        """Returns a ScanSpecMessage, with no source and no progress
+        information, built from the interned parts of a scan specification
+        with the given key. Raises ScanSpecUnavailable if they could not be
+        found."""
+        name = "scan-" + key
+        obj = self._load(name, key,
+                lambda obj: self.make_key(obj.get("scan_tag")))
+        _, template, refreshed = self._cache[name]
+        if template is None:
+            template = self._make_template(obj)
+            self._cache[name] = (obj, template, refreshed)
+        return template
+
+    def resolve_source(self, key):
+        """Returns the JSON representation of the root Source with the given
+        key. Raises ScanSpecUnavailable if it could not be found."""
+        return self._load("source-" + key, key, self.make_source_key)
+
+    def intern_message(self, message):
+        """Replaces the interned parts of the scan specification in a
+        JSON-serialisable message, if there is one, and every copy of the root
+        of its source, with references to them."""
+        scan_spec = message.get("scan_spec")
+        if not isinstance(scan_spec, dict):
+            return message
+        key = self.intern(scan_spec)
+        if not key:
+            return message
+
+        root = _root_of(scan_spec["source"])
+        reference = {"source_key": self.intern_source(root)}
+        message = _substitute(message,
+                lambda obj: obj == root, lambda obj: reference)
+        return dict(message, scan_spec_key=key, scan_spec={
+                k: v for k, v in message["scan_spec"].items()
+                if k not in self.INTERNED})
+
+    def resolve_message(self, message):
+        """Replaces the references to interned objects in a decoded message
+        body, if there are any, with the objects themselves; the scan
+        specification is replaced with a complete ScanSpecMessage. (The
+        from_json_object methods of messages that contain scan specifications
+        accept ScanSpecMessages in place of JSON objects, so the rule of a
+        scan does not need to be parsed again for every message.)"""
+        if "scan_spec_key" in message:
+            template = self.resolve(message.pop("scan_spec_key"))
+            message = _substitute(message,
+                    lambda obj: list(obj) == ["source_key"],
+                    lambda obj: self.resolve_source(obj["source_key"]))
+            rest = message["scan_spec"]
+            progress = rest.get("progress")
+            message["scan_spec"] = template._replace(
+                    source=Source.from_json_object(rest["source"]),
+                    progress=messages.ProgressFragment.from_json_object(
+                            progress) if progress else None,
+                    trace_id=rest.get("trace_id"))
+        return message
@@ -0,0 +1,325 @@
+"""Optional tracing of the objects handled by the pipeline.
+
+When tracing is enabled, the explorer gives every object that it finds a trace
+identifier, which is carried along with that object through all of the later
+pipeline stages. Each stage then records spans -- named, timed pieces of
+work, like following a Handle or converting a Resource -- under that
+identifier, so the time spent on a scan can be attributed to particular
+objects and stages afterwards (see the _summarise_traces tool).
+
+Spans are written by each process to its own file in the directory given by
+the [pipeline.tracing] settings, either as simple JSON Lines or as JSON-encoded
+OpenTelemetry (OTLP) export requests."""
+
+from os import getpid, makedirs, urandom
+from time import time, perf_counter
+from uuid import uuid4
+import json
+import os.path
+from threading import Lock
+from contextlib import contextmanager
+
+from ... import settings as engine2_settings
+
+
+FORMATS = ("jsonl", "otlp",)
+
+
+def new_trace_id():
+    """Returns a new trace identifier, or None if tracing is disabled in this
+    process."""
+    if engine2_settings.pipeline["tracing"]["path"]:
+        return uuid4().hex
+    else:
+        return None
+
+
+class SpanWriter:
+    """A SpanWriter appends spans to a file in a given format. (Its methods
+    are thread safe.)"""
+
+    def __init__(self, path, fmt="jsonl"):
+        if fmt not in FORMATS:
+            raise ValueError(fmt)
+        self.path = path
+        self.format = fmt
+        self._lock = Lock()
+        self._fp = None
+
+    def _encode(self, span):
+        if self.format == "jsonl":
+            return span
+        start = int(span["start"] * 1e9)
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [
+                        _otlp_attribute("service.name",
+                                "os2datascanner-" + span["stage"]),
+                        _otlp_attribute("process.pid", span["pid"]),
+                    ]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [{
+                        "traceId": span["trace_id"],
+                        "spanId": span["span_id"],
+                        "name": span["name"],
+                        "kind": 1,
+                        "startTimeUnixNano": str(start),
+                        "endTimeUnixNano": str(
+                                start + int(span["duration"] * 1e9)),
+                        "attributes": [
+                                _otlp_attribute(k, v)
+                                for k, v in span["attributes"].items()]
+                    }]
+                }]
+            }]
+        }
+
+    def write(self, span):
+        line = json.dumps(self._encode(span), default=str) + "\n"
+        with self._lock:
+            if not self._fp:
+                self._fp = open(self.path, "at")
+            self._fp.write(line)
+            self._fp.flush()
+
+    def close(self):
+        with self._lock:
+            if self._fp:
+                self._fp.close()
+                self._fp = None
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    elif isinstance(value, str):
+        v = {"stringValue": value}
+    else:
+        v = {"stringValue": json.dumps(value, default=str)}
+    return {"key": key, "value": v}
+
+
+def _otlp_value(value):
+    (kind, v), = value.items()
+    if kind == "intValue":
+        return int(v)
+    elif kind == "stringValue":
+        # Structured attributes (like scan tags) were encoded as JSON
+        try:
+            decoded = json.loads(v)
+            if isinstance(decoded, (dict, list)):
+                return decoded
+        except ValueError:
+            pass
+    return v
+
+
+__writer = None
+__writer_pid = None
+__writer_lock = Lock()
+
+
+def _get_writer():
+    """Returns the SpanWriter for this process, or None if tracing is
+    disabled. A forked child process gets a writer (and a file) of its
+    own."""
+    global __writer, __writer_pid
+    config = engine2_settings.pipeline["tracing"]
+    if not config["path"]:
+        return None
+    with __writer_lock:
+        pid = getpid()
+        if (__writer is None or __writer_pid != pid
+                or os.path.dirname(__writer.path) != config["path"]):
+            makedirs(config["path"], exist_ok=True)
+            __writer = SpanWriter(
+                    os.path.join(config["path"],
+                            "spans-{0}.jsonl".format(pid)),
+                    config["format"])
+            __writer_pid = pid
+        return __writer
+
+
+def record(trace_id, stage, name, start, duration, **attributes):
+    """Records a span of work called @name, done by the pipeline stage @stage
+    for the object traced under @trace_id, that began at the Unix time @start
+    and took @duration seconds. (Does nothing if @trace_id is None or if
+    tracing is disabled in this process.)"""
+    if not trace_id:
+        return
+    writer = _get_writer()
+    if not writer:
+        return
+    writer.write({
+        "trace_id": trace_id,
+        "span_id": urandom(8).hex(),
+        "stage": stage,
+        "name": name,
+        "start": start,
+        "duration": duration,
+        "pid": getpid(),
+        "attributes": attributes
+    })
+
+
+@contextmanager
+def span(trace_id, stage, name, **attributes):
+    """Context manager: records a span covering the body of the with
+    statement. If an exception escapes from the body, the span notes its
+    type."""
+    if not trace_id:
+        yield
+        return
+    start, t0 = time(), perf_counter()
+    try:
+        yield
+    except BaseException as ex:
+        attributes["error"] = type(ex).__name__
+        raise
+    finally:
+        record(trace_id, stage, name, start, perf_counter() - t0,
+                **attributes)
+
+
+def read_spans(path):
+    """Yields every span recorded in the file at @path, in the JSON Lines
+    format written by SpanWriter with the "jsonl" format. (Spans written in
+    the "otlp" format are converted back to this format.)"""
+    with open(path, "rt") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                # Probably a partially-written line from a process that was
+                # killed
+                continue
+            if "resourceSpans" not in obj:
+                yield obj
+                continue
+            for rs in obj["resourceSpans"]:
+                resource = {a["key"]: _otlp_value(a["value"])
+                        for a in rs.get("resource", {}).get("attributes", [])}
+                stage = resource.get("service.name", "")
+                for ss in rs.get("scopeSpans", []):
+                    for s in ss.get("spans", []):
+                        start = int(s["startTimeUnixNano"])
+                        yield {
+                            "trace_id": s["traceId"],
+                            "span_id": s["spanId"],
+                            "stage": stage[len("os2datascanner-"):]
+                                    if stage.startswith("os2datascanner-")
+                                    else stage,
+                            "name": s["name"],
+                            "start": start / 1e9,
+                            "duration": (
+                                    int(s["endTimeUnixNano"]) - start) / 1e9,
+                            "pid": resource.get("process.pid"),
+                            "attributes": {
+                                    a["key"]: _otlp_value(a["value"])
+                                    for a in s.get("attributes", [])}
+                        }
+
+
+def _matches_scan_tag(value, scan_tag):
+    # Scan tags produced by the administration system are dictionaries whose
+    # "time" field uniquely identifies a scan
+    return value == scan_tag or (
+            isinstance(value, dict) and value.get("time") == scan_tag)
+
+
+def summarise(spans, scan_tag=None):
+    """Summarises a collection of spans, returning a pair of lists:
+
+    - one dictionary for each traced object, giving its trace identifier,
+      the identifier of the trace of the object it was found inside (if
+      there was one), its name, the total duration of its spans ("own"), and
+      that total plus the totals of all of the objects found inside it
+      ("total"), sorted by total; and
+    - one dictionary for each kind of span, identified by its stage and name,
+      giving the number of such spans and their total, mean and maximum
+      duration, sorted by total.
+
+    If @scan_tag is not None, only objects with a span associated with that
+    scan tag (and the objects found inside them) are included."""
+    by_trace = {}
+    for s in spans:
+        by_trace.setdefault(s["trace_id"], []).append(s)
+
+    objects = {}
+    for trace_id, trace in by_trace.items():
+        obj = objects[trace_id] = {
+            "trace_id": trace_id,
+            "parent": None,
+            "object": None,
+            "scan_tag": None,
+            "own": 0.0,
+            "total": 0.0,
+            "spans": trace,
+        }
+        for s in trace:
+            attributes = s.get("attributes", {})
+            obj["own"] += s["duration"]
+            obj["parent"] = obj["parent"] or attributes.get("parent")
+            obj["object"] = obj["object"] or attributes.get("object")
+            if obj["scan_tag"] is None:
+                obj["scan_tag"] = attributes.get("scan_tag")
+
+    children = {}
+    for obj in objects.values():
+        if obj["parent"] in objects:
+            children.setdefault(obj["parent"], []).append(obj["trace_id"])
+
+    def _total(trace_id, seen):
+        obj = objects[trace_id]
+        total = obj["own"]
+        for child in children.get(trace_id, []):
+            if child not in seen:
+                seen.add(child)
+                total += _total(child, seen)
+        return total
+
+    selected = []
+    for obj in objects.values():
+        if scan_tag is not None:
+            # Objects inherit the scan tag of the object they were found in
+            ancestor, seen = obj, set()
+            while (ancestor["scan_tag"] is None
+                    and ancestor["parent"] in objects
+                    and ancestor["parent"] not in seen):
+                seen.add(ancestor["parent"])
+                ancestor = objects[ancestor["parent"]]
+            if not _matches_scan_tag(ancestor["scan_tag"], scan_tag):
+                continue
+        obj["total"] = _total(obj["trace_id"], {obj["trace_id"]})
+        selected.append(obj)
+
+    stages = {}
+    for obj in selected:
+        for s in obj["spans"]:
+            stage = stages.setdefault((s["stage"], s["name"]), {
+                "stage": s["stage"],
+                "name": s["name"],
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+            })
+            stage["count"] += 1
+            stage["total"] += s["duration"]
+            stage["max"] = max(stage["max"], s["duration"])
+    for stage in stages.values():
+        stage["mean"] = stage["total"] / stage["count"]
+
+    for obj in selected:
+        del obj["spans"]
+    return (sorted(selected, key=lambda o: o["total"], reverse=True),
+            sorted(stages.values(), key=lambda s: s["total"], reverse=True))
@@ -1,13 +1,19 @@
 from os import getpid
+from time import monotonic
+from heapq import heappush, heappop
+from itertools import count
+import signal
 
-from prometheus_client import start_http_server
+from prometheus_client import Counter, Gauge, start_http_server
 
-from ..model.core import SourceManager
+from .. import settings as engine2_settings
+from ..model.core import FileResource, SourceManager
 from .utilities.args import (AppendReplaceAction, make_common_argument_parser,
-        make_sourcemanager_configuration_block)
+        make_pipeline_runner_arguments, make_sourcemanager_configuration_block)
 from .utilities.pika import PikaPipelineRunner
 from .utilities.systemd import notify_ready, notify_stopping
 from .utilities.prometheus import prometheus_summary
+from .utilities.prefork import PreforkSupervisor
 from .explorer import message_received_raw as explorer_handler
 from .processor import message_received_raw as processor_handler
 from .matcher import message_received_raw as matcher_handler
@@ -15,43 +21,178 @@ from .tagger import message_received_raw as tagger_handler
 from . import messages
 
 
-def explore(sm, msg):
-    for channel, message in explorer_handler(msg, "ss", sm, "co", "pr", None):
-        if channel == "co":
-            yield from process(sm, message)
-        elif channel in ('pr',):
-            yield channel, message
+def _explore(sm, body):
+    return explorer_handler(body, "ss", sm, "co", ["pr"], None)
 
 
-def process(sm, msg):
-    for channel, message in processor_handler(msg,
-            "co", sm, "re", "ss", ["pr"]):
-        if channel == "re":
-            yield from match(sm, message)
-        elif channel == "ss":
-            yield from explore(sm, message)
-        elif channel in ('pr',):
-            yield channel, message
+def _process(sm, body):
+    return processor_handler(body, "co", sm, "re", "ss", ["pr"])
 
 
-def match(sm, msg):
-    for channel, message in matcher_handler(msg, "re", ["ma"], "me", "co"):
-        if channel == "me":
-            yield from tag(sm, message)
-        elif channel == "co":
-            yield from process(sm, message)
-        elif channel in ('ma',):
-            yield channel, message
+def _match(sm, body):
+    return matcher_handler(body, "re", ["ma"], "me", "co")
 
 
-def tag(sm, msg):
-    yield from tagger_handler(msg, "ha", sm, "me", "pr")
+def _tag(sm, body):
+    return tagger_handler(body, "ha", sm, "me", "pr")
+
+
+# For each stage, the stage that should handle each of its output channels
+# (or None if messages on that channel are a final result of the worker)
+_routes = {
+    _explore: {"co": _process, "pr": None},
+    _process: {"re": _match, "ss": _explore, "pr": None},
+    _match: {"me": _tag, "co": _process, "ma": None},
+    _tag: {"me": None, "pr": None},
+}
+
+
+spilled_objects = Counter(
+        "os2datascanner_pipeline_worker_spilled",
+        "Objects sent back to the conversions queue because the message that"
+        " contained them exceeded its budget")
+queued_tasks = Gauge(
+        "os2datascanner_pipeline_worker_queued",
+        "Pipeline stages waiting to be run for the current message")
+
+
+class Scheduler:
+    """A Scheduler runs all of the pipeline stages needed to finish handling
+    a conversion message in this process. Rather than chaining the stages
+    together recursively, it keeps an explicit queue of pending work, so
+    deeply nested objects (a zip file in an email in a PDF...) don't build up
+    a deep stack of half-finished stages.
+
+    The order in which work is done is configurable:
+
+    - "depth-first" finishes each object, and everything in it, before
+      moving on to the next one (like a recursive implementation would);
+    - "breadth-first" finishes the objects at each level of nesting before
+      looking inside any of them; and
+    - "smallest-first" prefers the smallest objects available.
+
+    Each message also has a budget: limits on the number and total size of
+    the objects found inside it, and on the time spent on it. Once the budget
+    has been used up, objects that haven't been started yet are sent back to
+    the conversions queue to be handled later, as messages in their own
+    right. (So are newly found objects when too many are already waiting to
+    be started, so that a container with millions of entries doesn't have to
+    be held in memory.)"""
+
+    ORDERS = ("depth-first", "breadth-first", "smallest-first",)
+
+    def __init__(self, source_manager, *, order=None,
+            max_objects=None, max_bytes=None, max_time=None,
+            max_queued=None):
+        config = engine2_settings.pipeline["worker"]
+        self._sm = source_manager
+        self._order = order or config["order"]
+        if self._order not in self.ORDERS:
+            raise ValueError(self._order)
+        self._max_objects = (
+                max_objects if max_objects is not None
+                else config["max_objects"])
+        self._max_bytes = (
+                max_bytes if max_bytes is not None
+                else config["max_bytes"])
+        self._max_time = (
+                max_time if max_time is not None
+                else config["max_time"])
+        self._max_queued = (
+                max_queued if max_queued is not None
+                else config["max_queued"])
+
+    def _size_of(self, body):
+        """Returns the size of the object behind a conversion message, or 0
+        if that can't be worked out."""
+        try:
+            resource = messages.ConversionMessage.from_json_object(
+                    body).handle.follow(self._sm)
+            return resource.get_size().value or 0
+        except Exception:
+            return 0
+
+    def run(self, body, *, spill=True):
+        """Handles a conversion message, yielding a (channel, message) pair
+        for every result: "ma" for matches, "me" for metadata and "pr" for
+        problems. Objects that didn't fit into the budget are yielded on the
+        "co" channel as new conversion messages (unless @spill is false, in
+        which case the budget is ignored)."""
+        measure = (self._order == "smallest-first"
+                or bool(spill and self._max_bytes))
+        queue = []
+        serial = count()
+        started = monotonic()
+        objects = 0
+        total_bytes = 0
+        queued_objects = 0
+
+        def _push(stage, body, depth, size, new, runs):
+            if self._order == "depth-first":
+                # Children of the most recently run task come first
+                primary = -runs
+            elif self._order == "breadth-first":
+                primary = depth
+            else:
+                primary = size
+            heappush(queue,
+                    (primary, next(serial), stage, body, depth, size, new))
+
+        _push(_process, body, 0, 0, False, 0)
+        runs = 0
+        while queue:
+            _, _, stage, body, depth, size, new = heappop(queue)
+            queued_tasks.set(len(queue))
+            if new:
+                queued_objects -= 1
+                if spill and (
+                        (self._max_objects
+                                and objects >= self._max_objects)
+                        or (self._max_bytes
+                                and total_bytes + size > self._max_bytes)
+                        or (self._max_time
+                                and monotonic() - started > self._max_time)):
+                    yield ("co", _spill(body))
+                    continue
+                objects += 1
+                total_bytes += size
+
+            runs += 1
+            for channel, message in stage(self._sm, body):
+                next_stage = _routes[stage][channel]
+                if next_stage is None:
+                    yield (channel, message)
+                elif stage is _explore:
+                    # This is a new object found inside the one we started
+                    # with
+                    if (spill and self._max_queued
+                            and queued_objects >= self._max_queued):
+                        yield ("co", _spill(message))
+                        continue
+                    queued_objects += 1
+                    _push(next_stage, message, depth,
+                            self._size_of(message) if measure else 0,
+                            True, runs)
+                else:
+                    _push(next_stage, message,
+                            depth + 1 if next_stage is _explore else depth,
+                            size, False, runs)
+
+
+def _spill(body):
+    """Marks the conversion message @body as having been sent back to the
+    conversions queue by a worker."""
+    spilled_objects.inc()
+    return dict(body, spilled=True)
 
 
 def message_received_raw(body, channel,
-        source_manager, matches_qs, metadata_q, problems_qs, status_q):
+        source_manager, matches_qs, metadata_q, problems_qs, status_q,
+        conversions_q=None):
     try:
-        for channel, message in process(source_manager, body):
+        scheduler = Scheduler(source_manager)
+        for channel, message in scheduler.run(
+                body, spill=bool(conversions_q)):
             if channel == "ma":
                 for matches_q in matches_qs:
                     yield (matches_q, message)
@@ -60,13 +201,19 @@ def message_received_raw(body, channel,
             elif channel == "pr":
                 for problems_q in problems_qs:
                     yield (problems_q, message)
+            elif channel == "co":
+                yield (conversions_q, message)
     finally:
-        if status_q:
+        # Spilled objects are part of an object whose status has already
+        # been reported
+        if status_q and not body.get("spilled"):
             message = messages.ConversionMessage.from_json_object(body)
             object_size = 0
             object_type = "application/octet-stream"
             try:
                 resource = message.handle.follow(source_manager)
+                if message.mime_type and isinstance(resource, FileResource):
+                    resource.set_computed_type(message.mime_type)
                 object_size = resource.get_size().value
                 object_type = resource.compute_type()
             except Exception:
@@ -121,33 +268,86 @@ def main():
                     +" be written",
             default=None)
 
+    processes = parser.add_argument_group("processes")
+    processes.add_argument(
+            "--processes",
+            type=int,
+            metavar="COUNT",
+            help="run %(metavar)s worker processes under a supervisor process"
+                    " (if metrics are enabled, each process will use its own"
+                    " port, counting up from the Prometheus port)",
+            default=1)
+    processes.add_argument(
+            "--max-memory",
+            type=int,
+            metavar="MIB",
+            help="restart a supervised worker process when its resident set"
+                    " size exceeds %(metavar)s mebibytes",
+            default=None)
+    processes.add_argument(
+            "--shutdown-timeout",
+            type=float,
+            metavar="SECONDS",
+            help="kill a supervised worker process if it has not finished"
+                    " its current work %(metavar)s seconds after being asked"
+                    " to stop",
+            default=60)
+
     args = parser.parse_args()
 
+    if args.processes > 1:
+        PreforkSupervisor(
+                lambda slot: run_worker(args, slot=slot),
+                args.processes,
+                max_memory=(
+                        args.max_memory * 1024 * 1024
+                        if args.max_memory else None),
+                shutdown_timeout=args.shutdown_timeout).run()
+    else:
+        run_worker(args)
+
+
+def run_worker(args, *, slot=None):
+    """Runs a worker until it is asked to stop. If @slot is not None, then
+    this worker is being run by a PreforkSupervisor, which will take care of
+    notifying systemd about the state of the service."""
     if args.enable_metrics:
-        start_http_server(args.prometheus_port)
+        start_http_server(int(args.prometheus_port) + (slot or 0))
 
     class ProcessorRunner(PikaPipelineRunner):
+        trace_stage = "worker"
+
         @prometheus_summary("os2datascanner_pipeline_worker",
                 "Objects handled")
         def handle_message(self, body, *, channel=None):
             if args.debug:
                 print(channel, body)
             return message_received_raw(body, channel, source_manager,
-                    args.matches, args.metadata, args.problems, args.status)
+                    args.matches, args.metadata, args.problems, args.status,
+                    args.conversions)
 
     with SourceManager(width=args.width) as source_manager:
         with ProcessorRunner(
                 read=[args.conversions],
                 write=[*args.matches, *args.problems, args.metadata,
-                        *([args.status] if args.status else [])],
-                heartbeat=6000) as runner:
+                        *([args.status] if args.status else []),
+                        # Objects that don't fit into a message's budget are
+                        # sent back to our own input queue
+                        args.conversions],
+                heartbeat=6000,
+                **make_pipeline_runner_arguments(args)) as runner:
+            # Finish the current object before stopping
+            signal.signal(signal.SIGTERM,
+                    lambda signum, frame: runner.request_stop())
             try:
                 print("Start")
-                notify_ready()
+                if slot is None:
+                    notify_ready()
                 runner.run_consumer()
             finally:
                 print("Stop")
-                notify_stopping()
+                if slot is None:
+                    notify_stopping()
 
 if __name__ == "__main__":
     main()
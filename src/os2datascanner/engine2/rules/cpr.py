@@ -1,12 +1,18 @@
+import re
+
 from .rule import Rule, Sensitivity
 from .regex import RegexRule
 from .logical import oxford_comma
 from .utilities.cpr_probability import (get_birth_date, cpr_exception_dates,
-        modulus11_check_raw, CprProbabilityCalculator)
+        modulus11_check_raw, cpr_check_batch, CprProbabilityCalculator)
 
 cpr_regex = r"\b(\d{2}[\s]?\d{2}[\s]?\d{2})(?:[\s\-/\.]|\s\-\s)?(\d{4})\b"
 calculator = CprProbabilityCalculator()
 
+# Only candidates that consist of exactly ten ASCII digits can be checked by
+# cpr_check_batch (\d and \s will also match other Unicode characters)
+_batchable = re.compile(r"[0-9]{10}")
+
 
 class CPRRule(RegexRule):
     type_label = "cpr"
@@ -34,26 +40,44 @@ class CPRRule(RegexRule):
         else:
             return "CPR number"
 
-    def match(self, content):
-        if content is None:
-            return
-
-        for m in self._compiled_expression.finditer(content):
-            cpr = m.group(1).replace(" ", "") + m.group(2)
-            if self._modulus_11:
-                try:
-                    if not modulus11_check(cpr):
-                        # This can't be a CPR number
-                        continue
-                except ValueError:
-                    pass
-
-            probability = 1.0
-            if self._ignore_irrelevant:
-                probability = calculator.cpr_check(cpr)
-                if isinstance(probability, str):
-                    # Error text -- this can't be a CPR number
-                    continue
+    def _check_candidate(self, cpr):
+        """Returns the probability that a single candidate is a CPR number,
+        or 0.0 if it can't be one."""
+        if self._modulus_11:
+            try:
+                if not modulus11_check(cpr):
+                    # This can't be a CPR number
+                    return 0.0
+            except ValueError:
+                pass
+
+        probability = 1.0
+        if self._ignore_irrelevant:
+            probability = calculator.cpr_check(cpr)
+            if isinstance(probability, str):
+                # Error text -- this can't be a CPR number
+                return 0.0
+        return probability
+
+    def match_candidates(self, content, candidates):
+        candidates = list(candidates)
+        cprs = [m.group(1).replace(" ", "") + m.group(2) for m in candidates]
+
+        # Check all of the ordinary candidates at once, leaving the
+        # probabilities of the others to be computed individually
+        probabilities = [None] * len(cprs)
+        batch = [i for i, cpr in enumerate(cprs) if _batchable.fullmatch(cpr)]
+        for i, probability in zip(batch, cpr_check_batch(
+                [cprs[i] for i in batch],
+                modulus_11=self._modulus_11,
+                ignore_irrelevant=self._ignore_irrelevant)):
+            probabilities[i] = float(probability)
+
+        for m, cpr, probability in zip(candidates, cprs, probabilities):
+            if probability is None:
+                probability = self._check_candidate(cpr)
+            if not probability:
+                continue
 
             cpr = cpr[0:4] + "XXXXXX"
             low, high = m.span()
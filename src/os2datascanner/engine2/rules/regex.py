@@ -1,6 +1,7 @@
 import re
 
 from ..conversions.types import OutputType
+from ..conversions.utilities.text_stream import TextStream
 from .rule import Rule, SimpleRule, Sensitivity
 
 
@@ -18,11 +19,40 @@ class RegexRule(SimpleRule):
     def presentation_raw(self):
         return "regular expression \"{0}\"".format(self._expression)
 
+    @property
+    def expression(self):
+        return self._expression
+
+    def find_candidates(self, content):
+        """Returns a list of all of the re.Match objects produced by this
+        RegexRule's expression for @content. (The result can be reused by any
+        other RegexRule with the same expression.)"""
+        if content is None:
+            return []
+        return list(self._compiled_expression.finditer(content))
+
     def match(self, content):
         if content is None:
             return
+        elif isinstance(content, TextStream):
+            yield from self.match_stream(content)
+            return
 
-        for match in self._compiled_expression.finditer(content):
+        yield from self.match_candidates(
+                content, self._compiled_expression.finditer(content))
+
+    def match_stream(self, stream):
+        """As match(), but searches a TextStream a chunk at a time. The
+        offsets of the resulting matches are relative to the start of the
+        whole text."""
+        yield from match_stream_all([self], stream)[self]
+
+    def match_candidates(self, content, candidates):
+        """As match(), but takes an iterable of the re.Match objects that
+        this RegexRule's expression would produce for @content instead of
+        searching for them again. (Subclasses that filter or transform those
+        objects should override this method.)"""
+        for match in candidates:
             yield {
                 "offset": match.start(),
                 "match": match.string[match.start():match.end()]
@@ -40,3 +70,28 @@ class RegexRule(SimpleRule):
                 expression=obj["expression"],
                 sensitivity=Sensitivity.make_from_dict(obj),
                 name=obj["name"] if "name" in obj else None)
+
+
+def match_stream_all(rules, stream):
+    """Evaluates several RegexRules against a TextStream in a single pass
+    over its content (rules with the same expression share their search).
+    Returns a dictionary mapping each rule to a list of its matches, whose
+    offsets are relative to the start of the whole text."""
+    rules = list(dict.fromkeys(rules))
+    expressions = list(dict.fromkeys(r.expression for r in rules))
+    compiled = {r.expression: r._compiled_expression for r in rules}
+    results = {r: [] for r in rules}
+    try:
+        for offset, text, all_candidates in stream.finditer_all(
+                [compiled[e] for e in expressions]):
+            candidates = dict(zip(expressions, all_candidates))
+            for rule in rules:
+                for match in rule.match_candidates(
+                        text, candidates[rule.expression]):
+                    match["offset"] += offset
+                    results[rule].append(match)
+    except UnicodeDecodeError:
+        # This isn't really text after all, so (as with the plain text
+        # converter) there's nothing to match against
+        return {r: [] for r in rules}
+    return results
@@ -1,6 +1,9 @@
 # import time
-from typing import Union
+from typing import Union, Sequence
 from datetime import date
+import calendar
+
+import numpy as np
 
 # Updated list of dates with CPR numbers violating the Modulo-11 check. (Last
 # synchronised with the CPR Office's list on March 31, 2020.)
@@ -74,6 +77,147 @@ def modulus11_check_raw(cpr):
     return sum([int(c) * v for c, v in zip(cpr, _mod_11_table)]) % 11 == 0
 
 
+def _legal_7s(year: int) -> list:
+    """Returns the possible values of CPR digit 7 for a given year."""
+    if 1858 <= year <= 1899:
+        return [5, 6, 7, 8]
+    elif 1900 <= year <= 1936:
+        return [0, 1, 2, 3]
+    elif 1937 <= year <= 1999:
+        return [0, 1, 2, 3, 4, 9]
+    elif 2000 <= year <= 2036:
+        return [4, 5, 6, 7, 8, 9]
+    elif 2037 <= year <= 2057:
+        return [5, 6, 7, 8]
+    else:
+        return []
+
+
+# Precomputed tables for locating a valid CPR number in the list of all of the
+# valid CPR numbers for its birth date without having to build that list.
+# Within each block of 1000 serial numbers sharing a seventh digit, a number
+# is valid if the weighted sum of its last three digits has a particular
+# residue modulo 11; _serial_rank gives the number of smaller serial numbers
+# in the block with the same residue, and _residue_count the total number of
+# serial numbers in the block with each residue
+_serial_residue = np.array(
+        [(3 * (s // 100) + 2 * (s // 10 % 10) + s % 10) % 11
+         for s in range(1000)], dtype=np.int64)
+_serial_rank = np.zeros(1000, dtype=np.int64)
+_residue_count = np.zeros(11, dtype=np.int64)
+for _s in range(1000):
+    _serial_rank[_s] = _residue_count[_serial_residue[_s]]
+    _residue_count[_serial_residue[_s]] += 1
+
+# The first and last years that CPR numbers can represent
+_FIRST_YEAR = 1858
+_LAST_YEAR = 2057
+
+# The number of days in each month of each year, and the ordinal of the day
+# before the first day of each month of each year, indexed by [year -
+# _FIRST_YEAR, month] (with a zero-length month 0 to reject invalid months)
+_days_in_month = np.zeros((_LAST_YEAR - _FIRST_YEAR + 1, 13), dtype=np.int64)
+_month_ordinal = np.zeros((_LAST_YEAR - _FIRST_YEAR + 1, 13), dtype=np.int64)
+for _y in range(_FIRST_YEAR, _LAST_YEAR + 1):
+    for _m in range(1, 13):
+        _days_in_month[_y - _FIRST_YEAR, _m] = (
+                calendar.monthrange(_y, _m)[1])
+        _month_ordinal[_y - _FIRST_YEAR, _m] = (
+                date(_y, _m, 1).toordinal() - 1)
+
+# The sets of legal seventh digits for each year, as a boolean mask indexed by
+# [year - _FIRST_YEAR, digit]
+_legal_7_mask = np.zeros((_LAST_YEAR - _FIRST_YEAR + 1, 10), dtype=bool)
+for _y in range(_FIRST_YEAR, _LAST_YEAR + 1):
+    _legal_7_mask[_y - _FIRST_YEAR, _legal_7s(_y)] = True
+
+_cpr_exception_ordinals = np.array(
+        sorted(d.toordinal() for d in cpr_exception_dates), dtype=np.int64)
+
+# Probabilities for valid CPR numbers, based on their position in the list
+# of valid CPR numbers for their birth date: numbers whose index is no greater
+# than _index_limits[i] have probability _index_probabilities[i]
+_index_limits = np.array([100, 200, 250, 350])
+_index_probabilities = np.array([1.0, 0.8, 0.6, 0.25, 0.1])
+
+
+def cpr_check_batch(
+        cprs: Sequence[str], *, modulus_11: bool = True,
+        ignore_irrelevant: bool = True, today: date = None) -> np.ndarray:
+    """Checks a sequence of CPR numbers, each of which must consist of exactly
+    ten ASCII digits, all at once.
+
+    Returns an array of probabilities that agrees with the per-number checks
+    performed by CPRRule: a candidate that would have been rejected by the
+    modulus-11 check (if @modulus_11 is set) or by
+    CprProbabilityCalculator.cpr_check (if @ignore_irrelevant is set) has
+    probability 0.0, and other candidates have the probability computed by
+    CprProbabilityCalculator.cpr_check (or 1.0, if @ignore_irrelevant is not
+    set)."""
+    count = len(cprs)
+    probabilities = np.ones(count)
+    if not count or not (modulus_11 or ignore_irrelevant):
+        return probabilities
+
+    digits = (np.frombuffer("".join(cprs).encode("ascii"), dtype=np.uint8)
+            .reshape(count, 10).astype(np.int64) - ord("0"))
+
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 2] * 10 + digits[:, 3]
+    short_year = digits[:, 4] * 10 + digits[:, 5]
+    digit_7 = digits[:, 6]
+
+    # Work out the full year in the same way as get_birth_date
+    year = np.select(
+            [digit_7 <= 3,
+             digit_7 == 4,
+             digit_7 <= 8],
+            [1900 + short_year,
+             np.where(short_year > 36, 1900, 2000) + short_year,
+             np.where(short_year > 57, 1800, 2000) + short_year],
+            np.where(short_year > 37, 1900, 2000) + short_year)
+    year_index = year - _FIRST_YEAR
+    month = np.where((month >= 1) & (month <= 12), month, 0)
+
+    valid_date = ((day >= 1)
+            & (day <= _days_in_month[year_index, month]))
+    ordinal = _month_ordinal[year_index, month] + day
+    exception_date = valid_date & np.isin(ordinal, _cpr_exception_ordinals)
+
+    weighted = digits @ np.array(_mod_11_table, dtype=np.int64)
+    modulus_ok = weighted % 11 == 0
+
+    accepted = np.ones(count, dtype=bool)
+    if modulus_11:
+        accepted &= valid_date & (modulus_ok | exception_date)
+    if ignore_irrelevant:
+        today = (today or date.today()).toordinal()
+        accepted &= (valid_date & (ordinal <= today)
+                & (modulus_ok | exception_date))
+
+        # The index of this CPR number in the list of valid CPR numbers for
+        # its birth date is the number of valid serial numbers in all of the
+        # blocks for earlier legal seventh digits, plus its rank in its own
+        # block
+        date_sum = weighted - digits[:, 6:] @ np.array(
+                _mod_11_table[6:], dtype=np.int64)
+        block_counts = _residue_count[
+                (-(date_sum[:, None] + 4 * np.arange(10))) % 11]
+        earlier_blocks = (_legal_7_mask[year_index]
+                & (np.arange(10) < digit_7[:, None]))
+        index = ((block_counts * earlier_blocks).sum(axis=1)
+                + _serial_rank[digits[:, 7] * 100
+                        + digits[:, 8] * 10 + digits[:, 9]])
+
+        probabilities = np.where(
+                modulus_ok,
+                _index_probabilities[np.searchsorted(
+                        _index_limits, index, side="left")],
+                0.5)
+
+    return np.where(accepted, probabilities, 0.0)
+
+
 class CprProbabilityCalculator(object):
     """
     Implemented logic:
@@ -88,6 +232,10 @@ class CprProbabilityCalculator(object):
       always 0.5
     """
 
+    MAX_CACHED_DATES = 366
+    """The maximum number of dates for which the list of possible CPRs will be
+    cached."""
+
     def __init__(self):
         # Cache of dates where the possible CPRs has already been calculated.
         self.cached_cprs = {}
@@ -119,18 +267,7 @@ class CprProbabilityCalculator(object):
         :param year: The year to check.
         :return: A list of legal digit 7 values.
         """
-        legal_7s = []
-        if 1858 <= year <= 1899:
-            legal_7s = [5, 6, 7, 8]
-        elif 1900 <= year <= 1936:
-            legal_7s = [0, 1, 2, 3]
-        elif 1937 <= year <= 1999:
-            legal_7s = [0, 1, 2, 3, 4, 9]
-        elif 2000 <= year <= 2036:
-            legal_7s = [4, 5, 6, 7, 8, 9]
-        elif 2037 <= year <= 2057:
-            legal_7s = [5, 6, 7, 8]
-        return legal_7s
+        return _legal_7s(year)
 
     def _calculate_date(self, cpr: str) -> date:
         """
@@ -191,6 +328,9 @@ class CprProbabilityCalculator(object):
                     if valid:
                         legal_cprs.append(cpr_candidate)
 
+        if len(self.cached_cprs) >= self.MAX_CACHED_DATES:
+            # Forget the oldest entry
+            del self.cached_cprs[next(iter(self.cached_cprs))]
         self.cached_cprs[cache_key] = legal_cprs
         return legal_cprs
 
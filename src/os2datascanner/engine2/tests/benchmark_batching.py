@@ -0,0 +1,103 @@
+from time import perf_counter
+from json import dumps
+import unittest
+
+from os2datascanner.engine2.pipeline.utilities.pika import (
+        PikaConnectionHolder, PikaPipelineRunner)
+
+
+INPUT_Q = "os2ds_benchmark_input"
+OUTPUT_Q = "os2ds_benchmark_output"
+
+
+class StopBenchmark(Exception):
+    pass
+
+
+class BenchmarkRunner(PikaPipelineRunner):
+    """A PikaPipelineRunner that copies every message it receives to its
+    output queue, stopping as soon as a given number of messages have been
+    sent."""
+    def __init__(self, output_q, count, **kwargs):
+        super().__init__(**kwargs)
+        self._output_q = output_q
+        self._count = count
+        self._published = 0
+
+    def handle_message(self, message_body, *, channel=None):
+        yield (self._output_q, message_body)
+
+    def publish_message(self, routing_key, message):
+        super().publish_message(routing_key, message)
+        self._published += 1
+
+    def _check_finished(self):
+        if self._published >= self._count:
+            raise StopBenchmark()
+
+    def dispatch_pending(self, *, expected: int):
+        super().dispatch_pending(expected=expected)
+        self._check_finished()
+
+    def dispatch_batch(self):
+        super().dispatch_batch()
+        self._check_finished()
+
+
+def _run(count, size, body):
+    """Sends @count copies of @body through a BenchmarkRunner with the given
+    batch size, returning the time (in seconds) that it took."""
+    with PikaConnectionHolder(heartbeat=6000) as ch:
+        for q in (INPUT_Q, OUTPUT_Q,):
+            ch.channel.queue_declare(q, passive=False,
+                    durable=True, exclusive=False, auto_delete=False)
+            ch.channel.queue_purge(q)
+        for _ in range(count):
+            ch.channel.basic_publish(
+                    exchange='', routing_key=INPUT_Q, body=body)
+
+    with BenchmarkRunner(
+            OUTPUT_Q, count,
+            read=[INPUT_Q],
+            write=[OUTPUT_Q],
+            heartbeat=6000,
+            prefetch_count=size,
+            batch_size=size) as runner:
+        start = perf_counter()
+        try:
+            runner.run_consumer()
+        except StopBenchmark:
+            pass
+        return perf_counter() - start
+
+
+class BatchingBenchmark(unittest.TestCase):
+    """Measures the throughput of a trivial pipeline stage at different batch
+    sizes. (The last batch will wait for the batch timeout if a size does not
+    divide the number of messages.)
+
+    This module isn't run as part of the normal test suite, and it needs an
+    AMQP server; to run it, use
+    "python -m unittest os2datascanner.engine2.tests.benchmark_batching"."""
+
+    count = 10000
+    sizes = (1, 10, 50, 100, 250,)
+
+    def test_benchmark(self):
+        # A message of roughly the size of a small ConversionMessage
+        body = dumps({
+            "scan_tag": "benchmark",
+            "padding": "x" * 2048
+        }).encode()
+
+        print("{0:>10} {1:>12} {2:>12}".format(
+                "batch", "seconds", "messages/s"))
+        try:
+            for size in self.sizes:
+                duration = _run(self.count, size, body)
+                print("{0:>10} {1:>12.3f} {2:>12.1f}".format(
+                        size, duration, self.count / duration))
+        finally:
+            with PikaConnectionHolder(heartbeat=6000) as ch:
+                for q in (INPUT_Q, OUTPUT_Q,):
+                    ch.channel.queue_delete(q)
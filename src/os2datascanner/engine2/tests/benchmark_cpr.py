@@ -0,0 +1,65 @@
+from time import perf_counter
+import random
+import unittest
+
+from os2datascanner.engine2.rules.cpr import CPRRule
+from os2datascanner.engine2.rules.utilities.cpr_probability import (
+        cpr_check_batch)
+
+from .test_probabilistic_cpr import _cpr
+
+
+def _make_spreadsheet(rows):
+    """Returns the text of a CSV file with several columns of numbers, about
+    half of which are valid CPR numbers."""
+    random.seed(rows)
+    lines = []
+    for _ in range(rows):
+        lines.append(",".join([
+            str(random.randrange(1, 100000)),
+            _cpr(),
+            "{0:010d}".format(random.randrange(10 ** 10)),
+            "{0:.2f}".format(random.random() * 1000)
+        ]))
+    return "\n".join(lines)
+
+
+def _check_per_candidate(rule, cprs):
+    # The path used before CPR candidates were checked in batches
+    return [rule._check_candidate(cpr) for cpr in cprs]
+
+
+def _check_batched(rule, cprs):
+    return cpr_check_batch(cprs,
+            modulus_11=rule._modulus_11,
+            ignore_irrelevant=rule._ignore_irrelevant)
+
+
+class CPRBenchmark(unittest.TestCase):
+    """Compares the time taken to check the CPR number candidates in a large
+    spreadsheet one at a time and all at once.
+
+    This module isn't run as part of the normal test suite; to run it, use
+    "python -m unittest os2datascanner.engine2.tests.benchmark_cpr"."""
+
+    def test_benchmark(self):
+        for rows in (100, 1000):
+            content = _make_spreadsheet(rows)
+            cprs = [m.group(1).replace(" ", "") + m.group(2)
+                    for m in CPRRule().find_candidates(content)]
+            for settings in (
+                    dict(modulus_11=True, ignore_irrelevant=False),
+                    dict(modulus_11=True, ignore_irrelevant=True)):
+                timings = []
+                for implementation in (
+                        _check_per_candidate, _check_batched):
+                    # Each run gets a fresh rule, but the per-candidate path
+                    # still benefits from the calculator's shared cache
+                    rule = CPRRule(**settings)
+                    start = perf_counter()
+                    implementation(rule, cprs)
+                    timings.append(perf_counter() - start)
+                print("{0} candidates, {1}: per-candidate {2:.3f}s,"
+                        " batched {3:.3f}s ({4:.1f}x)".format(
+                                len(cprs), settings, *timings,
+                                timings[0] / timings[1]))
@@ -0,0 +1,79 @@
+from time import perf_counter
+import unittest
+
+from os2datascanner.engine2.model.core import Handle
+from os2datascanner.engine2.model.file import FilesystemHandle
+from os2datascanner.engine2.model.derived.mail import MailSource, MailPartHandle
+from os2datascanner.engine2.model.derived.zip import ZipSource, ZipHandle
+from os2datascanner.engine2.utilities.equality import TypePropertyEquality
+
+
+def _make_chain(depth, root="/home/user/archive.zip"):
+    """Returns a Handle nested @depth levels deep, alternating between files
+    in Zip files and attachments to emails."""
+    handle = FilesystemHandle.make_handle(root)
+    for level in range(depth):
+        if level % 2:
+            handle = MailPartHandle(
+                    MailSource(handle), "1/attachment.zip", "application/zip")
+        else:
+            handle = ZipHandle(ZipSource(handle), "folder/message.eml")
+    # Make sure that the result has never been hashed before
+    return Handle.from_json_object(handle.to_json_object())
+
+
+def _get_state(obj):
+    return obj._get_state(obj)
+
+
+# The behaviour of TypePropertyEquality before hash values were cached
+def _uncached_hash(obj):
+    if not isinstance(obj, TypePropertyEquality):
+        return hash(obj)
+    h = 42 + hash(type(obj))
+    for k, v in _get_state(obj).items():
+        h += hash(k) + (_uncached_hash(v) * 3)
+    # Python only reduces the results of __hash__ functions that don't fit in
+    # a machine word
+    return h if -2 ** 63 < h < 2 ** 63 else hash(h)
+
+
+def _uncached_eq(a, b):
+    if not isinstance(a, TypePropertyEquality):
+        return a == b
+    elif type(a) is not type(b):
+        return False
+    sa, sb = _get_state(a), _get_state(b)
+    return sa.keys() == sb.keys() and all(
+            _uncached_eq(v, sb[k]) for k, v in sa.items())
+
+
+def _time(func, *args, repeats=10000):
+    start = perf_counter()
+    for _ in range(repeats):
+        func(*args)
+    return perf_counter() - start
+
+
+class HandleBenchmark(unittest.TestCase):
+    """Compares the time taken to hash and compare deeply nested Handles
+    with and without cached hash values.
+
+    This module isn't run as part of the normal test suite; to run it, use
+    "python -m unittest os2datascanner.engine2.tests.benchmark_handles"."""
+
+    def test_benchmark(self):
+        for depth in (2, 8, 32):
+            a = _make_chain(depth)
+            b = _make_chain(depth)
+            c = _make_chain(depth, root="/home/user/other.zip")
+            for label, before, after, args in (
+                    ("hash", _uncached_hash, hash, (a,)),
+                    ("equal", _uncached_eq, Handle.__eq__, (a, b)),
+                    ("unequal", _uncached_eq, Handle.__eq__, (a, c))):
+                self.assertEqual(before(*args), after(*args))
+                timings = (_time(before, *args), _time(after, *args))
+                print("depth {0}, {1}: uncached {2:.3f}s,"
+                        " cached {3:.3f}s ({4:.1f}x)".format(
+                                depth, label, *timings,
+                                timings[0] / timings[1]))
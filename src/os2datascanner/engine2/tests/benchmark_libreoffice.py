@@ -0,0 +1,55 @@
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from subprocess import DEVNULL
+import os.path
+import unittest
+
+from os2datascanner.engine2.utilities.tools import run_tool
+from os2datascanner.engine2.model.derived.libreoffice import LibreOfficePool
+
+
+here_path = os.path.dirname(__file__)
+test_data_path = os.path.join(here_path, "data")
+
+
+def _run_once(path, outputdir):
+    """Converts a document by starting a new LibreOffice process, as every
+    conversion used to."""
+    with TemporaryDirectory() as profile:
+        run_tool(["libreoffice",
+                "-env:UserInstallation=file://{0}".format(profile),
+                "--infilter=writer8", "--convert-to", "html",
+                "--outdir", outputdir, path],
+                stdout=DEVNULL, stderr=DEVNULL, check=True)
+
+
+class LibreOfficeBenchmark(unittest.TestCase):
+    """Compares the time taken to convert a document to HTML twenty times by
+    starting LibreOffice for each conversion and by using the long-lived
+    instances of a LibreOfficePool.
+
+    This module isn't run as part of the normal test suite; to run it, use
+    "python -m unittest os2datascanner.engine2.tests.benchmark_libreoffice"."""
+
+    def test_benchmark(self):
+        path = os.path.join(test_data_path, "libreoffice/embedded-cpr.odt")
+        pool = LibreOfficePool()
+        results = {}
+        try:
+            for label, convert in (
+                    ("new process per document", _run_once),
+                    ("LibreOfficePool", lambda path, outputdir: pool.convert(
+                            path, "writer8", "html", outputdir)),):
+                start = perf_counter()
+                for _ in range(20):
+                    with TemporaryDirectory() as outputdir:
+                        convert(path, outputdir)
+                        results[label] = sorted(os.listdir(outputdir))
+                print("{0}: {1:.2f}s".format(label, perf_counter() - start))
+        finally:
+            pool.close()
+
+        self.assertEqual(
+                len(set(tuple(v) for v in results.values())),
+                1,
+                "the pool's output files differ from LibreOffice's")
@@ -0,0 +1,69 @@
+from time import perf_counter
+from tempfile import TemporaryDirectory
+import os.path
+import pdfrw
+import unittest
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import Source, SourceManager
+from os2datascanner.engine2.model.file import FilesystemHandle
+
+
+here_path = os.path.dirname(__file__)
+test_data_path = os.path.join(here_path, "data")
+
+
+def _make_long_pdf(path, pages):
+    """Writes a PDF file with the given number of pages, made by repeating
+    the pages of one of the test documents."""
+    reader = pdfrw.PdfReader(os.path.join(
+            test_data_path, "pdf/Midler-til-frivilligt-arbejde.pdf"))
+    writer = pdfrw.PdfWriter()
+    for i in range(pages):
+        writer.addpage(reader.pages[i % len(reader.pages)])
+    writer.write(path)
+
+
+def _extract_all(path):
+    """Opens every page of a PDF file in the same way as the worker stage,
+    returning the number of objects extracted."""
+    count = 0
+    with SourceManager() as sm:
+        source = Source.from_handle(FilesystemHandle.make_handle(path), sm)
+        for page_handle in source.handles(sm):
+            page_source = Source.from_handle(page_handle, sm)
+            for _ in page_source.handles(sm):
+                count += 1
+    return count
+
+
+class PDFBenchmark(unittest.TestCase):
+    """Compares the time taken to extract the text and images from every page
+    of a 500-page PDF file with different batch sizes.
+
+    This module isn't run as part of the normal test suite; to run it, use
+    "python -m unittest os2datascanner.engine2.tests.benchmark_pdf"."""
+
+    def test_benchmark(self):
+        config = engine2_settings.model["pdf"]
+        original_batch_size = config["batch_size"]
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "long.pdf")
+            _make_long_pdf(path, 500)
+
+            results = {}
+            try:
+                for batch_size in (1, 10, 50, 500):
+                    config["batch_size"] = batch_size
+                    start = perf_counter()
+                    results[batch_size] = _extract_all(path)
+                    elapsed = perf_counter() - start
+                    print("batch size {0}: {1:.2f}s ({2:.1f} ms/page)".format(
+                            batch_size, elapsed, elapsed * 1000 / 500))
+            finally:
+                config["batch_size"] = original_batch_size
+
+            self.assertEqual(
+                    len(set(results.values())),
+                    1,
+                    "batch size affected the number of extracted objects")
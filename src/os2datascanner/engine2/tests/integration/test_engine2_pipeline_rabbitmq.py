@@ -34,6 +34,22 @@ class Engine2PipelineTests(unittest.TestCase):
         self.runner.clear()
 
     def test_simple_regex_match(self):
+        self.run_simple_regex_match()
+
+    def test_simple_regex_match_batched(self):
+        self.runner.clear()
+        self.runner = PipelineTestRunner(
+                read=["os2ds_scan_specs", "os2ds_conversions",
+                        "os2ds_representations", "os2ds_matches",
+                        "os2ds_handles", "os2ds_metadata",
+                        "os2ds_problems"],
+                write=["os2ds_results"],
+                heartbeat=6000,
+                batch_size=10,
+                batch_timeout=0.1)
+        self.run_simple_regex_match()
+
+    def run_simple_regex_match(self):
         print(Source.from_url(data_url).to_json_object())
         obj = {
             "scan_tag": {
@@ -50,11 +66,16 @@ class Engine2PipelineTests(unittest.TestCase):
         self.runner.channel.basic_publish(exchange='',
                 routing_key="os2ds_scan_specs",
                 body=dumps(obj).encode())
+        if self.runner.batched:
+            # The runner's channel is transactional in batched mode
+            self.runner.channel.tx_commit()
 
         messages = {}
 
         def result_received(channel, method, properties, body):
             channel.basic_ack(method.delivery_tag)
+            if self.runner.batched:
+                channel.tx_commit()
             body = loads(body.decode("utf-8"))
             messages[body["origin"]] = body
             if len(messages) == 2:
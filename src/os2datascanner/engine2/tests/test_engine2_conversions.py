@@ -1,10 +1,21 @@
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 import os.path
 import unittest
+from unittest.mock import patch
 
 from os2datascanner.engine2.model.core import SourceManager
 from os2datascanner.engine2.model.file import FilesystemHandle
 from os2datascanner.engine2.conversions.types import OutputType
 from os2datascanner.engine2.conversions.registry import convert
+from os2datascanner.engine2.conversions.text.html import html_processor
+from os2datascanner.engine2.conversions.utilities.cache import (
+        ConversionCache)
+from os2datascanner.engine2.conversions.utilities.text_stream import (
+        TextStream)
+from os2datascanner.engine2.rules.cpr import CPRRule
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.rules.logical import AndRule, OrRule
+from os2datascanner.engine2.pipeline.matcher import execute_rule
 
 
 here_path = os.path.dirname(__file__)
@@ -57,3 +68,165 @@ class Engine2ConversionTest(unittest.TestCase):
                 convert(self._er, OutputType.Text, mime_override="text/html"),
                 None,
                 "empty HTML document did not produce empty conversion")
+
+    def test_conversion_cache(self):
+        calls = []
+
+        def _counting_processor(r):
+            calls.append(r)
+            return html_processor(r)
+
+        with TemporaryDirectory() as d:
+            cache = ConversionCache(d, 1024 * 1024)
+            for _ in range(2):
+                self.assertEqual(
+                        "This is only a test. "
+                        "There's one paragraph, "
+                        "and then there's the other paragraph.",
+                        cache.convert(self._hr, OutputType.Text,
+                                _counting_processor, 1))
+            self.assertEqual(
+                    len(calls),
+                    1,
+                    "cached conversion was performed again")
+
+            cache.convert(self._hr, OutputType.Text, _counting_processor, 2)
+            self.assertEqual(
+                    len(calls),
+                    2,
+                    "conversion cache ignored the converter version")
+
+    def test_conversion_cache_failures(self):
+        results = [None, "Recognised text"]
+
+        def _flaky_processor(r):
+            return results.pop(0) if results else "Converted again"
+
+        with TemporaryDirectory() as d:
+            cache = ConversionCache(d, 1024 * 1024)
+            with patch.object(type(self._ir), "make_stream",
+                    wraps=self._ir.make_stream) as make_stream:
+                self.assertIsNone(
+                        cache.convert(self._ir, OutputType.Text,
+                                _flaky_processor, 1))
+                for _ in range(2):
+                    self.assertEqual(
+                            cache.convert(self._ir, OutputType.Text,
+                                    _flaky_processor, 1),
+                            "Recognised text",
+                            "failed conversion was cached")
+            self.assertEqual(
+                    make_stream.call_count,
+                    0,
+                    "content was read through a stream as well as a path")
+
+    def test_conversion_cache_directories(self):
+        calls = []
+
+        def _producer(outputdir):
+            calls.append(outputdir)
+            for name in ("page.txt", "image-000.png",):
+                with open(os.path.join(outputdir, name), "wt") as fp:
+                    fp.write(name)
+
+        def _failing_producer(outputdir):
+            raise RuntimeError("the external tool crashed")
+
+        with TemporaryDirectory() as d:
+            cache = ConversionCache(d, 1024 * 1024)
+            for _ in range(2):
+                with TemporaryDirectory() as outputdir:
+                    cache.extract("digest", "pages", 1, _producer, outputdir)
+                    self.assertEqual(
+                            sorted(os.listdir(outputdir)),
+                            ["image-000.png", "page.txt"],
+                            "directory was not restored from the cache")
+            self.assertEqual(
+                    len(calls),
+                    1,
+                    "cached extraction was performed again")
+
+            with TemporaryDirectory() as outputdir:
+                with self.assertRaises(RuntimeError):
+                    cache.extract("digest", "pages", 2,
+                            _failing_producer, outputdir)
+                cache.extract("digest", "pages", 2, _producer, outputdir)
+            self.assertEqual(
+                    len(calls),
+                    2,
+                    "failed extraction was cached")
+
+    def test_conversion_cache_shared_size(self):
+        with TemporaryDirectory() as d, patch(
+                "os2datascanner.engine2.conversions.utilities.cache"
+                ".monotonic", return_value=0) as monotonic:
+            # Two processes share a cache directory. Neither of them writes
+            # enough by itself to go over the limit...
+            caches = [ConversionCache(d, 2000), ConversionCache(d, 2000)]
+            for k in range(9):
+                caches[k % 2]._store("{0:02x}".format(k) * 32,
+                        {"value": "x" * 387})
+
+            def _size():
+                return sum(os.path.getsize(os.path.join(root, f))
+                        for root, _, files in os.walk(d) for f in files)
+            self.assertGreater(_size(), 2000)
+
+            # ... but they notice the other one's entries eventually
+            monotonic.return_value = ConversionCache.RECOUNT_INTERVAL + 1
+            caches[0]._store("ff" * 32, {"value": "x" * 387})
+            self.assertLessEqual(
+                    _size(),
+                    2000,
+                    "shared cache directory was not evicted")
+
+    def test_text_stream(self):
+        content = "".join(
+                "Række {0}: 1111111118 og 2205995008, ææææ{1}\n".format(
+                        i, "ø" * (i % 7))
+                for i in range(500))
+        with NamedTemporaryFile("wb", suffix=".txt") as fp:
+            fp.write(content.encode())
+            fp.flush()
+            resource = FilesystemHandle.make_handle(fp.name).follow(self._sm)
+
+            for window, overlap in ((300, 140), (1000, 400), (4096, 200)):
+                stream = TextStream(resource, window=window, overlap=overlap)
+                self.assertEqual(
+                        "".join(text[(overlap if i else 0):]
+                                for i, (_, text)
+                                in enumerate(stream.chunks())),
+                        content,
+                        "chunks did not reassemble into the original text")
+                for rule in (CPRRule(), RegexRule("æ+"), RegexRule("ø*")):
+                    with self.subTest(window=window, rule=rule):
+                        self.assertEqual(
+                                list(rule.match(stream)),
+                                list(rule.match(content)),
+                                "streamed matches differ from whole-text"
+                                " matches")
+
+    def test_text_stream_single_pass(self):
+        content = "".join(
+                "Række {0}: 1111111118 og 2205995008, ææææ\n".format(i)
+                for i in range(500))
+        rule = OrRule(
+                AndRule(RegexRule("Række 9999"), CPRRule()),
+                RegexRule("æ+"),
+                RegexRule("ø+"))
+        with NamedTemporaryFile("wb", suffix=".txt") as fp:
+            fp.write(content.encode())
+            fp.flush()
+            resource = FilesystemHandle.make_handle(fp.name).follow(self._sm)
+            stream = TextStream(resource, window=1000, overlap=400)
+            with patch.object(type(resource), "make_stream",
+                    wraps=resource.make_stream) as make_stream:
+                self.assertEqual(
+                        execute_rule(rule, {"text": stream}),
+                        execute_rule(rule, {"text": content}),
+                        "streamed evaluation differs from whole-text"
+                        " evaluation")
+            self.assertEqual(
+                    make_stream.call_count,
+                    1,
+                    "stream was read once for each rule")
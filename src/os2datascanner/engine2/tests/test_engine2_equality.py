@@ -1,6 +1,7 @@
 import unittest
 
-from os2datascanner.engine2.utilities.equality import TypePropertyEquality
+from os2datascanner.engine2.utilities.equality import (
+        TypePropertyEquality, ImmutableTypePropertyEquality)
 
 
 class Plain:
@@ -36,6 +37,19 @@ class Equal3(TypePropertyEquality):
         return {"_prop": self._prop}
 
 
+class Equal4(ImmutableTypePropertyEquality):
+    __slots__ = ("_prop",)
+
+    def __init__(self, prop):
+        self._prop = prop
+
+
+class Equal4a(Equal4):
+    def __init__(self, prop, other):
+        super().__init__(prop)
+        self._other = other
+
+
 class Engine2EqualityTest(unittest.TestCase):
     def test(self):
         self.assertNotEqual(
@@ -58,3 +72,28 @@ class Engine2EqualityTest(unittest.TestCase):
                 Equal3(4),
                 Equal3(5),
                 "TypePropertyEquality(__getstate__) is broken")
+
+    def test_slots(self):
+        self.assertEqual(
+                Equal4(5),
+                Equal4(5),
+                "TypePropertyEquality(__slots__) is broken")
+        self.assertNotEqual(
+                Equal4(5),
+                Equal4(6),
+                "TypePropertyEquality(__slots__) claims that 5 == 6")
+        self.assertNotEqual(
+                Equal4a(5, 6),
+                Equal4a(5, 7),
+                "TypePropertyEquality(__slots__, __dict__) claims that 6 == 7")
+
+    def test_cached_hash(self):
+        a, b = Equal4(5), Equal4(5)
+        self.assertEqual(
+                hash(a),
+                hash(b),
+                "equal objects have different hash values")
+        self.assertEqual(
+                a,
+                b,
+                "computing the hash value changed the properties")
@@ -0,0 +1,73 @@
+import unittest
+from exchangelib import Message
+from exchangelib.errors import ErrorItemNotFound
+
+from os2datascanner.engine2.model.ews import EWSAccountSource, EWSMailHandle
+
+
+class FakeAccount:
+    """A stand-in for an exchangelib Account that can only retrieve messages
+    in bulk."""
+
+    def __init__(self, messages):
+        self._messages = messages
+        self.requests = []
+
+    def fetch(self, ids, only_fields=None, chunk_size=None):
+        self.requests.append([mail_id for mail_id, _ in ids])
+        for mail_id, _ in ids:
+            yield self._messages.get(
+                    mail_id, ErrorItemNotFound("not found"))
+
+    @property
+    def root(self):
+        raise AssertionError("message was retrieved individually")
+
+
+class FakeSourceManager:
+    def __init__(self, state):
+        self._state = state
+
+    def open(self, source):
+        return self._state
+
+
+source = EWSAccountSource(
+        "example.invalid", None, "admin", "password", "user")
+
+
+def _make_handle(mail_id):
+    return EWSMailHandle(source, "folder.{0}".format(mail_id),
+            "Subject", "Inbox", None)
+
+
+class Engine2EWSTest(unittest.TestCase):
+    def test_prefetch(self):
+        account = FakeAccount({
+            "mail{0}".format(k): Message(
+                    mime_content="Message {0}".format(k).encode(), size=9)
+            for k in range(5)
+        })
+        sm = FakeSourceManager((account, {}))
+        handles = [_make_handle("mail{0}".format(k)) for k in range(6)]
+
+        source.prefetch(sm, handles)
+        self.assertEqual(
+                account.requests,
+                [["mail{0}".format(k) for k in range(6)]],
+                "messages were not requested in bulk")
+
+        for k, handle in enumerate(handles[:5]):
+            resource = handle.follow(sm)
+            self.assertTrue(
+                    resource.check(),
+                    "prefetched message was not found")
+            with resource.make_stream() as fp:
+                self.assertEqual(
+                        fp.read(),
+                        "Message {0}".format(k).encode(),
+                        "prefetched message had the wrong content")
+
+        # Messages that couldn't be prefetched must be retrieved again
+        with self.assertRaises(AssertionError):
+            handles[5].follow(sm).get_message_object()
@@ -0,0 +1,118 @@
+import os
+import os.path
+import unittest
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.file import FilesystemSource
+from os2datascanner.engine2.model.utilities.index import (
+        ExplorationIndex, explore_listings)
+from os2datascanner.engine2.model.utilities.walk import walk_directories
+
+
+# Stands in for a directory that can't be read in the trees given to
+# explore_listings
+_UNREADABLE = object()
+
+
+def _touch(path, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wt") as fp:
+        fp.write("Test file")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class Engine2ExplorationIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = TemporaryDirectory()
+        self.root = os.path.join(self._directory.name, "root")
+        self.index = ExplorationIndex(
+                os.path.join(self._directory.name, "index.sqlite"))
+        for path in ("a.txt", "dir/b.txt", "dir/sub/c.txt", "other/d.txt"):
+            _touch(os.path.join(self.root, path), 1000000000)
+
+    def tearDown(self):
+        self.index.close()
+        self._directory.cleanup()
+
+    def explore(self):
+        with SourceManager() as sm:
+            return {h.relative_path: deleted
+                    for h, deleted in FilesystemSource(self.root)
+                            .changed_handles(sm, self.index)}
+
+    def test_incremental_exploration(self):
+        self.assertEqual(
+                self.explore(),
+                {"a.txt": False, "dir/b.txt": False, "dir/sub/c.txt": False,
+                        "other/d.txt": False},
+                "first exploration didn't find everything")
+        self.assertEqual(
+                self.explore(),
+                {},
+                "unchanged files were found again")
+
+        # Change a file in place (which doesn't change its directory's
+        # timestamp), add a file, and delete a file and a directory
+        _touch(os.path.join(self.root, "dir/sub/c.txt"), 1500000000)
+        _touch(os.path.join(self.root, "dir/e.txt"))
+        os.unlink(os.path.join(self.root, "a.txt"))
+        os.unlink(os.path.join(self.root, "other/d.txt"))
+        os.rmdir(os.path.join(self.root, "other"))
+        self.assertEqual(
+                self.explore(),
+                {"dir/sub/c.txt": False, "dir/e.txt": False,
+                        "a.txt": True, "other/d.txt": True},
+                "incremental exploration didn't find the changes")
+        self.assertEqual(
+                self.explore(),
+                {},
+                "incremental exploration didn't update the index")
+
+    def explore_listings(self, tree):
+        def list_directory(path):
+            directory = tree
+            for name in path.split("/") if path else []:
+                directory = directory[name]
+            if directory is _UNREADABLE:
+                return None
+            return [(name, value is _UNREADABLE or isinstance(value, dict),
+                            value if isinstance(value, int) else None)
+                    for name, value in directory.items()]
+        return dict(explore_listings(self.index,
+                walk_directories(list_directory, workers=4)))
+
+    def test_listing_exploration(self):
+        tree = {
+            "a.txt": 1,
+            "dir": {"b.txt": 1, "sub": {"c.txt": 1}},
+            "other": {"d.txt": 1},
+        }
+        self.assertEqual(
+                self.explore_listings(tree),
+                {"a.txt": False, "dir/b.txt": False, "dir/sub/c.txt": False,
+                        "other/d.txt": False},
+                "first exploration didn't find everything")
+        self.assertEqual(
+                self.explore_listings(tree),
+                {},
+                "unchanged files were found again")
+
+        tree["dir"]["sub"]["c.txt"] = 2
+        tree["dir"]["e.txt"] = 1
+        del tree["a.txt"]
+        del tree["other"]
+        self.assertEqual(
+                self.explore_listings(tree),
+                {"dir/sub/c.txt": False, "dir/e.txt": False,
+                        "a.txt": True, "other/d.txt": True},
+                "listing exploration didn't find the changes")
+
+        # Nothing below a directory that can't be read should be reported as
+        # deleted
+        tree["dir"] = _UNREADABLE
+        self.assertEqual(
+                self.explore_listings(tree),
+                {},
+                "unreadable directory was treated as empty")
@@ -0,0 +1,150 @@
+import json
+import unittest
+from googleapiclient.errors import HttpError
+
+from os2datascanner.engine2.model.gmail import GmailSource, _is_rate_limited
+
+
+def _error_body(status, reason, message="Error"):
+    return json.dumps({
+        "error": {
+            "code": status,
+            "message": message,
+            "errors": [{
+                "domain": "usageLimits" if "imit" in reason else "global",
+                "reason": reason,
+                "message": message
+            }]
+        }
+    }).encode()
+
+
+class FakeResponse(dict):
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "Error"
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, num_retries=0):
+        return self.result
+
+
+class FakeMessages:
+    """A stand-in for the messages collection of the Gmail API, listing
+    @count messages in pages of ten. Metadata requests for every seventh
+    message fail with a 404 error, and the first metadata request for every
+    third message is refused because of a rate limit."""
+
+    def __init__(self, count):
+        self.count = count
+        self.limited = set()
+        self.batches = []
+
+    def list(self, userId, labelIds, maxResults, pageToken=0):
+        ids = list(range(pageToken, min(pageToken + 10, self.count)))
+        result = {"messages": [{"id": str(k)} for k in ids]}
+        if ids[-1] + 1 < self.count:
+            result["nextPageToken"] = ids[-1] + 1
+        return FakeRequest(result)
+
+    def list_next(self, request, results):
+        if "nextPageToken" not in results:
+            return None
+        return self.list(None, None, None, results["nextPageToken"])
+
+    def get(self, userId, id, format, metadataHeaders):
+        return ("get", id, format)
+
+    def execute_batch(self, callback, requests):
+        self.batches.append([request_id for _, request_id in requests])
+        for (_, msg_id, fmt), request_id in requests:
+            assert fmt == "metadata"
+            k = int(msg_id)
+            if k % 7 == 6:
+                callback(request_id, None, HttpError(
+                        FakeResponse(404), b"Not Found"))
+            elif k % 3 == 0 and k not in self.limited:
+                self.limited.add(k)
+                callback(request_id, None, HttpError(
+                        FakeResponse(403),
+                        _error_body(403, "userRateLimitExceeded")))
+            else:
+                callback(request_id, {"payload": {"headers": [
+                    {"name": "Subject", "value": "Message " + msg_id}
+                ]}}, None)
+
+
+class FakeBatch:
+    def __init__(self, messages, callback):
+        self._messages = messages
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id):
+        self._requests.append((request, request_id))
+
+    def execute(self):
+        self._messages.execute_batch(self._callback, self._requests)
+
+
+class FakeService:
+    def __init__(self, messages):
+        self._messages = messages
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self._messages
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self._messages, callback)
+
+
+class FakeSourceManager:
+    def __init__(self, service):
+        self._service = service
+
+    def open(self, source):
+        return self._service
+
+
+class Engine2GmailTest(unittest.TestCase):
+    def test_batched_exploration(self):
+        messages = FakeMessages(25)
+        source = GmailSource(None, "user@example.invalid")
+        handles = list(source.handles(FakeSourceManager(
+                FakeService(messages))))
+
+        expected = [k for k in range(25) if k % 7 != 6]
+        self.assertEqual(
+                [h.relative_path for h in handles],
+                [str(k) for k in expected],
+                "messages were missing or out of order")
+        self.assertEqual(
+                [h._mail_subject for h in handles],
+                [["Message {0}".format(k)] for k in expected],
+                "subjects were incorrect")
+        self.assertTrue(
+                all(len(batch) <= 10 for batch in messages.batches),
+                "batches spanned more than one page")
+
+    def test_rate_limit_detection(self):
+        for status, body, expected in (
+                (429, b"", True),
+                (403, _error_body(403, "rateLimitExceeded"), True),
+                (403, _error_body(403, "userRateLimitExceeded"), True),
+                (403, _error_body(403, "forbidden",
+                        "Not rateLimitExceeded, just forbidden"), False),
+                (403, b"rateLimitExceeded", False),
+                (404, _error_body(404, "notFound"), False),):
+            with self.subTest(status=status, body=body):
+                self.assertEqual(
+                        _is_rate_limited(
+                                HttpError(FakeResponse(status), body)),
+                        expected)
@@ -4,13 +4,14 @@ import http.server
 from datetime import datetime
 import unittest
 import contextlib
-from multiprocessing import Manager, Process
+from multiprocessing import Event, Process
 
 from os2datascanner.engine2.model.core import (Handle,
         Source, SourceManager, UnknownSchemeError)
 from os2datascanner.engine2.model.http import (
         WebSource, WebHandle, make_outlinks)
 from os2datascanner.engine2.model.utilities.datetime import parse_datetime
+from os2datascanner.engine2.model.utilities.index import ExplorationIndex
 from os2datascanner.engine2.conversions.types import OutputType
 from os2datascanner.engine2.conversions.utilities.results import SingleResult
 
@@ -28,11 +29,7 @@ def run_web_server(started):
                 http.server.SimpleHTTPRequestHandler)
 
         # The web server is started and listening; let the test runner know
-        started.acquire()
-        try:
-            started.notify()
-        finally:
-            started.release()
+        started.set()
 
         while True:
             server.handle_request()
@@ -54,18 +51,13 @@ embedded_mapped_site = WebSource("http://localhost:64346/",
 class Engine2HTTPTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        with Manager() as manager:
-            started = manager.Condition()
-            started.acquire()
-            try:
-                cls._ws = Process(target=run_web_server, args=(started,))
-                cls._ws.start()
-
-                # Wait for the web server to check in and notify us that it's
-                # ready to be used
-                started.wait()
-            finally:
-                started.release()
+        started = Event()
+        cls._ws = Process(target=run_web_server, args=(started,))
+        cls._ws.start()
+
+        # Wait for the web server to check in and notify us that it's ready to
+        # be used
+        started.wait()
 
     @classmethod
     def tearDownClass(cls):
@@ -83,6 +75,21 @@ class Engine2HTTPTest(unittest.TestCase):
                 3,
                 "embedded site should have 3 handles")
 
+    def test_incremental_exploration(self):
+        with SourceManager() as sm, ExplorationIndex(":memory:") as index:
+            first = list(site.changed_handles(sm, index))
+            self.assertEqual(
+                    len(first),
+                    3,
+                    "first incremental crawl should see 3 handles")
+            self.assertFalse(
+                    any(deleted for _, deleted in first),
+                    "first incremental crawl reported deletions")
+            self.assertEqual(
+                    list(site.changed_handles(sm, index)),
+                    [],
+                    "unchanged site reported changes")
+
     def test_exploration_sitemap(self):
         count = 0
         with SourceManager() as sm:
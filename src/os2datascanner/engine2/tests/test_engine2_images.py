@@ -1,10 +1,17 @@
 import  os.path
 import  unittest
+from    time import sleep
+from    unittest import mock
+from    PIL import Image
 
+from    os2datascanner.engine2 import settings as engine2_settings
 from    os2datascanner.engine2.model.core import SourceManager
 from    os2datascanner.engine2.model.file import FilesystemSource
 from    os2datascanner.engine2.conversions import convert
 from    os2datascanner.engine2.conversions.types import OutputType
+from    os2datascanner.engine2.conversions.text import ocr
+from    os2datascanner.engine2.conversions.text.ocr import (
+        TesseractPool, _normalise)
 
 here_path = os.path.dirname(__file__)
 test_data_path = os.path.join(here_path, "data", "ocr")
@@ -12,6 +19,19 @@ expected_size = (896, 896)
 expected_result = "131016-9996"
 
 
+# Stand in for the Tesseract API in the engine processes of a TesseractPool:
+# each "recognised" text is the process ID of the engine, and the image
+# "hang" makes the engine stop responding
+def _start_stub_engine(language):
+    pass
+
+
+def _run_stub_engine(path):
+    if path == "hang":
+        sleep(60)
+    return str(os.getpid())
+
+
 class TestEngine2Images(unittest.TestCase):
     def test_ocr_conversions(self):
         fs = FilesystemSource(os.path.join(test_data_path, "good"))
@@ -33,6 +53,72 @@ class TestEngine2Images(unittest.TestCase):
                         None,
                         "{0}: error handling failed".format(h))
 
+    def test_ocr_normalisation(self):
+        self.assertIsNone(
+                _normalise(Image.new("RGB", (8, 400))),
+                "tiny image was not rejected")
+        self.assertEqual(
+                _normalise(Image.new("L", (10000, 5000))).size,
+                (4096, 2048),
+                "huge image was not scaled down")
+        with Image.open(os.path.join(test_data_path, "good", "cpr.gif")) as im:
+            self.assertEqual(
+                    _normalise(im).mode,
+                    "RGBA",
+                    "palette image was not converted")
+
+    def test_tesseract_pool(self):
+        pool = TesseractPool()
+        try:
+            with mock.patch.dict(engine2_settings.conversions["ocr"],
+                    processes=1, max_images=3), mock.patch.dict(
+                    engine2_settings.subprocess, timeout=2), mock.patch(
+                    "os2datascanner.engine2.conversions.text.ocr"
+                    "._start_engine", _start_stub_engine), mock.patch(
+                    "os2datascanner.engine2.conversions.text.ocr"
+                    "._run_engine", _run_stub_engine):
+                first = [pool.recognise(str(k)) for k in range(3)]
+                second = pool.recognise("3")
+                self.assertIsNone(
+                        pool.recognise("hang"),
+                        "stuck engine returned a result")
+                third = pool.recognise("4")
+        finally:
+            pool.close()
+
+        self.assertEqual(
+                len(set(first)),
+                1,
+                "Tesseract engine was not reused")
+        self.assertNotIn(
+                second,
+                first,
+                "Tesseract engine was not replaced after max_images")
+        self.assertNotIn(
+                third,
+                first + [second],
+                "Tesseract engine was not replaced after getting stuck")
+
+    def test_cache_version(self):
+        def _version(tesseract="4.1.1", **settings):
+            with mock.patch.dict(engine2_settings.conversions["ocr"],
+                    **settings), mock.patch.object(ocr._pool, "version",
+                    return_value=tesseract):
+                return ocr._cache_version()
+
+        versions = [
+            _version(),
+            _version(tesseract="5.3.0"),
+            _version(language="dan"),
+            _version(min_dimension=1),
+            _version(max_dimension=1000),
+        ]
+        self.assertEqual(
+                len(set(versions)),
+                len(versions),
+                "OCR cache version doesn't depend on everything that affects"
+                " the results")
+
     def test_size_computation(self):
         fs = FilesystemSource(test_data_path)
         with SourceManager() as sm:
@@ -0,0 +1,114 @@
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory, gettempdir
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.derived.libreoffice import (
+        LibreOfficeError, LibreOfficePool)
+
+
+# Stands in for libreoffice_helper.py, so that the pool can be tested without
+# LibreOffice: each "conversion" writes the process ID of the helper into the
+# output file. Documents called "crash" make the helper exit, documents
+# called "hang" make it stop responding, and documents called "broken" fail
+# to convert
+STUB_HELPER = """
+import os
+import sys
+import json
+import time
+
+print(json.dumps({"error": None}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    stem = os.path.splitext(os.path.basename(request["path"]))[0]
+    if stem == "crash":
+        sys.exit(1)
+    elif stem == "hang":
+        time.sleep(60)
+    elif stem == "broken":
+        print(json.dumps({"error": "broken"}), flush=True)
+        continue
+    extension = request["convert_to"].split(":")[0]
+    with open(os.path.join(request["outdir"],
+            "{0}.{1}".format(stem, extension)), "w") as fp:
+        fp.write(str(os.getpid()))
+    print(json.dumps({"error": None}), flush=True)
+"""
+
+
+class Engine2LibreOfficePoolTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = TemporaryDirectory()
+        self._helper = os.path.join(self._directory.name, "helper.py")
+        with open(self._helper, "w") as fp:
+            fp.write(STUB_HELPER)
+        self._pool = LibreOfficePool(
+                [sys.executable, self._helper], max_conversions=3)
+
+    def tearDown(self):
+        self._pool.close()
+        self._directory.cleanup()
+
+    def _convert(self, name):
+        """Converts the (non-existent) document @name with the pool, and
+        returns the process ID of the helper that did it."""
+        with TemporaryDirectory() as outdir:
+            self._pool.convert(
+                    os.path.join(self._directory.name, name + ".odt"),
+                    "writer8", "html", outdir)
+            with open(os.path.join(outdir, name + ".html")) as fp:
+                return int(fp.read())
+
+    def test_reuse(self):
+        first = [self._convert("document") for _ in range(3)]
+        second = self._convert("document")
+
+        self.assertEqual(
+                len(set(first)),
+                1,
+                "instance was not reused")
+        self.assertNotEqual(
+                first[0],
+                second,
+                "instance was not replaced after max_conversions")
+
+    def test_crash(self):
+        first = self._convert("document")
+        with self.assertRaises(LibreOfficeError):
+            self._convert("crash")
+        self.assertNotEqual(
+                first,
+                self._convert("document"),
+                "instance was not replaced after crashing")
+
+    def test_failure(self):
+        first = self._convert("document")
+        with self.assertRaises(LibreOfficeError):
+            self._convert("broken")
+        self.assertNotEqual(
+                first,
+                self._convert("document"),
+                "instance was not replaced after a failed conversion")
+
+    def test_timeout(self):
+        config = engine2_settings.subprocess
+        original_timeout = config["timeout"]
+        try:
+            config["timeout"] = 1
+            with self.assertRaises(LibreOfficeError):
+                self._convert("hang")
+        finally:
+            config["timeout"] = original_timeout
+        self._convert("document")
+
+    def test_profiles_removed(self):
+        self._convert("document")
+        self._pool.close()
+        prefix = "{0}{1}-".format(LibreOfficePool.PREFIX, os.getpid())
+        self.assertEqual(
+                [name for name in os.listdir(gettempdir())
+                        if name.startswith(prefix)],
+                [],
+                "settings directory was not removed")
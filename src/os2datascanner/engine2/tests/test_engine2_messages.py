@@ -1,7 +1,11 @@
 from typing import NamedTuple
 import unittest
 
+from os2datascanner.engine2.model.core import Source
+from os2datascanner.engine2.rules.regex import RegexRule
 from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.utilities.registry import (
+        ScanSpecRegistry)
 
 
 class SampleTuple(NamedTuple):
@@ -61,3 +65,29 @@ class MessageTest(unittest.TestCase):
                                 field1="Farvel",
                                 field2=117,
                                 field3="Falsk")))
+
+    def test_interned_scan_spec(self):
+        scan_spec = messages.ScanSpecMessage(
+                scan_tag="interning_test",
+                source=Source.from_url("data:text/plain,Hello"),
+                rule=RegexRule("Hello"),
+                configuration={},
+                progress=None)
+
+        scan_tag = {"time": "2020-01-01T00:00:00", "scanner": {"pk": 1}}
+        self.assertEqual(
+                ScanSpecRegistry.make_key(scan_tag),
+                ScanSpecRegistry.make_key(
+                        dict(reversed(list(scan_tag.items())))),
+                "scan key depends on property order")
+        self.assertNotEqual(
+                ScanSpecRegistry.make_key(scan_tag),
+                ScanSpecRegistry.make_key(dict(scan_tag, scanner={"pk": 2})),
+                "scan key does not depend on scan tag")
+
+        # ScanSpecRegistry.resolve_message puts already-deserialised scan
+        # specs into message bodies
+        self.assertIs(
+                messages.ScanSpecMessage.from_json_object(scan_spec),
+                scan_spec,
+                "deserialised scan spec was deserialised again")
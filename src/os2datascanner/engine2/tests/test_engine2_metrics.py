@@ -0,0 +1,42 @@
+import unittest
+from time import sleep
+
+from prometheus_client import REGISTRY
+
+from os2datascanner.engine2.utilities.tools import run_tool
+from os2datascanner.engine2.pipeline.utilities.prometheus import (
+        prometheus_summary)
+
+
+@prometheus_summary(
+        "os2datascanner_test_generator_seconds", "Test generator timing")
+def _slow_generator():
+    for k in range(3):
+        sleep(0.05)
+        yield k
+
+
+class Engine2MetricsTest(unittest.TestCase):
+    def test_generator_summary(self):
+        before = REGISTRY.get_sample_value(
+                "os2datascanner_test_generator_seconds_sum")
+        self.assertEqual(
+                list(_slow_generator()),
+                [0, 1, 2])
+        after = REGISTRY.get_sample_value(
+                "os2datascanner_test_generator_seconds_sum")
+        self.assertGreaterEqual(
+                after - before,
+                0.15,
+                "summary did not cover the iteration of the generator")
+
+    def test_run_tool(self):
+        labels = {"tool": "python"}
+        before = REGISTRY.get_sample_value(
+                "os2datascanner_tool_seconds_count", labels) or 0
+        run_tool(["python", "-c", "pass"], check=True)
+        self.assertEqual(
+                REGISTRY.get_sample_value(
+                        "os2datascanner_tool_seconds_count", labels),
+                before + 1,
+                "external tool run was not recorded")
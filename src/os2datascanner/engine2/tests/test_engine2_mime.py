@@ -1,7 +1,10 @@
 import os.path
 import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
 
 from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.core.resource import type_cache
 from os2datascanner.engine2.model.file import FilesystemHandle
 
 
@@ -38,3 +41,52 @@ class Engine2MIMETests(unittest.TestCase):
                     "application/vnd.openxmlformats-officedocument"
                             ".wordprocessingml.document",
                     ".docx MIME computation is incorrect")
+
+    def test_type_cache(self):
+        with TemporaryDirectory() as d, SourceManager() as sm:
+            path = os.path.join(d, "example.txt")
+            with open(path, "wt") as fp:
+                fp.write("This is a plain text file.\n")
+            handle = FilesystemHandle.make_handle(path)
+            first = handle.follow(sm)
+            with patch.object(type_cache, "size", 16), patch.object(
+                    type(first), "make_stream",
+                    wraps=first.make_stream) as make_stream:
+                self.assertEqual(
+                        first.compute_type(),
+                        "text/plain")
+                self.assertEqual(
+                        first.compute_type(),
+                        "text/plain")
+                self.assertEqual(
+                        handle.follow(sm).compute_type(),
+                        "text/plain",
+                        "cached type was wrong")
+            self.assertEqual(
+                    make_stream.call_count,
+                    1,
+                    "type was computed more than once")
+
+    def test_type_cache_disabled(self):
+        with TemporaryDirectory() as d, SourceManager() as sm:
+            path = os.path.join(d, "example.txt")
+            with open(path, "wt") as fp:
+                fp.write("This is a plain text file.\n")
+            handle = FilesystemHandle.make_handle(path)
+            with patch.object(type_cache, "size", 0):
+                handle.follow(sm).compute_type()
+                with open(path, "wt") as fp:
+                    fp.write("%PDF-1.4\n")
+                self.assertEqual(
+                        handle.follow(sm).compute_type(),
+                        "application/pdf",
+                        "disabled type cache returned an old type")
+
+    def test_type_hint(self):
+        with SourceManager() as sm:
+            resource = doc_handle.follow(sm)
+            resource.set_computed_type("application/x-example")
+            self.assertEqual(
+                    resource.compute_type(),
+                    "application/x-example",
+                    "type hint was ignored")
@@ -0,0 +1,253 @@
+import json
+import unittest
+from unittest import mock
+import requests
+from threading import Thread
+from urllib.parse import urlsplit, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from os2datascanner.engine2.model.msgraph.mail import MSGraphMailSource
+from os2datascanner.engine2.model.msgraph.files import (MSGraphFilesSource,
+        MSGraphDriveHandle, MSGraphDriveSource, MSGraphFileHandle)
+from os2datascanner.engine2.model.msgraph.utilities import MSGraphSource
+
+
+USERS = ["user{0}@example.com".format(k) for k in range(25)]
+PAGE_SIZE = 10
+CONTENT = bytes(range(256)) * 4096
+
+
+def respond(path):
+    """Returns a (status, body) pair for a GET request to a tiny imitation of
+    Microsoft Graph with 25 users, each of which has a mailbox with a single
+    message and (except for every fifth user) a drive. (The content of the
+    one file in these drives is served directly by StubGraphHandler.)"""
+    url = urlsplit(path)
+    parts = url.path.strip("/").split("/")
+    if parts == ["users"]:
+        skip = int(parse_qs(url.query).get("$skip", ["0"])[0])
+        body = {"value": [{"userPrincipalName": pn}
+                for pn in USERS[skip:skip + PAGE_SIZE]]}
+        if skip + PAGE_SIZE < len(USERS):
+            body["@odata.nextLink"] = "{0}users?$skip={1}".format(
+                    StubGraphHandler.base_url, skip + PAGE_SIZE)
+        return 200, body
+    elif len(parts) == 3 and parts[0] == "users" and parts[1] in USERS:
+        index = USERS.index(parts[1])
+        if parts[2] == "drive" and index % 5:
+            return 200, {"id": "drive{0}".format(index), "name": "OneDrive",
+                    "owner": {"user": {"displayName": parts[1]}}}
+        elif parts[2] == "messages":
+            return 200, {"value": [{"id": "message{0}".format(index)}]}
+    elif url.path == "/drives/drive1/root:/big.bin":
+        return 200, {"id": "big", "name": "big.bin", "size": len(CONTENT)}
+    return 404, {"error": {"code": "itemNotFound"}}
+
+
+class StubGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    base_url = None
+    requests = []
+    ranges = []
+    clients = set()
+    # The number of batch requests in which the odd-numbered requests should
+    # be refused as if Graph were throttling us
+    throttle = 0
+
+    def _send(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path))
+        self.clients.add(self.client_address)
+        if self.path.endswith("/big.bin:/content"):
+            self._send_content(self.headers.get("Range"))
+        else:
+            self._send(*respond(self.path[len("/v1.0"):]))
+
+    def _send_content(self, byte_range):
+        if byte_range:
+            start, end = byte_range[len("bytes="):].split("-")
+            start, end = int(start), int(end)
+            self.ranges.append((start, end))
+            content = CONTENT[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(
+                    start, end, len(CONTENT)))
+        else:
+            content = CONTENT
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        self.requests.append(("POST", self.path))
+        self.clients.add(self.client_address)
+        batch = json.loads(self.rfile.read(
+                int(self.headers["Content-Length"])))
+        responses = []
+        throttle = self.throttle > 0
+        if throttle:
+            StubGraphHandler.throttle -= 1
+        for r in batch["requests"]:
+            if throttle and int(r["id"]) % 2:
+                responses.append({"id": r["id"], "status": 429,
+                        "headers": {"Retry-After": "3"},
+                        "body": {"error": {"code": "TooManyRequests"}}})
+                continue
+            status, body = respond(r["url"])
+            responses.append({"id": r["id"], "status": status, "body": body})
+        # Graph doesn't promise to return responses in order
+        self._send(200, {"responses": list(reversed(responses))})
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSourceManager:
+    def __init__(self, caller):
+        self._caller = caller
+
+    def open(self, source):
+        return self._caller
+
+
+class Engine2MSGraphCallerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = HTTPServer(("localhost", 0), StubGraphHandler)
+        StubGraphHandler.base_url = "http://localhost:{0}/v1.0/".format(
+                cls._server.server_port)
+        cls._thread = Thread(target=cls._server.serve_forever, daemon=True)
+        cls._thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.shutdown()
+        cls._server.server_close()
+
+    def setUp(self):
+        StubGraphHandler.requests.clear()
+        StubGraphHandler.ranges.clear()
+        StubGraphHandler.clients.clear()
+        StubGraphHandler.throttle = 0
+        self.session = MSGraphSource.make_session()
+        self.caller = MSGraphSource.GraphCaller(
+                "token", self.session, base_url=StubGraphHandler.base_url)
+        self.sm = FakeSourceManager(self.caller)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_paging(self):
+        self.assertEqual(
+                [user["userPrincipalName"]
+                        for user in self.caller.paginate("users")],
+                USERS,
+                "paged collection was truncated")
+        self.assertEqual(
+                len(StubGraphHandler.requests),
+                3,
+                "wrong number of pages requested")
+        self.assertEqual(
+                len(StubGraphHandler.clients),
+                1,
+                "connection was not reused")
+
+    def test_batch(self):
+        tails = ["users/{0}/drive".format(pn) for pn in USERS]
+        results = list(self.caller.get_batch(tails, ignore=(404,)))
+        self.assertEqual(
+                [tail for tail, _ in results],
+                [t for idx, t in enumerate(tails) if idx % 5],
+                "batch results were missing or out of order")
+        self.assertEqual(
+                [method for method, _ in StubGraphHandler.requests],
+                ["POST", "POST"],
+                "requests were not grouped into batches")
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            list(self.caller.get_batch(tails))
+
+    def test_batch_throttling(self):
+        tails = ["users/{0}/messages".format(pn) for pn in USERS[:6]]
+        with mock.patch("os2datascanner.engine2.model.msgraph"
+                        ".utilities.sleep") as retry_sleep, \
+                mock.patch("os2datascanner.engine2.utilities"
+                        ".backoff.sleep") as backoff_sleep:
+            StubGraphHandler.throttle = 2
+            results = list(self.caller.get_batch(tails))
+            self.assertEqual(
+                    [tail for tail, _ in results],
+                    tails,
+                    "throttled requests were not retried")
+            self.assertEqual(
+                    [method for method, _ in StubGraphHandler.requests],
+                    ["POST", "POST", "POST"],
+                    "throttled requests were not retried in a batch")
+            self.assertEqual(
+                    [c.args[0] for c in retry_sleep.call_args_list],
+                    [3, 3],
+                    "Retry-After header was not honoured")
+            self.assertEqual(
+                    backoff_sleep.call_count,
+                    2,
+                    "throttled requests were not retried with backoff")
+
+            StubGraphHandler.throttle = 100
+            with self.assertRaises(requests.exceptions.HTTPError):
+                list(self.caller.get_batch(tails))
+
+    def test_files_source(self):
+        source = MSGraphFilesSource("id", "tenant", "secret",
+                site_drives=False, user_drives=True)
+        self.assertEqual(
+                [h.relative_path for h in source.handles(self.sm)],
+                ["drive{0}".format(idx)
+                        for idx in range(len(USERS)) if idx % 5],
+                "drives were not found")
+
+    def test_mail_source(self):
+        source = MSGraphMailSource("id", "tenant", "secret")
+        self.assertEqual(
+                [h.relative_path for h in source.handles(self.sm)],
+                USERS,
+                "mail accounts were not found")
+
+    def test_file_resource(self):
+        handle = MSGraphFileHandle(
+                MSGraphDriveSource(MSGraphDriveHandle(
+                        MSGraphFilesSource("id", "tenant", "secret"),
+                        "drive1", "OneDrive", None)),
+                "big.bin")
+        resource = handle.follow(self.sm)
+        self.assertEqual(
+                resource.get_size().value,
+                len(CONTENT),
+                "size was not taken from the metadata")
+
+        with resource.make_stream() as fp:
+            self.assertEqual(
+                    fp.read(512),
+                    CONTENT[:512])
+            fp.seek(-16, 2)
+            self.assertEqual(
+                    fp.read(),
+                    CONTENT[-16:])
+        self.assertTrue(
+                all(end - start < 65536
+                        for start, end in StubGraphHandler.ranges),
+                "small reads downloaded too much of the file")
+
+        with resource.make_path() as p:
+            with open(p, "rb") as fp:
+                self.assertEqual(
+                        fp.read(),
+                        CONTENT,
+                        "downloaded file was incorrect")
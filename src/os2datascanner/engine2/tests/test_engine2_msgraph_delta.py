@@ -0,0 +1,145 @@
+import unittest
+
+from os2datascanner.engine2.model.msgraph.mail import (MSGraphMailSource,
+        MSGraphMailAccountHandle, MSGraphMailAccountSource)
+from os2datascanner.engine2.model.msgraph.files import (MSGraphFilesSource,
+        MSGraphDriveHandle, MSGraphDriveSource)
+from os2datascanner.engine2.model.utilities.index import ExplorationIndex
+
+
+class FakeGraph:
+    """A stand-in for a Microsoft Graph session that returns canned pages of
+    delta results. Each starting URL maps to a list of pages, each of which
+    is a list of items; the last page of a query links to a delta URL whose
+    results can be set later with the respond method."""
+
+    def __init__(self):
+        self._pages = {}
+
+    def respond(self, link, *pages):
+        self._pages[link] = list(pages)
+
+    def delta_link(self, link):
+        return link + "#delta"
+
+    def get(self, link):
+        base, _, page = link.partition("@page=")
+        page = int(page or 0)
+        items = self._pages.get(base, [[]])
+        result = {"value": items[page] if items else []}
+        if page + 1 < len(items):
+            result["@odata.nextLink"] = "{0}@page={1}".format(base, page + 1)
+        else:
+            result["@odata.deltaLink"] = self.delta_link(base)
+        return result
+
+
+class FakeSourceManager:
+    def __init__(self, graph):
+        self._graph = graph
+
+    def open(self, source):
+        return self._graph
+
+
+def _file(item_id, name, parent, **kwargs):
+    return dict(id=item_id, name=name, file={},
+            parentReference={"id": parent}, **kwargs)
+
+
+def _folder(item_id, name, parent):
+    return dict(id=item_id, name=name, folder={},
+            parentReference={"id": parent})
+
+
+class Engine2MSGraphDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = FakeGraph()
+        self.sm = FakeSourceManager(self.graph)
+        self.index = ExplorationIndex(":memory:")
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_drive_delta(self):
+        source = MSGraphDriveSource(MSGraphDriveHandle(
+                MSGraphFilesSource("id", "tenant", "secret"),
+                "drive", "Drive", "Owner"))
+        start = "drives/drive/root/delta"
+
+        def explore():
+            return {h.relative_path: deleted for h, deleted
+                    in source.changed_handles(self.sm, self.index)}
+
+        self.graph.respond(start,
+                [{"id": "root", "root": {}, "folder": {}},
+                        _folder("f1", "Documents", "root")],
+                [_file("a", "a.txt", "root"),
+                        _file("b", "b.txt", "f1")])
+        self.assertEqual(
+                explore(),
+                {"a.txt": False, "Documents/b.txt": False},
+                "initial exploration was incorrect")
+
+        self.graph.respond(self.graph.delta_link(start),
+                [_folder("f1", "Papers", "root"),
+                        {"id": "a", "deleted": {}}])
+        self.assertEqual(
+                explore(),
+                {"a.txt": True,
+                        "Documents/b.txt": True, "Papers/b.txt": False},
+                "moves and deletions were not reported")
+
+        self.graph.respond(start,
+                [{"id": "root", "root": {}, "folder": {}},
+                        _folder("f1", "Papers", "root")])
+        # Starting again from scratch reports the objects that weren't seen
+        self.index.set_property("delta", None)
+        self.assertEqual(
+                explore(),
+                {"Papers/b.txt": True},
+                "new delta query did not detect missing objects")
+
+    def test_mail_delta(self):
+        source = MSGraphMailAccountSource(MSGraphMailAccountHandle(
+                MSGraphMailSource("id", "tenant", "secret"), "user"))
+        folders = "users/user/mailFolders/delta?$select=id"
+
+        def messages(folder):
+            return ("users/user/mailFolders/{0}/messages/delta"
+                    "?$select=id,subject,webLink".format(folder))
+
+        def message(item_id):
+            return {"id": item_id,
+                    "subject": "Message " + item_id,
+                    "webLink": "https://example.com/" + item_id}
+
+        def explore():
+            return {(h.relative_path, h.presentation_url): deleted
+                    for h, deleted
+                    in source.changed_handles(self.sm, self.index)}
+
+        self.graph.respond(folders, [{"id": "inbox"}, {"id": "sent"}])
+        self.graph.respond(messages("inbox"),
+                [message("m1")], [message("m2")])
+        self.graph.respond(messages("sent"), [message("m3")])
+        self.assertEqual(
+                explore(),
+                {("m1", "https://example.com/m1"): False,
+                        ("m2", "https://example.com/m2"): False,
+                        ("m3", "https://example.com/m3"): False},
+                "initial exploration was incorrect")
+
+        self.graph.respond(self.graph.delta_link(messages("inbox")),
+                [{"id": "m1", "@removed": {"reason": "deleted"}}])
+        self.graph.respond(self.graph.delta_link(folders),
+                [{"id": "sent", "@removed": {"reason": "deleted"}}])
+        self.assertEqual(
+                explore(),
+                {("m1", "https://example.com/m1"): True,
+                        ("m3", "https://example.com/m3"): True},
+                "deletions were not reported")
+        self.assertEqual(
+                explore(),
+                {},
+                "unchanged mailbox reported changes")
@@ -0,0 +1,192 @@
+from os import listdir
+from tempfile import TemporaryDirectory
+from subprocess import CalledProcessError
+import os.path
+import unittest
+from unittest.mock import patch
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.file import FilesystemHandle
+from os2datascanner.engine2.model.derived.pdf import (
+        PDFSource, PDFPageHandle, PDFPageSource, _PDFDocument,
+        _distribute_pages, _extract_pages)
+
+
+here_path = os.path.dirname(__file__)
+pdf_handle = FilesystemHandle.make_handle(
+        os.path.join(here_path, "data/pdf/embedded-cpr.pdf"))
+
+# The number of images that _FakeTools puts on each page
+IMAGES = {1: 2, 2: 0, 3: 3}
+
+
+class _FakeTools:
+    """Stands in for run_tool, producing the same kind of output that
+    pdftotext and pdfimages would for a document whose pages have the images
+    described by IMAGES. Runs over more than @max_pages pages fail."""
+
+    def __init__(self, max_pages=None):
+        self.max_pages = max_pages
+        self.calls = []
+
+    def __call__(self, args, **kwargs):
+        first = int(args[args.index("-f") + 1])
+        last = int(args[args.index("-l") + 1])
+        self.calls.append((args[0], first, last, kwargs["timeout"]))
+        if self.max_pages and last - first + 1 > self.max_pages:
+            raise CalledProcessError(1, args)
+
+        pages = range(first, min(last, max(IMAGES)) + 1)
+        if args[0] == "pdftotext":
+            with open(args[-1], "wt") as fp:
+                fp.write("".join("Page {0}\f".format(p) for p in pages))
+        elif args[0] == "pdfimages":
+            number = 0
+            for p in pages:
+                for _ in range(IMAGES[p]):
+                    with open("{0}-{1:03d}-{2:03d}.png".format(
+                            args[-1], p, number), "wt") as fp:
+                        fp.write("Image {0} of page {1}".format(number, p))
+                    number += 1
+
+
+def _read(path):
+    with open(path, "rt") as fp:
+        return fp.read()
+
+
+class Engine2PDFTest(unittest.TestCase):
+    def test_distribute_pages(self):
+        with TemporaryDirectory() as workdir, \
+                TemporaryDirectory() as outputdir:
+            with open(os.path.join(workdir, "text.txt"), "wt") as fp:
+                fp.write("First page\fSecond page\fThird page\f")
+            for page, number in ((4, 0), (4, 1), (6, 2), (6, 10), (6, 3),):
+                with open(os.path.join(workdir,
+                        "image-{0:03d}-{1:03d}.jpg".format(page, number)),
+                        "wt") as fp:
+                    fp.write(str(number))
+
+            _distribute_pages(workdir, 4, 6, outputdir)
+
+            self.assertEqual(
+                    sorted(listdir(outputdir)),
+                    ["4", "5", "6"])
+            self.assertEqual(
+                    _read(os.path.join(outputdir, "5", "page.txt")),
+                    "Second page")
+            self.assertEqual(
+                    sorted(listdir(os.path.join(outputdir, "5"))),
+                    ["page.txt"],
+                    "page without images was given images")
+            self.assertEqual(
+                    [_read(os.path.join(outputdir, "6", name))
+                            for name in sorted(listdir(
+                                    os.path.join(outputdir, "6")))
+                            if name != "page.txt"],
+                    ["2", "3", "10"],
+                    "images were not renumbered in order")
+            self.assertEqual(
+                    sorted(listdir(os.path.join(outputdir, "6"))),
+                    ["image-000.jpg", "image-001.jpg", "image-002.jpg",
+                            "page.txt"])
+
+    def test_distribute_paired_images(self):
+        with TemporaryDirectory() as workdir, \
+                TemporaryDirectory() as outputdir:
+            with open(os.path.join(workdir, "text.txt"), "wt") as fp:
+                fp.write("First page\fSecond page\f")
+            # pdfimages -all writes some images as pairs of files with the
+            # same number
+            for name in ("image-001-004.ccitt", "image-001-004.params",
+                    "image-001-005.png",
+                    "image-002-006.jb2e", "image-002-006.jb2g",
+                    "image-002-007.jpg"):
+                with open(os.path.join(workdir, name), "wt") as fp:
+                    fp.write(name)
+
+            _distribute_pages(workdir, 1, 2, outputdir)
+
+            self.assertEqual(
+                    sorted(listdir(os.path.join(outputdir, "1"))),
+                    ["image-000.ccitt", "image-000.params", "image-001.png",
+                            "page.txt"],
+                    "paired image files were numbered separately")
+            self.assertEqual(
+                    _read(os.path.join(outputdir, "1", "image-000.params")),
+                    "image-001-004.params")
+            self.assertEqual(
+                    sorted(listdir(os.path.join(outputdir, "2"))),
+                    ["image-000.jb2e", "image-000.jb2g", "image-001.jpg",
+                            "page.txt"],
+                    "paired image files were numbered separately")
+
+    def test_extract_pages(self):
+        tools = _FakeTools()
+        with TemporaryDirectory() as outputdir, \
+                patch("os2datascanner.engine2.model.derived.pdf.run_tool",
+                        tools):
+            _extract_pages("document.pdf", 1, 3, outputdir)
+
+            self.assertEqual(
+                    sorted(listdir(outputdir)),
+                    ["1", "2", "3"],
+                    "extraction left unexpected files behind")
+            for page, count in IMAGES.items():
+                self.assertEqual(
+                        sorted(listdir(os.path.join(outputdir, str(page)))),
+                        ["image-{0:03d}.png".format(k)
+                                for k in range(count)] + ["page.txt"])
+                self.assertEqual(
+                        _read(os.path.join(outputdir, str(page), "page.txt")),
+                        "Page {0}".format(page))
+        self.assertEqual(
+                [timeout for _, _, _, timeout in tools.calls],
+                [engine2_settings.subprocess["timeout"] * 3] * 2,
+                "timeout was not scaled by the number of pages")
+
+    def test_batch_fallback(self):
+        tools = _FakeTools(max_pages=1)
+        with TemporaryDirectory() as outputdir, \
+                patch("os2datascanner.engine2.model.derived.pdf.run_tool",
+                        tools):
+            document = _PDFDocument("document.pdf", outputdir, 50)
+            for page in IMAGES:
+                self.assertEqual(
+                        _read(os.path.join(
+                                document.extract(page), "page.txt")),
+                        "Page {0}".format(page))
+            self.assertEqual(
+                    sorted(listdir(os.path.join(outputdir, "3"))),
+                    ["image-000.png", "image-001.png", "image-002.png",
+                            "page.txt"])
+        self.assertEqual(
+                [(first, last) for tool, first, last, _ in tools.calls
+                        if tool == "pdftotext"],
+                [(1, 50), (1, 1), (2, 2), (3, 3)],
+                "failed batch was not extracted one page at a time")
+
+    def test_batched_pages_are_kept(self):
+        tools = _FakeTools()
+        source = PDFSource(pdf_handle)
+        handle = PDFPageHandle(source, "1")
+        with patch.dict(engine2_settings.model["pdf"], batch_size=50), \
+                patch("os2datascanner.engine2.model.derived.pdf.run_tool",
+                        tools):
+            with SourceManager() as sm:
+                for _ in range(2):
+                    path = sm.open(PDFPageSource(handle))
+                    self.assertIn("page.txt", listdir(path))
+                    sm.close(PDFPageSource(handle))
+                    self.assertTrue(
+                            os.path.isdir(path),
+                            "extracted page was removed before the document"
+                            " was closed")
+            self.assertFalse(
+                    os.path.isdir(path),
+                    "extracted page outlived the document")
+        self.assertEqual(
+                len(tools.calls),
+                2,
+                "page was extracted again")
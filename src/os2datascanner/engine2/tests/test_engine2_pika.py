@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineRunner
+
+from .test_engine2_registry import _FakeBroker, _FakeConnection
+
+
+class _FailingRunner(PikaPipelineRunner):
+    """A PikaPipelineRunner, connected to a _FakeBroker, that sends the
+    "value" of every message it handles to the "output" queue, but fails to
+    handle messages whose value is "bad" (after producing a result)."""
+
+    def __init__(self, broker, deliveries, *, fail_prepare=False, **kwargs):
+        super().__init__(read=["input"], write=["output"], **kwargs)
+        self._broker = broker
+        self._deliveries = deliveries
+        self._fail_prepare = fail_prepare
+
+    def make_connection(self):
+        return _FakeConnection(self._broker)
+
+    def make_channel(self):
+        channel = super().make_channel()
+        channel.deliveries = self._deliveries
+        channel.on_idle = self.request_stop
+        return channel
+
+    def prepare_batch(self, message_bodies):
+        if self._fail_prepare:
+            raise ValueError("prepare_batch failed")
+
+    def handle_message(self, message_body, *, channel=None):
+        yield ("output", message_body)
+        if message_body["value"] == "bad":
+            raise ValueError("bad message")
+
+
+def _make_body(value):
+    return json.dumps({"value": value}).encode()
+
+
+class Engine2PikaTest(unittest.TestCase):
+    def test_batch_failure(self):
+        for fail_prepare in (False, True,):
+            with self.subTest(fail_prepare=fail_prepare):
+                broker = _FakeBroker()
+                runner = _FailingRunner(broker,
+                        [("input", _make_body(value), False)
+                                for value in ("one", "bad", "two", "three")],
+                        batch_size=4, fail_prepare=fail_prepare)
+                runner.run_consumer()
+
+                self.assertEqual(
+                        [json.loads(body)["value"]
+                                for body in broker.queues["output"]],
+                        ["one", "two", "three"],
+                        "results of the bad message were sent, or results"
+                        " of the good messages were not")
+                self.assertEqual(
+                        runner.channel.nacked,
+                        [(2, False)],
+                        "bad message was not rejected")
+                self.assertEqual(
+                        runner.channel.acked,
+                        [1, 3, 4],
+                        "good messages were not acknowledged")
+                self.assertEqual(
+                        runner.channel.commits,
+                        1,
+                        "batch was not committed")
@@ -0,0 +1,56 @@
+from os import getpid, kill
+from time import sleep
+import signal
+import threading
+import unittest
+
+from os2datascanner.engine2.pipeline.utilities.prefork import (
+        PreforkSupervisor)
+
+
+def wait_for_sigterm(slot):
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    while not stopping.is_set():
+        sleep(0.05)
+
+
+def crash_immediately(slot):
+    raise RuntimeError("deliberate failure in slot {0}".format(slot))
+
+
+class TestPrefork(unittest.TestCase):
+    def run_supervisor(self, target, processes, duration):
+        supervisor = PreforkSupervisor(
+                target, processes, poll_interval=0.05, shutdown_timeout=2)
+        timer = threading.Timer(duration,
+                lambda: kill(getpid(), signal.SIGTERM))
+        timer.start()
+        try:
+            supervisor.run()
+        finally:
+            timer.cancel()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+        return supervisor
+
+    def test_graceful_shutdown(self):
+        supervisor = self.run_supervisor(wait_for_sigterm, 3, 0.5)
+        self.assertEqual(
+                supervisor._restarts,
+                0,
+                "well-behaved children were restarted")
+        self.assertFalse(
+                any(c.pid for c in supervisor._children),
+                "children survived supervisor shutdown")
+
+    def test_crash_restart(self):
+        supervisor = self.run_supervisor(crash_immediately, 1, 1.5)
+        self.assertGreater(
+                supervisor._restarts,
+                0,
+                "crashed child was not restarted")
+        self.assertLess(
+                supervisor._restarts,
+                3,
+                "crashing child was restarted without backing off")
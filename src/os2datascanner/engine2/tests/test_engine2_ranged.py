@@ -0,0 +1,193 @@
+import os
+import unittest
+from io import BytesIO
+from zipfile import ZipFile, ZIP_STORED
+from threading import Thread
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.http import WebSource, WebHandle
+from os2datascanner.engine2.model.derived.zip import ZipSource
+from os2datascanner.engine2.model.utilities.ranged import (
+        RangedFile, is_ranged)
+
+
+def _make_archive():
+    with BytesIO() as fp:
+        with ZipFile(fp, "w", ZIP_STORED) as zp:
+            for k in range(8):
+                zp.writestr("member{0}.bin".format(k), os.urandom(128 * 1024))
+            zp.writestr("hello.txt", b"Hello, world!")
+        return fp.getvalue()
+
+
+ARCHIVE = _make_archive()
+
+
+class StubRangeHandler(BaseHTTPRequestHandler):
+    """Serves the same zip archive at two paths: "/ranged/archive.zip"
+    supports range requests, while "/plain/archive.zip" doesn't. The number
+    of GET requests and of bytes of content sent are recorded in requests and
+    bytes_sent."""
+
+    protocol_version = "HTTP/1.1"
+    requests = 0
+    bytes_sent = 0
+
+    def _send_headers(self, status, length):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(length))
+        if self.path.startswith("/ranged/"):
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send_headers(200, len(ARCHIVE))
+
+    def do_GET(self):
+        byte_range = self.headers.get("Range")
+        if byte_range and self.path.startswith("/ranged/"):
+            start, end = byte_range[len("bytes="):].split("-")
+            content = ARCHIVE[int(start):int(end) + 1]
+            self._send_headers(206, len(content))
+        else:
+            content = ARCHIVE
+            self._send_headers(200, len(content))
+        type(self).requests += 1
+        type(self).bytes_sent += len(content)
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    # (http.server.ThreadingHTTPServer is only available in Python 3.7)
+    daemon_threads = True
+
+
+class Engine2RangedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = _Server(("localhost", 0), StubRangeHandler)
+        cls._source = WebSource(
+                "http://localhost:{0}/".format(cls._server.server_port))
+        cls._thread = Thread(target=cls._server.serve_forever, daemon=True)
+        cls._thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.shutdown()
+        cls._server.server_close()
+
+    def setUp(self):
+        StubRangeHandler.requests = 0
+        StubRangeHandler.bytes_sent = 0
+
+    def test_ranged_file(self):
+        requests = []
+
+        def _get_range(start, end):
+            requests.append((start, end))
+            return ARCHIVE[start:end + 1]
+
+        with RangedFile(_get_range, len(ARCHIVE)) as fp:
+            fp.seek(-22, 2)
+            self.assertEqual(
+                    fp.read(22),
+                    ARCHIVE[-22:])
+            fp.seek(0)
+            self.assertEqual(
+                    fp.read(4),
+                    b"PK\x03\x04")
+            self.assertEqual(
+                    fp.bytes_fetched,
+                    26,
+                    "more bytes were fetched than were read")
+            self.assertEqual(
+                    fp.readall(),
+                    ARCHIVE[4:])
+            self.assertEqual(
+                    len(requests),
+                    3,
+                    "readall did not use a single request")
+
+    def test_stream(self):
+        with SourceManager() as sm:
+            resource = WebHandle(
+                    self._source, "ranged/archive.zip").follow(sm)
+            with resource.make_stream() as fp:
+                self.assertTrue(is_ranged(fp))
+                self.assertEqual(
+                        fp.read(512),
+                        ARCHIVE[:512])
+                fp.seek(-512, 2)
+                self.assertEqual(
+                        fp.read(),
+                        ARCHIVE[-512:])
+        self.assertLess(
+                StubRangeHandler.bytes_sent,
+                len(ARCHIVE) // 4,
+                "stream downloaded too much of the file")
+
+    def test_zip(self):
+        for path, ranged in (
+                ("ranged/archive.zip", True),
+                ("plain/archive.zip", False),):
+            with self.subTest(path=path):
+                StubRangeHandler.bytes_sent = 0
+                with SourceManager() as sm:
+                    source = ZipSource(WebHandle(self._source, path))
+                    handles = {
+                            h.relative_path: h for h in source.handles(sm)}
+                    self.assertEqual(len(handles), 9)
+                    with handles["hello.txt"].follow(
+                            sm).make_stream() as fp:
+                        self.assertEqual(fp.read(), b"Hello, world!")
+                if ranged:
+                    self.assertLess(
+                            StubRangeHandler.bytes_sent,
+                            len(ARCHIVE) // 4,
+                            "zip file was downloaded")
+                else:
+                    self.assertEqual(
+                            StubRangeHandler.bytes_sent,
+                            len(ARCHIVE),
+                            "zip file was downloaded more than once")
+
+    def _read_all_members(self, ranged_members):
+        config = engine2_settings.model["zip"]
+        original_ranged_members = config["ranged_members"]
+        StubRangeHandler.requests = 0
+        StubRangeHandler.bytes_sent = 0
+        try:
+            config["ranged_members"] = ranged_members
+            with SourceManager() as sm:
+                source = ZipSource(
+                        WebHandle(self._source, "ranged/archive.zip"))
+                for h in source.handles(sm):
+                    with h.follow(sm).make_stream() as fp:
+                        fp.read()
+        finally:
+            config["ranged_members"] = original_ranged_members
+        return StubRangeHandler.requests, StubRangeHandler.bytes_sent
+
+    def test_zip_all_members(self):
+        ranged_requests, ranged_bytes = self._read_all_members(100)
+        requests, bytes_sent = self._read_all_members(2)
+
+        self.assertGreaterEqual(
+                ranged_requests,
+                18,
+                "reading a member took fewer than two requests")
+        self.assertLess(
+                requests,
+                ranged_requests // 2,
+                "zip file was not copied after the member limit")
+        self.assertLess(
+                bytes_sent,
+                len(ARCHIVE) * 3 // 2,
+                "too much of the zip file was downloaded twice")
@@ -0,0 +1,295 @@
+from types import SimpleNamespace
+from tempfile import TemporaryDirectory
+import os
+import json
+import unittest
+from unittest.mock import patch
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import Handle, Source
+from os2datascanner.engine2.model.smb import SMBHandle, SMBSource
+from os2datascanner.engine2.model.derived.zip import ZipHandle, ZipSource
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.utilities.pika import PikaPipelineRunner
+from os2datascanner.engine2.pipeline.utilities.registry import (
+        ScanSpecRegistry, ScanSpecUnavailable)
+
+
+class _FakeBroker:
+    """Imitates the parts of an AMQP server used by PikaPipelineRunner."""
+
+    def __init__(self):
+        self.queues = {}
+        self.delivery_tags = 0
+
+    def next_tag(self):
+        self.delivery_tags += 1
+        return self.delivery_tags
+
+
+class _FakeChannel:
+    def __init__(self, broker):
+        self._broker = broker
+        self.is_open = True
+        self.acked = []
+        self.nacked = []
+        self.commits = 0
+        self._consumers = []
+        self.deliveries = []
+        # Called when start_consuming runs out of deliveries
+        self.on_idle = None
+
+    def queue_declare(self, queue, passive=False, arguments=None, **kwargs):
+        self._broker.queues.setdefault(queue, [])
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self._broker.queues.setdefault(routing_key, []).append(body)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacked.append((delivery_tag, requeue))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acked.append(delivery_tag)
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        self.commits += 1
+
+    def basic_consume(self, queue, callback):
+        self._consumers.append(callback)
+        return "consumer-{0}".format(len(self._consumers))
+
+    def basic_cancel(self, tag):
+        pass
+
+    def start_consuming(self):
+        while self.deliveries:
+            routing_key, body, redelivered = self.deliveries.pop(0)
+            method = SimpleNamespace(
+                    delivery_tag=self._broker.next_tag(),
+                    routing_key=routing_key, redelivered=redelivered)
+            for callback in self._consumers:
+                callback(self, method, None, body)
+        if self.on_idle:
+            self.on_idle()
+
+    def stop_consuming(self):
+        pass
+
+
+class _FakeConnection:
+    def __init__(self, broker):
+        self._broker = broker
+        self.channels = []
+
+    def channel(self):
+        channel = _FakeChannel(self._broker)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def call_later(self, delay, callback):
+        return object()
+
+    def remove_timeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+
+class _EchoRunner(PikaPipelineRunner):
+    """A PikaPipelineRunner, connected to a _FakeBroker, that reports the scan
+    tag of every message it handles, stopping when it runs out of
+    messages."""
+
+    def __init__(self, broker, deliveries, **kwargs):
+        super().__init__(read=["input"], write=["output"], **kwargs)
+        self._broker = broker
+        self._deliveries = deliveries
+        self.handled = []
+
+    def make_connection(self):
+        return _FakeConnection(self._broker)
+
+    def make_channel(self):
+        channel = super().make_channel()
+        channel.deliveries = self._deliveries
+        channel.on_idle = self.request_stop
+        return channel
+
+    def handle_message(self, message_body, *, channel=None):
+        self.handled.append(message_body["scan_spec"].scan_tag)
+        yield from []
+
+
+def _make_scan_spec(scan_tag="registry_test", path="Documents"):
+    """Returns the JSON representation of a scan specification whose source is
+    a zip file on an SMB share."""
+    share = SMBSource("//server/share", "user", "secret")
+    return messages.ScanSpecMessage(
+            scan_tag=scan_tag,
+            source=ZipSource(SMBHandle(share, path + "/archive.zip")),
+            rule=RegexRule("Hello"),
+            configuration={},
+            progress=None).to_json_object()
+
+
+class Engine2RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = TemporaryDirectory()
+        self.directory = self._directory.name
+        # Runners build their registries from the settings
+        self._settings = patch.dict(
+                engine2_settings.pipeline["scan_spec_registry"],
+                directory=self.directory)
+        self._settings.start()
+
+    def tearDown(self):
+        self._settings.stop()
+        self._directory.cleanup()
+
+    def make_registry(self, **kwargs):
+        return ScanSpecRegistry(directory=self.directory, **kwargs)
+
+    def test_interning(self):
+        registry = self.make_registry()
+        objs = [_make_scan_spec(path="Documents/{0}".format(k))
+                for k in range(10)]
+        interned = [
+                registry.intern_message({
+                    "scan_spec": obj,
+                    "handle": ZipHandle(Source.from_json_object(
+                            obj["source"]), "hello.txt").to_json_object()
+                }) for obj in objs]
+        self.assertEqual(
+                len(os.listdir(self.directory)),
+                2,
+                "scan specs from the same scan were not interned together")
+        for message in interned:
+            self.assertEqual(
+                    set(message["scan_spec"]),
+                    {"source", "progress", "trace_id"},
+                    "interned parts were not removed from the message")
+            self.assertNotIn(
+                    "secret",
+                    json.dumps(message),
+                    "credentials were not removed from the message")
+
+        reader = self.make_registry()
+        for obj, message in zip(objs, interned):
+            resolved = reader.resolve_message(
+                    json.loads(json.dumps(message)))
+            self.assertEqual(
+                    resolved["scan_spec"],
+                    messages.ScanSpecMessage.from_json_object(obj),
+                    "scan spec was not resolved correctly")
+            self.assertEqual(
+                    Handle.from_json_object(resolved["handle"]).source,
+                    resolved["scan_spec"].source,
+                    "handle was not resolved correctly")
+
+        self.assertIsNone(
+                registry.intern(dict(objs[0], configuration={"x": 1})),
+                "different scan spec was interned under the same key")
+
+    def test_changed_credentials(self):
+        obj = _make_scan_spec()
+        message = self.make_registry().intern_message({"scan_spec": obj})
+
+        changed = json.loads(json.dumps(obj).replace("secret", "new secret"))
+        self.assertEqual(
+                self.make_registry().intern_message({"scan_spec": changed}),
+                message,
+                "source key depends on credentials")
+        self.assertEqual(
+                self.make_registry().resolve_message(
+                        json.loads(json.dumps(message)))["scan_spec"],
+                messages.ScanSpecMessage.from_json_object(changed),
+                "new credentials did not replace the old ones")
+
+    def test_refresh_and_expiry(self):
+        obj = _make_scan_spec()
+        registry = self.make_registry(expiry=60)
+        key = registry.intern(obj)
+        path = os.path.join(self.directory, "scan-{0}.json".format(key))
+        os.utime(path, (0, 0))
+
+        now = registry._cache["scan-" + key][2]
+        with patch(
+                "os2datascanner.engine2.pipeline.utilities.registry"
+                ".monotonic", lambda: now + 10):
+            registry.intern(obj)
+        self.assertEqual(
+                os.stat(path).st_mtime,
+                0,
+                "interned scan spec was refreshed too soon")
+        with patch(
+                "os2datascanner.engine2.pipeline.utilities.registry"
+                ".monotonic", lambda: now + 40):
+            registry.intern(obj)
+        self.assertNotEqual(
+                os.stat(path).st_mtime,
+                0,
+                "interned scan spec was not refreshed")
+
+        # Another registry interning something new deletes objects that
+        # haven't been refreshed for the expiry period
+        os.utime(path, (0, 0))
+        self.make_registry(expiry=60).intern(
+                _make_scan_spec(scan_tag="other_scan"))
+        self.assertFalse(
+                os.path.exists(path),
+                "expired scan spec was not deleted")
+        with self.assertRaises(ScanSpecUnavailable):
+            self.make_registry().resolve(key)
+
+    def test_unavailable_scan_spec(self):
+        obj = _make_scan_spec()
+        key = ScanSpecRegistry.make_key(obj["scan_tag"])
+        body = json.dumps({"scan_spec_key": key, "scan_spec": {
+                "source": obj["source"], "progress": None,
+                "trace_id": None}}).encode()
+
+        for batch_size in (1, 4,):
+            with self.subTest(batch_size=batch_size):
+                runner = _EchoRunner(_FakeBroker(), [("input", body, False),
+                        ("input", body, True)], batch_size=batch_size)
+                runner.run_consumer()
+                self.assertEqual(
+                        runner.handled,
+                        [],
+                        "message without a scan spec was handled")
+                self.assertEqual(
+                        runner.channel.acked,
+                        [],
+                        "message without a scan spec was acknowledged")
+                self.assertEqual(
+                        [requeue for _, requeue in runner.channel.nacked],
+                        [True, False],
+                        "message without a scan spec was not requeued once"
+                        " and then rejected")
+                if batch_size > 1:
+                    self.assertEqual(
+                            runner.channel.commits,
+                            2,
+                            "rejections were not committed")
+
+        # Once the scan spec has been stored, the message can be handled
+        self.make_registry().intern(obj)
+        runner = _EchoRunner(_FakeBroker(), [("input", body, True)])
+        runner.run_consumer()
+        self.assertEqual(
+                runner.handled,
+                ["registry_test"])
+        self.assertEqual(
+                len(runner.channel.acked),
+                1)
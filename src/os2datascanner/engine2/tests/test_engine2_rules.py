@@ -233,6 +233,25 @@ more!""",
                         evaluations,
                         "{0}: wrong evaluation count".format(input_string))
 
+    def test_shared_candidates(self):
+        content = """
+2205995008: forbryder,
+230500 0003: forbryder,
+P-nr. 240501-0006: forbryder,
+250501-1987: forbryder"""
+        rules = [
+            CPRRule(modulus_11=False, ignore_irrelevant=False),
+            CPRRule(modulus_11=True, ignore_irrelevant=True),
+            CPRRule(examine_context=False),
+        ]
+        candidates = rules[0].find_candidates(content)
+        for rule in rules:
+            with self.subTest(rule):
+                self.assertEqual(
+                        list(rule.match(content)),
+                        list(rule.match_candidates(content, candidates)),
+                        "shared candidates produced different matches")
+
     def test_json_round_trip(self):
         for rule, _ in RuleTests.compound_candidates:
             with self.subTest(rule):
@@ -0,0 +1,143 @@
+import os.path
+import unittest
+from io import BytesIO
+from datetime import datetime
+from contextlib import contextmanager
+
+from os2datascanner.engine2.model.core import FileResource
+from os2datascanner.engine2.model.file import FilesystemSource, FilesystemHandle
+from os2datascanner.engine2.model.utilities import NamedTemporaryResource
+from os2datascanner.engine2.model.utilities.spool import Spool, spooled
+from os2datascanner.engine2.conversions.types import OutputType
+from os2datascanner.engine2.conversions.utilities.results import SingleResult
+
+
+spool = Spool(max_size=1024)
+downloads = []
+lookups = []
+
+
+def _make_resource_type(streams):
+    @spooled(streams=streams, spool=spool)
+    class RemoteResource(FileResource):
+        """A resource whose content is "downloaded" by the original
+        implementations of make_path and make_stream."""
+
+        content = {}
+
+        def check(self):
+            return True
+
+        def get_size(self):
+            return SingleResult(None, "size", len(self._content))
+
+        def get_last_modified(self):
+            lookups.append(self.handle.relative_path)
+            return SingleResult(None, OutputType.LastModified,
+                    datetime(2020, 1, 1))
+
+        @property
+        def _content(self):
+            return self.content[self.handle.relative_path]
+
+        @contextmanager
+        def make_path(self):
+            with NamedTemporaryResource(self.handle.name) as ntr:
+                with ntr.open("wb") as res:
+                    with self.make_stream() as s:
+                        res.write(s.read())
+                yield ntr.get_path()
+
+        @contextmanager
+        def make_stream(self):
+            downloads.append(self.handle.relative_path)
+            with BytesIO(self._content) as fp:
+                yield fp
+    return RemoteResource
+
+
+class Engine2SpoolTest(unittest.TestCase):
+    def setUp(self):
+        downloads.clear()
+        lookups.clear()
+        spool.close()
+
+    def _make_resource(self, streams, path, content):
+        rt = _make_resource_type(streams)
+        rt.content[path] = content
+        return rt(FilesystemHandle(FilesystemSource("/remote"), path), None)
+
+    def test_reuse(self):
+        for _ in range(3):
+            # Each iteration uses a new Resource, as a new pipeline stage
+            # would
+            r = self._make_resource(True, "a.txt", b"alpha")
+            with r.make_path() as p:
+                self.assertEqual(
+                        os.path.basename(p),
+                        "a.txt",
+                        "spooled file had the wrong name")
+                with open(p, "rb") as fp:
+                    self.assertEqual(fp.read(), b"alpha")
+            with r.make_stream() as fp:
+                self.assertEqual(fp.read(), b"alpha")
+        self.assertEqual(
+                downloads,
+                ["a.txt"],
+                "content was downloaded more than once")
+
+    def test_no_fill_from_streams(self):
+        r = self._make_resource(False, "b.txt", b"beta")
+        with r.make_stream() as fp:
+            self.assertEqual(fp.read(), b"beta")
+        with r.make_path():
+            pass
+        with r.make_stream() as fp:
+            self.assertEqual(fp.read(), b"beta")
+        self.assertEqual(
+                downloads,
+                ["b.txt", "b.txt"],
+                "stream should not have filled the spool")
+
+    def test_no_lookups_for_streams(self):
+        r = self._make_resource(False, "g.txt", b"gamma")
+        with r.make_stream() as fp:
+            self.assertEqual(fp.read(), b"gamma")
+        self.assertEqual(
+                lookups,
+                [],
+                "last modification date was computed for an unspooled"
+                " stream")
+        with r.make_path():
+            pass
+        with r.make_stream() as fp:
+            self.assertEqual(fp.read(), b"gamma")
+        self.assertEqual(
+                downloads,
+                ["g.txt", "g.txt"],
+                "spooled copy was not used for a stream")
+
+    def test_eviction(self):
+        for name in ("c.bin", "d.bin", "e.bin"):
+            r = self._make_resource(True, name, b"x" * 400)
+            with r.make_path():
+                pass
+        # c.bin should have been evicted to make room for e.bin
+        for name in ("e.bin", "d.bin", "c.bin"):
+            r = self._make_resource(True, name, b"x" * 400)
+            with r.make_path():
+                pass
+        self.assertEqual(
+                downloads,
+                ["c.bin", "d.bin", "e.bin", "c.bin"],
+                "least recently used object was not evicted")
+
+    def test_oversized(self):
+        for _ in range(2):
+            r = self._make_resource(True, "f.bin", b"x" * 2048)
+            with r.make_path() as p:
+                self.assertEqual(os.path.getsize(p), 2048)
+            self.assertFalse(
+                    os.path.exists(p),
+                    "oversized object was kept")
+        self.assertEqual(downloads, ["f.bin", "f.bin"])
@@ -0,0 +1,96 @@
+import os.path
+import unittest
+from glob import glob
+from zipfile import ZipFile
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.file import FilesystemSource, FilesystemHandle
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.worker import Scheduler
+from os2datascanner.engine2.pipeline.utilities import tracing
+
+
+rule = RegexRule("Hello")
+
+
+class Engine2TracingTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = TemporaryDirectory()
+        self._data = os.path.join(self._tmpdir.name, "data")
+        self._spans = os.path.join(self._tmpdir.name, "spans")
+        os.mkdir(self._data)
+        with ZipFile(os.path.join(self._data, "outer.zip"), "w") as zp:
+            zp.writestr("a.txt", "Hello from a")
+            zp.writestr("b.txt", "Goodbye from b")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _scan(self, fmt):
+        with patch.dict(engine2_settings.pipeline["tracing"],
+                path=self._spans, format=fmt):
+            trace_id = tracing.new_trace_id()
+            source = FilesystemSource(self._data)
+            body = messages.ConversionMessage(
+                    messages.ScanSpecMessage(
+                            scan_tag="tracing_test", source=source,
+                            rule=rule, configuration={}, progress=None),
+                    FilesystemHandle(source, "outer.zip"),
+                    messages.ProgressFragment(rule=rule, matches=[]),
+                    trace_id=trace_id).to_json_object()
+            with SourceManager() as sm:
+                results = [messages.MatchesMessage.from_json_object(message)
+                        for channel, message in Scheduler(sm).run(body)
+                        if channel == "ma"]
+        spans = [s for path in glob(os.path.join(self._spans, "*.jsonl"))
+                for s in tracing.read_spans(path)]
+        return trace_id, results, spans
+
+    def test_propagation(self):
+        trace_id, results, spans = self._scan("jsonl")
+        self.assertEqual(len(results), 2)
+        self.assertTrue(
+                all(r.trace_id and r.trace_id != trace_id for r in results),
+                "objects in the archive did not get traces of their own")
+
+        kinds = {(s["stage"], s["name"]) for s in spans}
+        for kind in (("processor", "check"), ("processor", "follow"),
+                ("processor", "convert"), ("matcher", "match"),
+                ("explorer", "explore"), ("explorer", "found"),):
+            self.assertIn(kind, kinds)
+
+        objects, stages = tracing.summarise(spans, "tracing_test")
+        by_name = {o["object"].split()[0]: o for o in objects if o["object"]}
+        for name in ("a.txt", "b.txt",):
+            self.assertIn(name, by_name)
+            self.assertEqual(
+                    by_name[name]["parent"],
+                    trace_id,
+                    "derived object was not linked to its container")
+        self.assertEqual(
+                objects[0]["trace_id"],
+                trace_id,
+                "container did not include the time of its contents")
+        self.assertEqual(
+                tracing.summarise(spans, "another_scan"),
+                ([], []))
+
+    def test_otlp(self):
+        trace_id, _, spans = self._scan("otlp")
+        with open(glob(os.path.join(self._spans, "*.jsonl"))[0]) as fp:
+            self.assertIn("resourceSpans", fp.readline())
+        self.assertIn(trace_id, {s["trace_id"] for s in spans})
+        self.assertIn(
+                ("explorer", "found", "tracing_test"),
+                {(s["stage"], s["name"], s["attributes"].get("scan_tag"))
+                        for s in spans})
+
+    def test_disabled(self):
+        self.assertIsNone(tracing.new_trace_id())
+        with tracing.span(None, "processor", "convert"):
+            pass
+        self.assertFalse(os.path.exists(self._spans))
@@ -0,0 +1,146 @@
+import random
+import unittest
+
+from os2datascanner.engine2.model.utilities.walk import (
+        walk, walk_directories, SpillQueue)
+
+
+def _make_tree(seed, depth=4):
+    """Returns a randomly-generated directory hierarchy, as a dictionary
+    mapping names to subdirectories (dictionaries) or files (None)."""
+    random.seed(seed)
+
+    def _make_directory(level):
+        directory = {}
+        for i in range(random.randrange(0, 8)):
+            if level < depth and random.random() < 0.4:
+                directory["dir{0}".format(i)] = _make_directory(level + 1)
+            else:
+                directory["file{0}".format(i)] = None
+        return directory
+    return _make_directory(0)
+
+
+def _make_lister(tree):
+    def list_directory(path):
+        directory = tree
+        for name in path.split("/") if path else []:
+            directory = directory[name]
+        return [(name, value is not None)
+                for name, value in directory.items()]
+    return list_directory
+
+
+def _serial_directories(directory, path=""):
+    yield path
+    for name, value in directory.items():
+        if value is not None:
+            yield from _serial_directories(
+                    value, path + "/" + name if path else name)
+
+
+def _serial_walk(directory, path=""):
+    for name, value in directory.items():
+        here = path + "/" + name if path else name
+        if value is not None:
+            yield from _serial_walk(value, here)
+        else:
+            yield here
+
+
+class Engine2WalkTest(unittest.TestCase):
+    def test_depth_first(self):
+        for seed in range(10):
+            tree = _make_tree(seed)
+            for workers, max_pending in ((1, 10000), (4, 10000), (4, 2)):
+                with self.subTest(
+                        seed=seed, workers=workers, max_pending=max_pending):
+                    self.assertEqual(
+                            list(walk(_make_lister(tree),
+                                    workers=workers, max_pending=max_pending)),
+                            list(_serial_walk(tree)),
+                            "concurrent walk differs from serial walk")
+
+    def test_breadth_first(self):
+        for seed in range(10):
+            tree = _make_tree(seed)
+            for workers, max_pending in ((1, 10000), (4, 10000), (4, 2)):
+                with self.subTest(
+                        seed=seed, workers=workers, max_pending=max_pending):
+                    result = list(walk(_make_lister(tree),
+                            order="breadth-first",
+                            workers=workers, max_pending=max_pending))
+                    self.assertEqual(
+                            sorted(result),
+                            sorted(_serial_walk(tree)),
+                            "breadth-first walk found different files")
+                    depths = [path.count("/") for path in result]
+                    self.assertEqual(
+                            depths,
+                            sorted(depths),
+                            "breadth-first walk went too deep too soon")
+
+    def test_walk_directories(self):
+        for seed in range(10):
+            tree = _make_tree(seed)
+            for order in ("depth-first", "breadth-first",):
+                with self.subTest(seed=seed, order=order):
+                    result = list(walk_directories(_make_lister(tree),
+                            order=order, workers=4))
+                    paths = [path for path, _ in result]
+                    if order == "depth-first":
+                        self.assertEqual(
+                                paths,
+                                list(_serial_directories(tree)),
+                                "depth-first walk found different"
+                                " directories")
+                    else:
+                        self.assertEqual(
+                                sorted(paths),
+                                sorted(_serial_directories(tree)),
+                                "breadth-first walk found different"
+                                " directories")
+                    for path, entries in result:
+                        self.assertEqual(
+                                entries,
+                                _make_lister(tree)(path),
+                                "directory was given the wrong listing")
+
+    def test_unreadable_directories(self):
+        tree = {"a": {"b": {"c": None}}, "d": None}
+        lister = _make_lister(tree)
+
+        def list_directory(path):
+            return None if path == "a" else lister(path)
+        for order in ("depth-first", "breadth-first",):
+            with self.subTest(order=order):
+                self.assertEqual(
+                        list(walk_directories(list_directory, order=order)),
+                        [("", [("a", True), ("d", False)]), ("a", None)])
+                self.assertEqual(
+                        list(walk(list_directory, order=order)),
+                        ["d"])
+
+    def test_spill_queue(self):
+        queue = SpillQueue(3)
+        expected = []
+        for i in range(20):
+            queue.append("item{0}".format(i))
+            expected.append("item{0}".format(i))
+            if i % 3 == 0:
+                self.assertEqual(
+                        queue.popleft(),
+                        expected.pop(0),
+                        "spill queue isn't first-in, first-out")
+        self.assertEqual(
+                len(queue),
+                len(expected),
+                "spill queue lost items")
+        result = []
+        while queue:
+            result.append(queue.popleft())
+        queue.close()
+        self.assertEqual(
+                result,
+                expected,
+                "spill queue isn't first-in, first-out")
@@ -0,0 +1,124 @@
+import os.path
+import unittest
+from unittest import mock
+from zipfile import ZipFile
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2 import settings as engine2_settings
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.file import FilesystemSource, FilesystemHandle
+from os2datascanner.engine2.rules.regex import RegexRule
+from os2datascanner.engine2.pipeline import messages
+from os2datascanner.engine2.pipeline.worker import (Scheduler,
+        message_received_raw)
+
+
+rule = RegexRule("Hello")
+
+
+class Engine2WorkerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = TemporaryDirectory()
+        path = self._tmpdir.name
+        with ZipFile(os.path.join(path, "inner.zip"), "w") as zp:
+            zp.writestr("c.txt", "Hello from c")
+        with ZipFile(os.path.join(path, "outer.zip"), "w") as zp:
+            zp.writestr("a.txt", "Hello from a")
+            zp.write(os.path.join(path, "inner.zip"), "inner.zip")
+            zp.writestr("b.txt", "Goodbye from b" + " " * 1000)
+
+        source = FilesystemSource(path)
+        self._body = messages.ConversionMessage(
+                messages.ScanSpecMessage(
+                        scan_tag="worker_test", source=source, rule=rule,
+                        configuration={}, progress=None),
+                FilesystemHandle(source, "outer.zip"),
+                messages.ProgressFragment(
+                        rule=rule, matches=[])).to_json_object()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _run(self, **kwargs):
+        results = []
+        with SourceManager() as sm:
+            for channel, message in Scheduler(sm, **kwargs).run(self._body):
+                if channel == "ma":
+                    message = messages.MatchesMessage.from_json_object(
+                            message)
+                    results.append((channel,
+                            message.handle.relative_path, message.matched))
+                elif channel == "co":
+                    message = messages.ConversionMessage.from_json_object(
+                            message)
+                    results.append((channel, message.handle.relative_path))
+        return results
+
+    def test_depth_first(self):
+        self.assertEqual(
+                self._run(order="depth-first"),
+                [
+                    ("ma", "a.txt", True),
+                    ("ma", "c.txt", True),
+                    ("ma", "b.txt", False),
+                ],
+                "objects were not handled depth-first")
+
+    def test_breadth_first(self):
+        self.assertEqual(
+                self._run(order="breadth-first"),
+                [
+                    ("ma", "a.txt", True),
+                    ("ma", "b.txt", False),
+                    ("ma", "c.txt", True),
+                ],
+                "objects were not handled breadth-first")
+
+    def test_smallest_first(self):
+        self.assertEqual(
+                [path for _, path, _ in self._run(order="smallest-first")],
+                ["a.txt", "c.txt", "b.txt"],
+                "objects were not handled smallest-first")
+
+    def test_object_budget(self):
+        self.assertEqual(
+                self._run(order="depth-first", max_objects=1),
+                [
+                    ("ma", "a.txt", True),
+                    ("co", "inner.zip"),
+                    ("co", "b.txt"),
+                ],
+                "objects outside the budget were not spilled")
+
+    def test_queue_limit(self):
+        self.assertEqual(
+                self._run(order="depth-first", max_queued=1),
+                [
+                    ("co", "inner.zip"),
+                    ("co", "b.txt"),
+                    ("ma", "a.txt", True),
+                ],
+                "objects beyond the queue limit were not spilled")
+
+    def test_spilled_status(self):
+        pending = [self._body]
+        statuses = []
+        with SourceManager() as sm, mock.patch.dict(
+                engine2_settings.pipeline["worker"], max_objects=1):
+            while pending:
+                for queue, message in message_received_raw(
+                        pending.pop(0), "os2ds_conversions", sm,
+                        ["os2ds_matches"], "os2ds_metadata",
+                        ["os2ds_problems"], "os2ds_status",
+                        "os2ds_conversions"):
+                    if queue == "os2ds_conversions":
+                        self.assertTrue(
+                                message["spilled"],
+                                "spilled object was not marked")
+                        pending.append(message)
+                    elif queue == "os2ds_status":
+                        statuses.append(message)
+        self.assertEqual(
+                len(statuses),
+                1,
+                "spilled objects were counted as scanned objects")
@@ -1,7 +1,7 @@
 import random
 import unittest
 from os2datascanner.engine2.rules.utilities.cpr_probability import (
-        CprProbabilityCalculator)
+        CprProbabilityCalculator, cpr_check_batch)
 
 
 def _cpr(time_from=None):
@@ -131,3 +131,16 @@ class TestCprTest(unittest.TestCase):
             self.assertTrue(0.05 < value < 0.25)
         self.assertTrue(0.999 < sum(distribution.values()) < 1.0001)
 
+    def test_batch_agreement(self):
+        cprs = ([_cpr() for _ in range(50)]
+                + [str(random.randrange(0, 9999999999)).zfill(10)
+                   for _ in range(250)]
+                + ['0101900000', '0101600000', '2902000000', '2902190000'])
+        probabilities = cpr_check_batch(cprs)
+        for cpr, probability in zip(cprs, probabilities):
+            with self.subTest(cpr):
+                check = self.cpr_calc.cpr_check(cpr)
+                self.assertEqual(
+                        probability,
+                        0.0 if isinstance(check, str) else check,
+                        "batch check disagrees with cpr_check")
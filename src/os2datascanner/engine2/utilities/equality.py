@@ -5,22 +5,87 @@ class TypePropertyEquality:
     The relevant properties for this purpose are, in order of preference:
     - those enumerated by the 'eq_properties' field;
     - the keys of the dictionary returned by its __getstate__ function; or
-    - the keys of its __dict__ field."""
+    - the names of its slots and the keys of its __dict__ field."""
+    __slots__ = ()
+
+    # The names of slots that should never be considered to be properties
+    _ignored_slots = frozenset({"__dict__", "__weakref__", "_cached_hash"})
+
+    __state_properties = {}
+
+    @classmethod
+    def __get_state_properties(cls, klass):
+        """Returns the names of the properties of @klass that should be
+        compared, or None if its __getstate__ function should be used
+        instead. (Properties held in an instance's __dict__ field are not
+        included in the result.)"""
+        try:
+            return cls.__state_properties[klass]
+        except KeyError:
+            if hasattr(klass, 'eq_properties'):
+                names = tuple(klass.eq_properties)
+            elif any("__getstate__" in k.__dict__
+                    for k in klass.__mro__ if k is not object):
+                # (Only a __getstate__ function that a class has defined for
+                # itself counts here; newer versions of Python give every
+                # object a default implementation)
+                names = None
+            else:
+                names = []
+                for k in reversed(klass.__mro__):
+                    slots = k.__dict__.get("__slots__", ())
+                    if isinstance(slots, str):
+                        slots = (slots,)
+                    names.extend(
+                            s for s in slots if s not in cls._ignored_slots)
+                names = tuple(names)
+            cls.__state_properties[klass] = names
+            return names
+
     @staticmethod
-    def __get_state(obj):
-        if hasattr(obj, 'eq_properties'):
-            return {k: getattr(obj, k) for k in getattr(obj, 'eq_properties')}
-        elif hasattr(obj, '__getstate__'):
+    def _get_state(obj):
+        names = TypePropertyEquality.__get_state_properties(type(obj))
+        if names is None:
             return obj.__getstate__()
-        else:
+        elif hasattr(obj, 'eq_properties'):
+            return {k: getattr(obj, k) for k in names}
+        elif not names:
             return obj.__dict__
+        else:
+            state = {k: getattr(obj, k) for k in names if hasattr(obj, k)}
+            state.update(getattr(obj, "__dict__", {}))
+            return state
 
     def __eq__(self, other):
         return (type(self) == type(other) and
-                self.__get_state(self) == self.__get_state(other))
+                self._get_state(self) == self._get_state(other))
 
     def __hash__(self):
         h = 42 + hash(type(self))
-        for k, v in self.__get_state(self).items():
+        for k, v in self._get_state(self).items():
             h += hash(k) + (hash(v) * 3)
         return h
+
+
+class ImmutableTypePropertyEquality(TypePropertyEquality):
+    """Classes inheriting from the ImmutableTypePropertyEquality mixin behave
+    like those inheriting from TypePropertyEquality, but promise never to
+    change their relevant properties after construction. This allows their
+    hash values to be computed only once, and allows objects with different
+    hash values to be compared without examining their properties."""
+    __slots__ = ("_cached_hash",)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif type(self) is not type(other) or hash(self) != hash(other):
+            return False
+        else:
+            return self._get_state(self) == self._get_state(other)
+
+    def __hash__(self):
+        try:
+            return self._cached_hash
+        except AttributeError:
+            self._cached_hash = super().__hash__()
+            return self._cached_hash
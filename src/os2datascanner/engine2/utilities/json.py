@@ -6,6 +6,7 @@ from ..model.core.errors import UnknownSchemeError, DeserialisationError
 class JSONSerialisable(ABC):
     """Classes that extend the abstract base class JSONSerialisable can convert
     themselves to and from JSON-serialisable objects."""
+    __slots__ = ()
 
     @property
     @classmethod
@@ -0,0 +1,25 @@
+from time import perf_counter
+
+
+SECONDS_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float("inf"),)
+"""Prometheus histogram buckets suitable for the durations of operations
+that can take anything from a few milliseconds to a few minutes."""
+
+
+BYTES_BUCKETS = tuple(1024 * 4 ** k for k in range(11)) + (float("inf"),)
+"""Prometheus histogram buckets suitable for sizes from a kibibyte up to a
+few gibibytes."""
+
+
+def observe_iteration(iterable, observe):
+    """Yields everything yielded by @iterable, and then calls @observe with
+    the time (in seconds) that it took to do so. This makes it possible to
+    measure the work done by a generator, rather than just the time it took
+    to create it."""
+    start = perf_counter()
+    try:
+        yield from iterable
+    finally:
+        observe(perf_counter() - start)
@@ -0,0 +1,24 @@
+from time import perf_counter
+import os.path
+import subprocess
+
+from prometheus_client import Histogram
+
+from .metrics import SECONDS_BUCKETS
+
+
+tool_seconds = Histogram(
+        "os2datascanner_tool_seconds",
+        "Time spent waiting for external tools to run",
+        ["tool"], buckets=SECONDS_BUCKETS)
+
+
+def run_tool(args, **kwargs):
+    """As subprocess.run, but records how long the external tool took to run
+    (whether or not it succeeded)."""
+    start = perf_counter()
+    try:
+        return subprocess.run(args, **kwargs)
+    finally:
+        tool_seconds.labels(os.path.basename(args[0])).observe(
+                perf_counter() - start)
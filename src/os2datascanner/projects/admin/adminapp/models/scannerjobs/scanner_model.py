@@ -250,10 +250,14 @@ class Scanner(models.Model):
         configuration = {}
 
         prerules = []
+        # Unless we're checking modification dates, the explorer should
+        # ignore what it saw the last time this scanner ran
+        configuration["exploration"] = "full"
         if self.do_last_modified_check:
             last = self.e2_last_run_at
             if last:
                 prerules.append(LastModifiedRule(last))
+                configuration["exploration"] = "incremental"
 
         if self.do_ocr:
             # If we are doing OCR, then filter out any images smaller than
@@ -173,6 +173,11 @@ def handle_problem_message(previous_report, new_report, body):
         previous_report.resolution_status = (
                 DocumentReport.ResolutionChoices.REMOVED.value)
         previous_report.save()
+    elif problem.missing and not previous_report:
+        # The object has been removed, but we never had anything to say about
+        # it in the first place
+        print(problem.handle.presentation if problem.handle else "(source)",
+                "Problem, deleted, no previous report; ignoring")
     else:
         print(problem.handle.presentation if problem.handle else "(source)",
                 "Problem, transient, creating")